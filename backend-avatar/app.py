@@ -1,41 +1,332 @@
+import atexit
+import logging
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 import requests
-from flask import Flask, request, jsonify
+from requests.adapters import HTTPAdapter
+from flask import Flask, Response, g, has_request_context, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
 
+import metrics
+
 load_dotenv()
 app = Flask(__name__)
 CORS(app, supports_credentials=True)
+logger = logging.getLogger("avatar_backend")
 
 API_KEY = os.getenv("HEYGEN_API_KEY")
-BASE_URL = "https://api.heygen.com/v1/streaming"
+# Point at a local mock (see mock_streaming_api.py) for testing
+BASE_URL = os.getenv("HEYGEN_BASE_URL", "https://api.heygen.com/v1/streaming")
+
+# Upstream connection pool and limits
+HTTP_POOL_SIZE = int(os.getenv("HEYGEN_POOL_SIZE", "16"))
+# Each call in flight holds a pooled connection, so at most the pool size:
+# beyond it callers would block inside the pool, where QUEUE_TIMEOUT can't see them
+MAX_IN_FLIGHT = min(int(os.getenv("HEYGEN_MAX_IN_FLIGHT", str(HTTP_POOL_SIZE))), HTTP_POOL_SIZE)
+CONNECT_TIMEOUT = float(os.getenv("HEYGEN_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("HEYGEN_READ_TIMEOUT", "30"))
+# How long a request may wait for a free upstream slot before failing with 503
+QUEUE_TIMEOUT = float(os.getenv("HEYGEN_QUEUE_TIMEOUT", "10"))
+
+# ICE batching: candidates for one session arriving within the window are
+# forwarded together, up to ICE_FORWARD_WORKERS at a time
+ICE_COALESCE_WINDOW = float(os.getenv("ICE_COALESCE_WINDOW_MS", "20")) / 1000
+ICE_FORWARD_WORKERS = int(os.getenv("ICE_FORWARD_WORKERS", "8"))
+ICE_MAX_BATCH = int(os.getenv("ICE_MAX_BATCH", "64"))
+
+# Pre-created sessions kept ready for /create_session (0 disables the pool).
+# Idle sessions are stopped and replaced before the upstream times them out.
+AVATAR_POOL_SIZE = int(os.getenv("AVATAR_POOL_SIZE", "0"))
+AVATAR_POOL_MAX_IDLE = float(os.getenv("AVATAR_POOL_MAX_IDLE_SECONDS", "60"))
+AVATAR_POOL_RETRY_SECONDS = float(os.getenv("AVATAR_POOL_RETRY_SECONDS", "5"))
+
+SESSION_SETTINGS = {"quality": "high"}
 
 if not API_KEY:
     print("WARNING: HEYGEN_API_KEY not found in environment variables!")
 else:
     print(f"API Key loaded: {API_KEY[:10]}...")
 
+
+# ---------------- Upstream HTTP client ----------------
+class UpstreamBusy(Exception):
+    """Raised when no upstream slot frees up within QUEUE_TIMEOUT."""
+
+
+def _make_http_session():
+    # One keep-alive pool shared by every route, so bursts of ICE candidates
+    # reuse warm TLS connections instead of opening one per request
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Content-Type": "application/json"})
+    return session
+
+
+http = _make_http_session()
+_upstream_slots = threading.BoundedSemaphore(MAX_IN_FLIGHT)
+
+
+def _post(action, payload):
+    """POST `payload` to the streaming API endpoint `BASE_URL + action`."""
+    start = time.perf_counter()
+    if not _upstream_slots.acquire(timeout=QUEUE_TIMEOUT):
+        raise UpstreamBusy(f"Upstream busy: {MAX_IN_FLIGHT} requests already in flight")
+    queued = time.perf_counter()
+    try:
+        return http.post(
+            f"{BASE_URL}{action}",
+            headers={"x-api-key": API_KEY},
+            json=payload,
+            timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+        )
+    finally:
+        _upstream_slots.release()
+        _record_timing(action.lstrip("."), time.perf_counter() - queued, queued - start)
+
+
+# ---------------- Timing ----------------
+def _record_timing(action, seconds, wait=0.0):
+    """Record a HeyGen call in /metrics and the current request's Server-Timing."""
+    metrics.UPSTREAM_SECONDS.observe(seconds, action=action)
+    metrics.UPSTREAM_QUEUE_SECONDS.observe(wait, action=action)
+    logger.debug("HeyGen %s took %.1fms (queued %.1fms)", action, seconds * 1000, wait * 1000)
+    if has_request_context():
+        stage = f"heygen_{action}"
+        timings = g.setdefault("timings", {})
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@app.before_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def _server_timing(response):
+    parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in g.get("timings", {}).items()]
+    if "request_start" in g:
+        total = time.perf_counter() - g.request_start
+        parts.append(f"total;dur={total * 1000:.1f}")
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.REQUEST_SECONDS.observe(total, endpoint=endpoint, status=response.status_code)
+    if parts:
+        response.headers["Server-Timing"] = ", ".join(parts)
+    return response
+
+
+def _error_status(e):
+    """HTTP status for an exception raised while proxying a request."""
+    if isinstance(e, UpstreamBusy):
+        return 503
+    if isinstance(e, requests.Timeout):
+        return 504
+    if isinstance(e, requests.ConnectionError):
+        return 502
+    return 500
+
+
+# ---------------- ICE candidate batching ----------------
+class IceBatcher:
+    """Coalesces ICE candidates per session and forwards them concurrently.
+
+    The first request for a session opens a short window; candidates from any
+    request for the same session that arrive during it join the batch. Each
+    caller gets one Future per candidate it submitted.
+    """
+
+    def __init__(self, window, workers):
+        self.window = window
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ice")
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def submit(self, session_id, candidates):
+        futures = [Future() for _ in candidates]
+        with self._lock:
+            batch = self._pending.get(session_id)
+            leader = batch is None
+            if leader:
+                batch = self._pending[session_id] = []
+            batch.extend(zip(candidates, futures))
+        if leader:
+            time.sleep(self.window)
+            with self._lock:
+                batch = self._pending.pop(session_id)
+            for candidate, future in batch:
+                self.executor.submit(self._forward, session_id, candidate, future)
+        return futures
+
+    @staticmethod
+    def _forward(session_id, candidate, future):
+        try:
+            response = _post(".ice", {"session_id": session_id, "candidate": candidate})
+            result = {"ok": response.status_code == 200, "status_code": response.status_code}
+            if response.status_code != 200:
+                result["error"] = response.text
+        except Exception as e:
+            result = {"ok": False, "status_code": _error_status(e), "error": str(e)}
+        future.set_result(result)
+
+
+ice_batcher = IceBatcher(ICE_COALESCE_WINDOW, ICE_FORWARD_WORKERS)
+
+
+# ---------------- Pre-warmed session pool ----------------
+class AvatarSessionPool:
+    """Keeps up to `size` freshly created (not yet started) sessions on hand.
+
+    A background thread tops the pool up, and stops sessions that have sat idle
+    for `max_idle` seconds so they never reach the client after the upstream
+    has expired them. Each process (e.g. each gunicorn worker) has its own pool.
+
+    Args:
+        size: Number of idle sessions to keep.
+        max_idle: Seconds a session may wait in the pool.
+        create: () -> session data dict; raises on failure.
+        stop: (session_id) -> None.
+    """
+
+    def __init__(self, size, max_idle, create, stop, retry_seconds=AVATAR_POOL_RETRY_SECONDS):
+        self.size = size
+        self.max_idle = max_idle
+        self.retry_seconds = retry_seconds
+        self._create = create
+        self._stop = stop
+        self._idle = deque()  # (created_at, data), oldest first
+        self._expired = []  # taken out by acquire(), for the refill thread to stop
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._thread = None
+        self.hits = 0
+        self.misses = 0
+
+    def start(self):
+        if self.size <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="avatar-pool", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def acquire(self):
+        """Take the oldest still-fresh session, or None if the pool has none."""
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                created_at, data = self._idle.popleft()
+                if now - created_at < self.max_idle:
+                    self.hits += 1
+                    break
+                # Expired: skip it; the refill thread stops it off the request path
+                self._expired.append(data)
+            else:
+                data = None
+                self.misses += 1
+        self._wake.set()
+        return data
+
+    def stats(self):
+        with self._lock:
+            return {"size": self.size, "idle": len(self._idle), "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        """Stop the refill thread and every idle session."""
+        self._closed.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=READ_TIMEOUT)
+        with self._lock:
+            idle, self._idle = [data for _, data in self._idle], deque()
+            idle += self._expired
+            self._expired = []
+        for data in idle:
+            self._safe_stop(data)
+
+    def _safe_stop(self, data):
+        try:
+            self._stop(data.get("session_id"))
+        except Exception as e:
+            print(f"Failed to stop pooled session {data.get('session_id')}: {e}")
+
+    def _evict_expired(self):
+        cutoff = time.monotonic() - self.max_idle
+        with self._lock:
+            expired, self._expired = self._expired, []
+            while self._idle and self._idle[0][0] <= cutoff:
+                expired.append(self._idle.popleft()[1])
+        for data in expired:
+            self._safe_stop(data)
+
+    def _run(self):
+        while not self._closed.is_set():
+            self._wake.clear()
+            self._evict_expired()
+            while not self._closed.is_set():
+                with self._lock:
+                    if len(self._idle) >= self.size:
+                        break
+                try:
+                    data = self._create()
+                except Exception as e:
+                    print(f"Failed to pre-create avatar session: {e}")
+                    self._closed.wait(self.retry_seconds)
+                    break
+                with self._lock:
+                    self._idle.append((time.monotonic(), data))
+            # Sleep until the oldest session expires or a client takes one
+            with self._lock:
+                timeout = self._idle[0][0] + self.max_idle - time.monotonic() if self._idle else self.max_idle
+            self._wake.wait(max(timeout, 0.05))
+
+
+def _create_upstream_session():
+    response = _post(".new", SESSION_SETTINGS)
+    response.raise_for_status()
+    return response.json().get("data", {})
+
+
+def _stop_upstream_session(session_id):
+    _post(".stop", {"session_id": session_id})
+
+
+def _session_fields(data):
+    return {
+        "session_id": data.get("session_id"),
+        "sdp": data.get("sdp"),
+        "access_token": data.get("access_token"),
+        "ice_servers": data.get("ice_servers"),
+        "ice_servers2": data.get("ice_servers2"),
+        "url": data.get("url")
+    }
+
+
+avatar_pool = AvatarSessionPool(AVATAR_POOL_SIZE, AVATAR_POOL_MAX_IDLE, _create_upstream_session, _stop_upstream_session)
+
+
 @app.route("/create_session", methods=["POST"])
 def create_session():
     try:
         if not API_KEY:
             return jsonify({"error": "HEYGEN_API_KEY not set in environment variables"}), 500
         
-        url = f"{BASE_URL}.new"
-        headers = {
-            "x-api-key": API_KEY,
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "quality": "high"
-        }
+        pooled = avatar_pool.acquire()
+        if pooled:
+            print(f"Using pre-warmed session: {pooled.get('session_id')}")
+            return jsonify(_session_fields(pooled))
+
+        action = ".new"
+        payload = SESSION_SETTINGS
         
-        print(f"Sending request to: {url}")
+        print(f"Sending request to: {BASE_URL}{action}")
         print(f"Payload: {payload}")
         
-        response = requests.post(url, headers=headers, json=payload)
+        response = _post(action, payload)
         
         print(f"Response status: {response.status_code}")
         print(f"Response body: {response.text}")
@@ -43,14 +334,7 @@ def create_session():
         if response.status_code == 200:
             response_data = response.json()
             data = response_data.get("data", {})
-            return jsonify({
-                "session_id": data.get("session_id"),
-                "sdp": data.get("sdp"),
-                "access_token": data.get("access_token"),
-                "ice_servers": data.get("ice_servers"),
-                "ice_servers2": data.get("ice_servers2"),
-                "url": data.get("url")
-            })
+            return jsonify(_session_fields(data))
         else:
             return jsonify({
                 "error": "Failed to create session",
@@ -62,7 +346,7 @@ def create_session():
         print(f"Exception in create_session: {str(e)}")
         import traceback
         traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        return jsonify({"error": str(e)}), _error_status(e)
 
 @app.route("/start_session", methods=["POST"])
 def start_session():
@@ -74,12 +358,7 @@ def start_session():
         if not session_id or not sdp_answer:
             return jsonify({"error": "session_id and sdp are required"}), 400
 
-        url = f"{BASE_URL}.start"
-        headers = {
-            "x-api-key": API_KEY,
-            "Content-Type": "application/json"
-        }
-        
+        action = ".start"
         payload = {
             "session_id": session_id,
             "sdp": {
@@ -88,10 +367,10 @@ def start_session():
             }
         }
         
-        print(f"Sending answer to: {url}")
+        print(f"Sending answer to: {BASE_URL}{action}")
         print(f"Session ID: {session_id}")
 
-        response = requests.post(url, headers=headers, json=payload)
+        response = _post(action, payload)
         
         print(f"Start session response status: {response.status_code}")
         print(f"Start session response: {response.text}")
@@ -109,7 +388,7 @@ def start_session():
         print(f"Exception in start_session: {str(e)}")
         import traceback
         traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        return jsonify({"error": str(e)}), _error_status(e)
 
 @app.route("/ice_candidate", methods=["POST"])
 def ice_candidate():
@@ -121,18 +400,13 @@ def ice_candidate():
         if not session_id or not candidate:
             return jsonify({"error": "session_id and candidate are required"}), 400
 
-        url = f"{BASE_URL}.ice"
-        headers = {
-            "x-api-key": API_KEY,
-            "Content-Type": "application/json"
-        }
-        
+        action = ".ice"
         payload = {
             "session_id": session_id,
             "candidate": candidate
         }
 
-        response = requests.post(url, headers=headers, json=payload)
+        response = _post(action, payload)
         
         if response.status_code == 200:
             return jsonify(response.json())
@@ -144,7 +418,34 @@ def ice_candidate():
             }), response.status_code
             
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return jsonify({"error": str(e)}), _error_status(e)
+
+@app.route("/ice_candidates", methods=["POST"])
+def ice_candidates():
+    """Forward a batch of ICE candidates; returns one result per candidate, in order."""
+    try:
+        data = request.get_json(force=True) or {}
+        session_id = data.get("session_id")
+        candidates = data.get("candidates")
+
+        if not session_id or not isinstance(candidates, list) or not candidates:
+            return jsonify({"error": "session_id and a non-empty candidates list are required"}), 400
+        if len(candidates) > ICE_MAX_BATCH:
+            return jsonify({"error": f"At most {ICE_MAX_BATCH} candidates per request"}), 400
+
+        futures = ice_batcher.submit(session_id, candidates)
+        # One deadline for the whole batch; candidates still pending are reported as failed
+        deadline = QUEUE_TIMEOUT + CONNECT_TIMEOUT + READ_TIMEOUT
+        wait(futures, timeout=deadline)
+        timed_out = {"ok": False, "status_code": 504, "error": f"No reply from upstream within {deadline:g}s"}
+        results = [future.result() if future.done() else timed_out for future in futures]
+        failed = sum(not result["ok"] for result in results)
+
+        return jsonify({"session_id": session_id, "results": results, "failed": failed})
+
+    except Exception as e:
+        print(f"Exception in ice_candidates: {str(e)}")
+        return jsonify({"error": str(e)}), _error_status(e)
 
 @app.route("/send_task", methods=["POST"])
 def send_task():
@@ -157,22 +458,17 @@ def send_task():
         if not session_id or not text:
             return jsonify({"error": "session_id and text are required"}), 400
 
-        url = f"{BASE_URL}.task"
-        headers = {
-            "x-api-key": API_KEY,
-            "Content-Type": "application/json"
-        }
-        
+        action = ".task"
         payload = {
             "session_id": session_id,
             "text": text,
             "task_type": task_type
         }
         
-        print(f"Sending task to: {url}")
+        print(f"Sending task to: {BASE_URL}{action}")
         print(f"Text: {text}")
 
-        response = requests.post(url, headers=headers, json=payload)
+        response = _post(action, payload)
         
         print(f"Task response status: {response.status_code}")
         print(f"Task response: {response.text}")
@@ -190,7 +486,7 @@ def send_task():
         print(f"Exception in send_task: {str(e)}")
         import traceback
         traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        return jsonify({"error": str(e)}), _error_status(e)
 
 @app.route("/stop_session", methods=["POST"])
 def stop_session():
@@ -201,17 +497,12 @@ def stop_session():
         if not session_id:
             return jsonify({"error": "session_id is required"}), 400
 
-        url = f"{BASE_URL}.stop"
-        headers = {
-            "x-api-key": API_KEY,
-            "Content-Type": "application/json"
-        }
-        
+        action = ".stop"
         payload = {
             "session_id": session_id
         }
 
-        response = requests.post(url, headers=headers, json=payload)
+        response = _post(action, payload)
         
         if response.status_code == 200:
             return jsonify(response.json())
@@ -223,7 +514,21 @@ def stop_session():
             }), response.status_code
             
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return jsonify({"error": str(e)}), _error_status(e)
+
+@app.route("/pool_stats", methods=["GET"])
+def pool_stats():
+    return jsonify(avatar_pool.stats())
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus scrape endpoint: HeyGen call and request latency histograms."""
+    return Response(metrics.render_metrics(), mimetype="text/plain; version=0.0.4")
+
+if API_KEY and (__name__ != "__main__" or os.environ.get("WERKZEUG_RUN_MAIN") == "true"):
+    # Under a WSGI server, or in the debug reloader's serving child; never in
+    # the reloader's watcher process, which would create sessions nobody uses
+    avatar_pool.start()
 
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0", port=5000)
\ No newline at end of file
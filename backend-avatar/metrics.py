@@ -0,0 +1,78 @@
+"""Prometheus histograms for the avatar proxy, served from /metrics.
+
+Mirrors modelsrc telemetry.py: the text exposition format is written directly,
+so no client library is needed.
+
+    avatar_upstream_seconds{action}        HeyGen call duration per API action
+    avatar_upstream_queue_seconds{action}  wait for a free upstream slot
+    avatar_request_seconds{endpoint,status} whole proxied request
+"""
+
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+# Upper bounds in seconds; HeyGen calls range from tens of ms (ICE) to seconds (.new)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """Thread-safe cumulative histogram with a fixed label set."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], buckets: Sequence[float] = BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (+Inf last), then sum
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: list(series) for key, series in sorted(self._series.items())}
+        for key, series in snapshot.items():
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key))
+            prefix = labels + "," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+UPSTREAM_SECONDS = Histogram("avatar_upstream_seconds", "Duration of a HeyGen API call.", ["action"])
+UPSTREAM_QUEUE_SECONDS = Histogram(
+    "avatar_upstream_queue_seconds", "Wait for a free upstream slot before a HeyGen call.", ["action"]
+)
+REQUEST_SECONDS = Histogram("avatar_request_seconds", "Duration of a proxied request.", ["endpoint", "status"])
+_REGISTRY = [REQUEST_SECONDS, UPSTREAM_SECONDS, UPSTREAM_QUEUE_SECONDS]
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines: List[str] = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
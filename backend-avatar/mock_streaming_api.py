@@ -0,0 +1,120 @@
+"""Local stand-in for the HeyGen streaming API, for testing the proxy offline.
+
+    python mock_streaming_api.py                 # listens on :5055
+    HEYGEN_BASE_URL=http://127.0.0.1:5055/v1/streaming python app.py
+
+Built on the standard library's HTTP/1.1 server (Flask's dev server closes
+every connection), so GET /stats can report how many distinct client
+connections carried the requests, i.e. whether the proxy reuses keep-alive
+connections.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Simulated upstream latency per call (seconds)
+LATENCY = float(os.getenv("MOCK_LATENCY", "0.05"))
+PREFIX = "/v1/streaming."
+
+
+class MockState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.requests = 0
+        self.connections = set()
+        self.calls = {}
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "connections": len(self.connections),
+                "calls": dict(self.calls),
+                "open_sessions": len(self.sessions),
+            }
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None  # set by make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._reply(200, self.state.stats())
+        else:
+            self._reply(404, {"message": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.startswith(PREFIX):
+            self._reply(404, {"message": "not found"})
+            return
+        action = self.path[len(PREFIX):]
+        state = self.state
+        with state.lock:
+            state.requests += 1
+            state.connections.add(self.client_address)
+            state.calls[action] = state.calls.get(action, 0) + 1
+        time.sleep(LATENCY)
+
+        if action == "new":
+            session_id = uuid.uuid4().hex
+            with state.lock:
+                state.sessions[session_id] = "new"
+            self._reply(200, {"code": 100, "message": "success", "data": {
+                "session_id": session_id,
+                "sdp": {"type": "offer", "sdp": "v=0\r\n"},
+                "access_token": "mock-token",
+                "ice_servers": [],
+                "ice_servers2": [],
+                "url": "",
+            }})
+            return
+
+        session_id = payload.get("session_id")
+        with state.lock:
+            known = session_id in state.sessions
+            if known and action == "start":
+                state.sessions[session_id] = "started"
+            elif known and action == "stop":
+                del state.sessions[session_id]
+        if not known:
+            self._reply(400, {"code": 10005, "message": "session not found"})
+        elif action == "task":
+            self._reply(200, {"code": 100, "message": "success", "data": {"task_id": uuid.uuid4().hex}})
+        elif action in ("start", "ice", "stop"):
+            self._reply(200, {"code": 100, "message": "success", "data": None})
+        else:
+            self._reply(404, {"message": f"unknown action {action}"})
+
+
+def make_server(host="127.0.0.1", port=5055):
+    """Create (but do not start) a mock server; port 0 picks a free port."""
+    handler = type("MockHandler", (Handler,), {"state": MockState()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = handler.state
+    return server
+
+
+if __name__ == "__main__":
+    server = make_server(port=int(os.getenv("MOCK_PORT", "5055")))
+    print(f"Mock streaming API on http://{server.server_address[0]}:{server.server_address[1]}{PREFIX[:-1]}")
+    server.serve_forever()
@@ -184,22 +184,44 @@ useEffect(() => {
         }
       };
 
-      pc.onicecandidate = async (event) => {
+      // Candidates arrive in bursts; buffer them briefly and send one batch
+      let pendingCandidates = [];
+      let flushTimer = null;
+      const flushCandidates = async () => {
+        clearTimeout(flushTimer);
+        flushTimer = null;
+        const candidates = pendingCandidates;
+        pendingCandidates = [];
+        if (candidates.length === 0) return;
+        try {
+          const res = await fetch(`${backendURL}/ice_candidates`, {
+            method: 'POST',
+            headers: {
+              'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+              session_id,
+              candidates
+            })
+          });
+          const data = await res.json();
+          if (data.failed) {
+            console.error("Some ICE candidates were rejected:", data.results);
+          }
+        } catch (err) {
+          console.error("Failed to send ICE candidates:", err);
+        }
+      };
+
+      pc.onicecandidate = (event) => {
         if (event.candidate) {
-          try {
-            await fetch(`${backendURL}/ice_candidate`, {
-              method: 'POST',
-              headers: {
-                'Content-Type': 'application/json'
-              },
-              body: JSON.stringify({
-                session_id,
-                candidate: event.candidate
-              })
-            });
-          } catch (err) {
-            console.error("Failed to send ICE candidate:", err);
+          pendingCandidates.push(event.candidate);
+          if (!flushTimer) {
+            flushTimer = setTimeout(flushCandidates, 50);
           }
+        } else {
+          // Gathering finished
+          flushCandidates();
         }
       };
 
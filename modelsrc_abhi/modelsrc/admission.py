@@ -0,0 +1,288 @@
+"""Admission control for the chat endpoints.
+
+Two independent checks run before a request reaches its endpoint:
+
+    rate limit   a token bucket per client; an empty bucket is answered
+                 with 429
+    concurrency  a limiter per endpoint admits up to `max_concurrent` requests,
+                 queues up to `max_queue` more for at most `queue_timeout`
+                 seconds, and answers everything beyond that with 503
+
+Both rejections carry Retry-After, so clients back off instead of piling up in
+the threadpool. A streaming request holds its slot until its last chunk is sent.
+
+Clients are identified only by what they cannot choose themselves: the
+authenticated user (scope["user"], set by an authentication middleware added
+outside this one), else the peer address. X-Forwarded-For is honoured only
+when the peer is one of TRUSTED_PROXIES, and then the rightmost address not
+belonging to a trusted proxy is used; entries further left are client-supplied.
+
+Behind a reverse proxy (e.g. nginx) every peer address is the proxy's, so
+without TRUSTED_PROXIES all users would share one bucket and be throttled
+together. Rate limiting is therefore off by default until TRUSTED_PROXIES is
+set; set RATE_LIMIT_PER_MINUTE explicitly when clients connect directly.
+
+    ADMISSION_CONTROL=1             master switch
+    ADMISSION_MAX_CONCURRENT=16     per endpoint
+    ADMISSION_MAX_QUEUE=32          per endpoint
+    ADMISSION_QUEUE_TIMEOUT=5       seconds a queued request may wait
+    RATE_LIMIT_PER_MINUTE=30        sustained requests per user (0 disables;
+                                    defaults to 0 without TRUSTED_PROXIES)
+    RATE_LIMIT_BURST=10             bucket size
+    TRUSTED_PROXIES=                comma-separated proxy addresses/CIDRs, e.g.
+                                    "127.0.0.1,10.0.0.0/8"
+"""
+
+import asyncio
+import ipaddress
+import json
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+import telemetry
+
+logger = logging.getLogger("admission")
+
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "1") != "0"
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "16"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(p.strip(), strict=False)
+    for p in os.getenv("TRUSTED_PROXIES", "").split(",") if p.strip()
+]
+RATE_LIMIT_CONFIGURED = os.getenv("RATE_LIMIT_PER_MINUTE") is not None
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "30" if TRUSTED_PROXIES else "0"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "10"))
+
+
+class Rejected(Exception):
+    """Request refused by admission control."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """Bounded concurrency with a bounded, time-limited wait queue.
+
+    Args:
+        max_concurrent: Requests allowed to run at once.
+        max_queue: Requests allowed to wait for a slot; more are rejected at once.
+        queue_timeout: Longest wait for a slot before rejecting.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    async def acquire(self) -> float:
+        """Wait for a slot; returns the seconds spent queued. Raises Rejected."""
+        if not self._slots.locked():
+            # A free slot is taken without suspending, so a burst of arrivals
+            # cannot all see the semaphore as unlocked
+            await self._slots.acquire()
+            self.active += 1
+            self.admitted += 1
+            return 0.0
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise Rejected(503, "Server busy, please retry shortly", self.queue_timeout)
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise Rejected(503, "Server busy, please retry shortly", self.queue_timeout)
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        self.admitted += 1
+        return time.perf_counter() - start
+
+    def release(self) -> None:
+        self.active -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+class RateLimiter:
+    """Token bucket per key; idle buckets beyond `max_keys` are dropped (LRU).
+
+    Args:
+        per_minute: Sustained refill rate.
+        burst: Bucket capacity.
+    """
+
+    def __init__(self, per_minute: float, burst: float, max_keys: int = 100_000):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, tuple]" = OrderedDict()
+        self.limited = 0
+
+    def check(self, key: str) -> float:
+        """Take a token for `key`; returns 0 if allowed, else seconds until one is available."""
+        now = time.monotonic()
+        tokens, last = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        if tokens >= 1:
+            wait = 0.0
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+            self.limited += 1
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> dict:
+        return {"per_minute": self.rate * 60, "burst": self.burst, "users": len(self._buckets), "limited": self.limited}
+
+
+def _is_trusted(address: str, proxies) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in proxies)
+
+
+def _client_key(scope, trusted_proxies=None) -> str:
+    """Rate-limit key: authenticated user, else the real client address."""
+    user = scope.get("user")
+    if getattr(user, "is_authenticated", False):
+        return "user:" + user.display_name
+
+    proxies = TRUSTED_PROXIES if trusted_proxies is None else trusted_proxies
+    client = scope.get("client")
+    address = client[0] if client else "unknown"
+    if not _is_trusted(address, proxies):
+        return "ip:" + address
+    hops = [
+        hop.strip()
+        for name, value in scope.get("headers") or []
+        if name == b"x-forwarded-for"
+        for hop in value.decode("latin-1").split(",")
+        if hop.strip()
+    ]
+    # Each proxy appends the address it saw; walk back from the right past our
+    # own proxies to the first address outside them
+    for hop in reversed(hops):
+        address = hop
+        if not _is_trusted(hop, proxies):
+            break
+    return "ip:" + address
+
+
+async def _reject(send, rejection: Rejected) -> None:
+    body = json.dumps({"detail": rejection.detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": rejection.status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(rejection.retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying rate limits and per-endpoint concurrency limits.
+
+    Args:
+        app: Wrapped ASGI app.
+        limiters: Concurrency limiter per guarded path; other paths pass through.
+        rate_limiter: Shared per-user limiter, or None to disable rate limiting.
+    """
+
+    def __init__(self, app, limiters: Dict[str, ConcurrencyLimiter], rate_limiter: Optional[RateLimiter] = None):
+        self.app = app
+        self.limiters = limiters
+        self.rate_limiter = rate_limiter
+
+    async def __call__(self, scope, receive, send):
+        limiter = self.limiters.get(scope["path"]) if scope["type"] == "http" else None
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            if self.rate_limiter is not None:
+                wait = self.rate_limiter.check(_client_key(scope))
+                if wait:
+                    raise Rejected(429, "Rate limit exceeded", wait)
+            queued = await limiter.acquire()
+        except Rejected as rejection:
+            await _reject(send, rejection)
+            return
+        telemetry.record("queue", queued)
+
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                limiter.release()
+
+        async def send_and_track(message):
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                release()
+
+        try:
+            await self.app(scope, receive, send_and_track)
+        finally:
+            release()
+
+
+def endpoint_limiters(paths: Iterable[str]) -> Dict[str, ConcurrencyLimiter]:
+    """One limiter per path, sized from the environment."""
+    return {
+        path: ConcurrencyLimiter(ADMISSION_MAX_CONCURRENT, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT)
+        for path in paths
+    }
+
+
+def default_rate_limiter() -> Optional[RateLimiter]:
+    """Per-user limiter from the environment (None when rate limiting is off)."""
+    if RATE_LIMIT_PER_MINUTE <= 0:
+        if not RATE_LIMIT_CONFIGURED:
+            logger.warning(
+                "Per-client rate limiting is off: set TRUSTED_PROXIES to the reverse proxy's "
+                "address, or RATE_LIMIT_PER_MINUTE if clients connect directly"
+            )
+        return None
+    if not TRUSTED_PROXIES:
+        logger.warning(
+            "Rate limiting by peer address without TRUSTED_PROXIES; behind a reverse proxy "
+            "all clients share one %.0f/min bucket", RATE_LIMIT_PER_MINUTE,
+        )
+    return RateLimiter(RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST)
@@ -1,26 +1,113 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Literal
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Literal, Optional
+import asyncio
+import json
 import logging
+import os
+import time
 
 # Import the core functions from existing modules
 # Ensure these files exist in the same directory as this app file:
 # - multimodel_therapist.py with get_therapist_response(...)
 # - multimodel_friend.py with get_friend_response(...)
-from multimodel_therapist import get_therapist_response
-from multimodel_friend import get_friend_response
+import admission
+import avatar_pipeline
+import llm_router
+import local_llm
+import multimodel_therapist
+import multimodel_friend
+import telemetry
+from response_cache import RESPONSE_CACHE
+from singleflight import SINGLE_FLIGHT
+from multimodel_therapist import get_therapist_response, astream_therapist_response
+from multimodel_friend import get_friend_response, astream_friend_response
 
 # ------------------------------------------------------------------------------
 # App Initialization and Configuration
 # ------------------------------------------------------------------------------
 
-# Create FastAPI app instance
-app = FastAPI(title="Multi-Model Chat API", version="1.0.0")
-
 # Configure basic logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("multi_model_chat_api")
 
+# Load the FAISS index, embedder and LLM clients at startup instead of on the
+# first request. Set WARMUP_ON_STARTUP=0 to fall back to lazy initialization.
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") != "0"
+
+# Report per-stage durations in a Server-Timing response header
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") != "0"
+
+# Seconds clients are asked to wait when the model provider is rate-limiting us
+UPSTREAM_RETRY_AFTER = int(os.getenv("UPSTREAM_RETRY_AFTER", "5"))
+
+# Admission control for the generation endpoints (see admission.py)
+GUARDED_PATHS = ["/therapist", "/friend", "/therapist/stream", "/friend/stream"]
+ENDPOINT_LIMITERS = admission.endpoint_limiters(GUARDED_PATHS)
+RATE_LIMITER = admission.default_rate_limiter()
+
+
+async def _warm_up(app: FastAPI):
+    """
+    Initializes both chains off the event loop and flips the readiness flag.
+    """
+    start = time.perf_counter()
+    try:
+        await asyncio.to_thread(multimodel_therapist.warm_up)
+        await asyncio.to_thread(multimodel_friend.warm_up)
+    except Exception as e:
+        # Stay alive but not ready; requests will retry lazy initialization
+        logger.exception("Startup warm-up failed")
+        app.state.warmup_error = str(e)
+        return
+    app.state.ready = True
+    logger.info("Startup warm-up finished in %.2fs", time.perf_counter() - start)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Starts warm-up in the background so liveness probes pass immediately while
+    /ready reports 503 until the retrieval engine is loaded.
+    """
+    app.state.ready = not WARMUP_ON_STARTUP
+    app.state.warmup_error = None
+    warmup_task = asyncio.create_task(_warm_up(app)) if WARMUP_ON_STARTUP else None
+    yield
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    await avatar_pipeline.aclose()
+
+
+# Create FastAPI app instance
+app = FastAPI(title="Multi-Model Chat API", version="1.0.0", lifespan=lifespan)
+
+# Added before the timing middleware so it runs inside it: queue time and
+# rejections show up in the request metrics
+if admission.ADMISSION_CONTROL:
+    app.add_middleware(admission.AdmissionMiddleware, limiters=ENDPOINT_LIMITERS, rate_limiter=RATE_LIMITER)
+
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    """
+    Collects stage timings for the request (see telemetry.py).
+
+    For streaming endpoints the header and request histogram cover the time to
+    the first byte; stages that finish later (LLM, avatar) still reach /metrics.
+    """
+    timings = telemetry.begin_request(request.url.path)
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    telemetry.observe_request(route.path if route else "unmatched", response.status_code, elapsed)
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = timings.server_timing(total=elapsed)
+    return response
+
 
 # ------------------------------------------------------------------------------
 # Request Models (Pydantic)
@@ -36,6 +123,8 @@ class TherapistRequest(BaseModel):
     fatigue: float = Field(..., ge=0.0, description="Fatigue level as a float")
     recovery: float = Field(..., ge=0.0, description="Recovery level as a float")
     fer_mood: str = Field(..., description="Facial emotion recognition mood label")
+    session_id: Optional[str] = Field(None, description="Conversation id; enables server-side history for this session")
+    avatar_session_id: Optional[str] = Field(None, description="Avatar session to speak the reply on, sentence by sentence (/stream endpoints only)")
 
 
 class FriendRequest(BaseModel):
@@ -45,6 +134,70 @@ class FriendRequest(BaseModel):
     query: str = Field(..., description="User's input message or question")
     mode: str = Field(..., description="Friend reply mode (e.g., casual, supportive, tough-love)")
     friend_name: str = Field(..., description="Name of the friend persona")
+    session_id: Optional[str] = Field(None, description="Conversation id; enables server-side history for this session")
+    avatar_session_id: Optional[str] = Field(None, description="Avatar session to speak the reply on, sentence by sentence (/stream endpoints only)")
+
+
+# ------------------------------------------------------------------------------
+# Error Helpers
+# ------------------------------------------------------------------------------
+
+def _is_upstream_overload(e: Exception) -> bool:
+    """
+    Whether the model provider rejected the call for rate/capacity reasons.
+    """
+    return getattr(e, "status_code", None) in (429, 503) or type(e).__name__ == "RateLimitError"
+
+
+def _generation_error(e: Exception, persona: str) -> HTTPException:
+    """
+    503 with Retry-After when the provider is overloaded, 500 otherwise.
+    """
+    if _is_upstream_overload(e):
+        return HTTPException(
+            status_code=503,
+            detail=f"{persona} generation is temporarily overloaded, please retry shortly",
+            headers={"Retry-After": str(UPSTREAM_RETRY_AFTER)},
+        )
+    return HTTPException(status_code=500, detail=f"{persona} generation failed: {str(e)}")
+
+
+# ------------------------------------------------------------------------------
+# Streaming Helpers
+# ------------------------------------------------------------------------------
+
+def _sse_event(data: dict, event: str = None) -> str:
+    """
+    Formats a single Server-Sent Events frame.
+    """
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+
+async def _sse_stream(chunks: AsyncIterator[str], endpoint: str) -> AsyncIterator[str]:
+    """
+    Relays model chunks as SSE `data` frames and terminates with a `done` event.
+
+    Errors raised after streaming has started can no longer change the HTTP
+    status code, so they are reported in-band as an `error` event instead.
+    """
+    try:
+        async for chunk in chunks:
+            if chunk:
+                yield _sse_event({"token": chunk})
+        yield _sse_event({}, event="done")
+    except Exception as e:
+        logger.exception(f"Error in {endpoint} stream")
+        yield _sse_event({"detail": f"Generation failed: {str(e)}"}, event="error")
+
+
+def _streaming_response(chunks: AsyncIterator[str], endpoint: str) -> StreamingResponse:
+    return StreamingResponse(
+        _sse_stream(chunks, endpoint),
+        media_type="text/event-stream",
+        # Disable proxy buffering (nginx) so tokens reach the client immediately
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 # ------------------------------------------------------------------------------
@@ -54,11 +207,74 @@ class FriendRequest(BaseModel):
 @app.get("/health")
 def health():
     """
-    Lightweight health probe for liveness/readiness checks.
+    Lightweight liveness probe; does not wait for model warm-up (see /ready).
     """
     return {"status": "ok"}
 
 
+@app.get("/ready")
+def ready():
+    """
+    Readiness probe: 200 once the index, embedder and LLM clients are loaded,
+    503 while startup warm-up is still running (or has failed).
+    """
+    body = {
+        "ready": app.state.ready,
+        "therapist": multimodel_therapist.is_ready(),
+        "friend": multimodel_friend.is_ready(),
+    }
+    if app.state.warmup_error:
+        body["error"] = app.state.warmup_error
+    if not app.state.ready:
+        raise HTTPException(status_code=503, detail=body)
+    return body
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Prometheus scrape endpoint: per-stage and per-request latency histograms.
+    """
+    return PlainTextResponse(telemetry.render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/admission/stats")
+def admission_stats():
+    """
+    Per-endpoint concurrency limiter and per-user rate limiter counters.
+    """
+    return {
+        "enabled": admission.ADMISSION_CONTROL,
+        "endpoints": {path: limiter.stats() for path, limiter in ENDPOINT_LIMITERS.items()},
+        "rate_limit": RATE_LIMITER.stats() if RATE_LIMITER is not None else None,
+    }
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    """
+    Hit/miss counters of the in-process caches, for capacity planning.
+    """
+    return {
+        "therapist": multimodel_therapist.cache_stats(),
+        "responses": RESPONSE_CACHE.stats(),
+        "single_flight": SINGLE_FLIGHT.stats(),
+    }
+
+
+@app.get("/llm/stats")
+def llm_stats():
+    """
+    Selected LLM backend, per-backend routing counters (LLM_BACKEND=router) and
+    local llama.cpp engine counters (llamacpp backend).
+    """
+    return {
+        "backend": multimodel_therapist.LLM_BACKEND,
+        "router": llm_router.stats(),
+        "local": local_llm.stats(),
+    }
+
+
 # ------------------------------------------------------------------------------
 # API Endpoints
 # ------------------------------------------------------------------------------
@@ -75,7 +291,8 @@ def therapist_endpoint(payload: TherapistRequest):
       "mood": str,
       "fatigue": float,
       "recovery": float,
-      "fer_mood": str
+      "fer_mood": str,
+      "session_id": str (optional)
     }
 
     Response JSON:
@@ -92,12 +309,13 @@ def therapist_endpoint(payload: TherapistRequest):
             fatigue=payload.fatigue,
             recovery=payload.recovery,
             fer_mood=payload.fer_mood,
+            session_id=payload.session_id,
         )
         return {"response": response_text}
     except Exception as e:
         # Log full traceback for debugging, return sanitised message to client
         logger.exception("Error in /therapist endpoint")
-        raise HTTPException(status_code=500, detail=f"Therapist generation failed: {str(e)}")
+        raise _generation_error(e, "Therapist")
 
 
 @app.post("/friend")
@@ -109,7 +327,8 @@ def friend_endpoint(payload: FriendRequest):
     {
       "query": str,
       "mode": str,
-      "friend_name": str
+      "friend_name": str,
+      "session_id": str (optional)
     }
 
     Response JSON:
@@ -123,12 +342,68 @@ def friend_endpoint(payload: FriendRequest):
             query=payload.query,
             mode=payload.mode,
             friend_name=payload.friend_name,
+            session_id=payload.session_id,
         )
         return {"response": response_text}
     except Exception as e:
         # Log full traceback for debugging, return sanitised message to client
         logger.exception("Error in /friend endpoint")
-        raise HTTPException(status_code=500, detail=f"Friend generation failed: {str(e)}")
+        raise _generation_error(e, "Friend")
+
+
+@app.post("/therapist/stream")
+async def therapist_stream_endpoint(payload: TherapistRequest):
+    """
+    Streaming variant of /therapist using Server-Sent Events.
+
+    Request JSON: same as /therapist, plus optional "avatar_session_id". When set,
+    each finished sentence is also sent to that avatar session as a talk task
+    while generation continues (see avatar_pipeline.py).
+
+    Response stream (text/event-stream):
+      data: {"token": str}        (repeated, one per generated chunk)
+      event: done                 (generation finished)
+      event: error                (generation failed mid-stream, with "detail")
+    """
+    logger.info("Received /therapist/stream request")
+    chunks = astream_therapist_response(
+        query=payload.query,
+        stress=payload.stress,
+        mood=payload.mood,
+        fatigue=payload.fatigue,
+        recovery=payload.recovery,
+        fer_mood=payload.fer_mood,
+        session_id=payload.session_id,
+    )
+    if payload.avatar_session_id:
+        chunks = avatar_pipeline.speak_stream(chunks, payload.avatar_session_id)
+    return _streaming_response(chunks, "/therapist/stream")
+
+
+@app.post("/friend/stream")
+async def friend_stream_endpoint(payload: FriendRequest):
+    """
+    Streaming variant of /friend using Server-Sent Events.
+
+    Request JSON: same as /friend, plus optional "avatar_session_id". When set,
+    each finished sentence is also sent to that avatar session as a talk task
+    while generation continues (see avatar_pipeline.py).
+
+    Response stream (text/event-stream):
+      data: {"token": str}        (repeated, one per generated chunk)
+      event: done                 (generation finished)
+      event: error                (generation failed mid-stream, with "detail")
+    """
+    logger.info("Received /friend/stream request")
+    chunks = astream_friend_response(
+        query=payload.query,
+        mode=payload.mode,
+        friend_name=payload.friend_name,
+        session_id=payload.session_id,
+    )
+    if payload.avatar_session_id:
+        chunks = avatar_pipeline.speak_stream(chunks, payload.avatar_session_id)
+    return _streaming_response(chunks, "/friend/stream")
 
 
 # ------------------------------------------------------------------------------
@@ -140,5 +415,12 @@ def friend_endpoint(payload: FriendRequest):
 #
 # The server will expose:
 # - GET  /health
+# - GET  /ready
+# - GET  /metrics
+# - GET  /admission/stats
+# - GET  /cache/stats
+# - GET  /llm/stats
 # - POST /therapist
+# - POST /therapist/stream
 # - POST /friend
+# - POST /friend/stream
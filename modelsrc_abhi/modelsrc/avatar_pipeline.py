@@ -0,0 +1,152 @@
+"""Speak a reply on the avatar while it is still being generated.
+
+The LLM token stream is cut into sentences as it arrives; each sentence is sent
+to the avatar backend's /send_task as a `talk` task, so the avatar starts
+speaking after the first sentence instead of after the whole reply. Tokens are
+passed through unchanged, so the same stream still feeds the SSE response.
+
+    chunks = avatar_pipeline.speak_stream(chunks, avatar_session_id)
+"""
+
+import asyncio
+import logging
+import os
+import re
+from typing import AsyncIterator, List, Optional, Set
+
+import httpx
+
+from telemetry import span
+
+# Avatar proxy (backend-avatar/app.py)
+AVATAR_BACKEND_URL = os.getenv("AVATAR_BACKEND_URL", "http://localhost:5000").rstrip("/")
+AVATAR_TIMEOUT = float(os.getenv("AVATAR_TIMEOUT", "10"))
+# How long sentences may still be sent after the reply stream has ended
+AVATAR_DRAIN_TIMEOUT = float(os.getenv("AVATAR_DRAIN_TIMEOUT", "60"))
+# Sentences shorter than this are merged with the next one, so the avatar
+# does not get a separate task for "Hi." or "Okay."
+MIN_SENTENCE_CHARS = int(os.getenv("AVATAR_MIN_SENTENCE_CHARS", "25"))
+
+logger = logging.getLogger("avatar_pipeline")
+
+# End of sentence: terminal punctuation (optionally closed by a quote or
+# bracket) followed by whitespace, or a blank line
+_BOUNDARY = re.compile(r"[.!?…]+[\"')\]]*\s+|\n\s*\n")
+
+_client: Optional[httpx.AsyncClient] = None
+# Speakers still sending after their reply stream ended
+_speakers: Set[asyncio.Task] = set()
+
+
+class SentenceSegmenter:
+    """Incrementally splits streamed text into sentences."""
+
+    def __init__(self, min_chars: int = MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, chunk: str) -> List[str]:
+        """Add `chunk`; return the sentences it completed (possibly none)."""
+        self._buffer += chunk
+        sentences = []
+        start = 0
+        for match in _BOUNDARY.finditer(self._buffer):
+            if match.end() - start < self.min_chars:
+                continue
+            sentence = self._buffer[start:match.end()].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        """Whatever is left once the stream has ended."""
+        rest, self._buffer = self._buffer.strip(), ""
+        return rest or None
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(base_url=AVATAR_BACKEND_URL, timeout=AVATAR_TIMEOUT)
+    return _client
+
+
+async def aclose() -> None:
+    """Stop pending speakers and close the shared HTTP client (call on application shutdown)."""
+    global _client
+    for speaker in list(_speakers):
+        speaker.cancel()
+    await asyncio.gather(*_speakers, return_exceptions=True)
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def send_task(session_id: str, text: str, task_type: str = "talk") -> None:
+    with span("avatar_task"):
+        response = await _get_client().post(
+            "/send_task", json={"session_id": session_id, "text": text, "task_type": task_type}
+        )
+    response.raise_for_status()
+
+
+async def _speaker(session_id: str, sentences: "asyncio.Queue[Optional[str]]") -> None:
+    # One consumer per reply keeps tasks in order; the avatar queues them
+    failed = False
+    while True:
+        sentence = await sentences.get()
+        if sentence is None:
+            return
+        if failed:
+            continue
+        try:
+            await send_task(session_id, sentence)
+        except Exception:
+            # Keep the text stream going; the user still sees the reply
+            logger.exception("Failed to send sentence to avatar session %s", session_id)
+            failed = True
+
+
+def _give_up(speaker: asyncio.Task, session_id: str) -> None:
+    if not speaker.done():
+        logger.warning("Avatar session %s still speaking after %ss; dropping the rest", session_id, AVATAR_DRAIN_TIMEOUT)
+        speaker.cancel()
+
+
+def _drain(speaker: asyncio.Task, session_id: str) -> None:
+    """Let `speaker` finish in the background, for at most AVATAR_DRAIN_TIMEOUT seconds."""
+    _speakers.add(speaker)
+    timer = asyncio.get_running_loop().call_later(AVATAR_DRAIN_TIMEOUT, _give_up, speaker, session_id)
+    speaker.add_done_callback(_speakers.discard)
+    speaker.add_done_callback(lambda _: timer.cancel())
+
+
+async def speak_stream(chunks: AsyncIterator[str], session_id: str) -> AsyncIterator[str]:
+    """Relay `chunks` unchanged while speaking each finished sentence on the avatar.
+
+    Args:
+        chunks: Token stream from a persona's astream function.
+        session_id: Avatar (HeyGen) session to speak on.
+
+    Returns:
+        The same chunks; completes with `chunks`, while the avatar is still
+        sent the remaining sentences in the background.
+    """
+    segmenter = SentenceSegmenter()
+    sentences: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+    speaker = asyncio.create_task(_speaker(session_id, sentences))
+    try:
+        async for chunk in chunks:
+            for sentence in segmenter.feed(chunk):
+                sentences.put_nowait(sentence)
+            yield chunk
+        rest = segmenter.flush()
+        if rest:
+            sentences.put_nowait(rest)
+    finally:
+        # Sentences already queued are still spoken if the client goes away,
+        # but the text stream does not wait for them
+        sentences.put_nowait(None)
+        _drain(speaker, session_id)
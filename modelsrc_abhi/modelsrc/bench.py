@@ -0,0 +1,318 @@
+"""Load test for the chat API with a stub LLM.
+
+Starts `uvicorn app:app` in a subprocess with LLM_BACKEND=stub (see
+stub_llm.py), so retrieval, prompt building, memory and streaming run for real
+while the LLM has fixed, configurable timing. Each endpoint is then driven at
+increasing concurrency and the latency percentiles, throughput and per-worker
+memory are reported.
+
+Results are written to bench_results/<time>_<commit>.json; each run is
+compared with the most recent earlier result for the same settings, so
+regressions between commits show up as deltas.
+
+Usage:
+    python bench.py
+    python bench.py --concurrency 1,8,32 --requests 200 --workers 2
+    python bench.py --endpoints /therapist,/therapist/stream --ttft-ms 500
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(BASE_DIR, "combined_dataset_fixed.json")
+RESULTS_DIR = os.path.join(BASE_DIR, "bench_results")
+
+DEFAULT_ENDPOINTS = ["/therapist", "/friend"]
+
+
+# ---------- Request payloads ----------
+def load_queries(path: str = DATA_PATH, limit: int = 200, seed: int = 0) -> List[str]:
+    """User messages for the load: a seeded sample of dataset contexts."""
+    with open(path, "r") as f:
+        rows = json.load(f)
+    queries = sorted({row.get("Context", "").strip() for row in rows} - {""})
+    random.Random(seed).shuffle(queries)
+    return queries[:limit]
+
+
+def make_payload(endpoint: str, query: str, session_id: str) -> dict:
+    if endpoint.startswith("/therapist"):
+        return {
+            "query": query,
+            "stress": 0.6,
+            "mood": "sad",
+            "fatigue": 0.4,
+            "recovery": 0.5,
+            "fer_mood": "neutral",
+            "session_id": session_id,
+        }
+    return {"query": query, "mode": "Caring", "friend_name": "Sunny", "session_id": session_id}
+
+
+# ---------- Server process ----------
+def start_server(port: int, workers: int, env: Dict[str, str]) -> subprocess.Popen:
+    cmd = [
+        sys.executable, "-m", "uvicorn", "app:app",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers), "--log-level", "warning",
+    ]
+    return subprocess.Popen(cmd, cwd=BASE_DIR, env={**os.environ, **env})
+
+
+def wait_ready(base_url: str, proc: subprocess.Popen, timeout: float) -> float:
+    """Poll /ready until it returns 200; returns the startup time in seconds."""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited during startup (code {proc.returncode})")
+        try:
+            if httpx.get(f"{base_url}/ready", timeout=2).status_code == 200:
+                return time.perf_counter() - start
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"Server not ready after {timeout:.0f}s")
+
+
+def process_tree(pid: int) -> List[int]:
+    """`pid` and all its descendants (Linux /proc)."""
+    pids = [pid]
+    for task in glob.glob(f"/proc/{pid}/task/*/children"):
+        try:
+            with open(task) as f:
+                for child in f.read().split():
+                    pids.extend(process_tree(int(child)))
+        except OSError:
+            pass
+    return pids
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def memory_snapshot(proc: subprocess.Popen, workers: int) -> dict:
+    """RSS per server process; with --workers > 1 the parent is only a supervisor."""
+    pids = process_tree(proc.pid)
+    if workers > 1:
+        pids = pids[1:]
+    rss = [mb for mb in (rss_mb(pid) for pid in pids) if mb is not None]
+    return {
+        "processes": len(rss),
+        "rss_mb_per_worker_max": round(max(rss), 1) if rss else None,
+        "rss_mb_total": round(sum(rss), 1),
+    }
+
+
+# ---------- Load generation ----------
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+async def _one_request(client: httpx.AsyncClient, endpoint: str, payload: dict) -> Optional[float]:
+    """Send one request; returns time to first token for streams, else None."""
+    if not endpoint.endswith("/stream"):
+        response = await client.post(endpoint, json=payload)
+        response.raise_for_status()
+        return None
+    ttft = None
+    start = time.perf_counter()
+    async with client.stream("POST", endpoint, json=payload) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line.startswith("event: error"):
+                raise RuntimeError("stream reported an error event")
+            if ttft is None and line.startswith("data: {\"token\""):
+                ttft = time.perf_counter() - start
+    return ttft
+
+
+async def run_level(base_url: str, endpoint: str, queries: List[str], concurrency: int, total: int, timeout: float) -> dict:
+    """Issue `total` requests to `endpoint` from `concurrency` virtual users."""
+    latencies: List[float] = []
+    ttfts: List[float] = []
+    errors: Dict[str, int] = {}
+    counter = iter(range(total))
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+
+        async def user(user_id: int):
+            session_id = f"bench-{endpoint}-{concurrency}-{user_id}"
+            for i in counter:
+                payload = make_payload(endpoint, queries[i % len(queries)], session_id)
+                start = time.perf_counter()
+                try:
+                    ttft = await _one_request(client, endpoint, payload)
+                except Exception as e:
+                    name = type(e).__name__
+                    errors[name] = errors.get(name, 0) + 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+                if ttft is not None:
+                    ttfts.append(ttft)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user(u) for u in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    ttfts.sort()
+    ms = lambda v: round(v * 1000, 1) if v is not None else None  # noqa: E731
+    result = {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+    }
+    if ttfts:
+        result["ttft_p50_ms"] = ms(percentile(ttfts, 50))
+        result["ttft_p95_ms"] = ms(percentile(ttfts, 95))
+    return result
+
+
+# ---------- Results ----------
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def previous_result(settings: dict) -> Optional[dict]:
+    """Most recent saved run with the same settings."""
+    for path in sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")), reverse=True):
+        with open(path) as f:
+            run = json.load(f)
+        if run.get("settings") == settings:
+            return run
+    return None
+
+
+def print_table(results: List[dict], baseline: Optional[dict]) -> None:
+    base = {(r["endpoint"], r["concurrency"]): r for r in (baseline or {}).get("results", [])}
+    header = f"{'endpoint':<20}{'conc':>5}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'rss/wkr':>9}{'err':>5}"
+    if baseline:
+        header += f"{'Δp95':>9}  (vs {baseline['commit']})"
+    print(header)
+    for r in results:
+        errors = sum(r["errors"].values())
+        line = (
+            f"{r['endpoint']:<20}{r['concurrency']:>5}{r['throughput_rps']:>9}"
+            f"{r['p50_ms']!s:>9}{r['p95_ms']!s:>9}{r['p99_ms']!s:>9}"
+            f"{r['memory']['rss_mb_per_worker_max']!s:>9}{errors:>5}"
+        )
+        prev = base.get((r["endpoint"], r["concurrency"]))
+        if prev and prev.get("p95_ms") and r.get("p95_ms"):
+            line += f"{(r['p95_ms'] / prev['p95_ms'] - 1) * 100:>+8.1f}%"
+        print(line)
+
+
+# ---------- Main ----------
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the chat API against a stub LLM.")
+    parser.add_argument("--endpoints", default=",".join(DEFAULT_ENDPOINTS),
+                        help="Comma-separated endpoints (stream endpoints also report TTFT)")
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint and level")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft-ms", type=float, default=300, help="Stub LLM time to first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=200, help="Stub LLM generation rate")
+    parser.add_argument("--reply-tokens", type=int, default=120, help="Stub LLM reply length")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout (seconds)")
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    parser.add_argument("--no-save", action="store_true", help="Do not write a results file")
+    args = parser.parse_args()
+
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    levels = [int(c) for c in args.concurrency.split(",")]
+    settings = {
+        "endpoints": endpoints,
+        "concurrency": levels,
+        "requests": args.requests,
+        "workers": args.workers,
+        "ttft_ms": args.ttft_ms,
+        "tokens_per_sec": args.tokens_per_sec,
+        "reply_tokens": args.reply_tokens,
+    }
+    env = {
+        "LLM_BACKEND": "stub",
+        "STUB_LLM_TTFT_MS": str(args.ttft_ms),
+        "STUB_LLM_TOKENS_PER_SEC": str(args.tokens_per_sec),
+        "STUB_LLM_REPLY_TOKENS": str(args.reply_tokens),
+        "WARMUP_ON_STARTUP": "1",
+        "SESSION_BACKEND": "memory",
+        # Every virtual user shares one client address
+        "RATE_LIMIT_PER_MINUTE": "0",
+    }
+    queries = load_queries()
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    proc = start_server(args.port, args.workers, env)
+    results = []
+    try:
+        startup = wait_ready(base_url, proc, args.startup_timeout)
+        print(f"Server ready in {startup:.1f}s ({args.workers} worker(s)); idle memory {memory_snapshot(proc, args.workers)}")
+        for endpoint in endpoints:
+            for level in levels:
+                result = asyncio.run(run_level(base_url, endpoint, queries, level, args.requests, args.timeout))
+                result["memory"] = memory_snapshot(proc, args.workers)
+                results.append(result)
+                print(json.dumps(result))
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    run = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "cpu_count": os.cpu_count(),
+        "python": sys.version.split()[0],
+        "startup_seconds": round(startup, 2),
+        "settings": settings,
+        "results": results,
+    }
+    baseline = previous_result(settings)
+    print()
+    print_table(results, baseline)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}_{run['commit']}.json")
+        with open(path, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"\nSaved {path}")
+
+
+if __name__ == "__main__":
+    main()
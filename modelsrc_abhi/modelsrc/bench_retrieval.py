@@ -0,0 +1,192 @@
+"""Retrieval micro-benchmark: embedding, index build, search latency and recall.
+
+Runs the load_json_data -> embed -> build_vectorstore -> search path on the
+therapist corpus, on CPU and offline (the embedding model must already be in
+the local Hugging Face cache; pass --allow-download once to fetch it).
+
+    embedding   docs/sec for each batch size, plus single-query latency
+    build       index build time for each index type
+    search      vectorstore search latency (incl. docstore lookups) for each k
+    recall      recall@k against exact search on a held-out split, via
+                index_factory.evaluate_indexes
+
+Results are saved next to the load-test results in bench_results/.
+
+Usage:
+    python bench_retrieval.py
+    python bench_retrieval.py --index-types flat,hnsw --batch-sizes 16,64 --holdout 0.2
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import List
+
+import numpy as np
+
+
+def _percentiles(values_ms: List[float]) -> dict:
+    return {
+        "p50_ms": round(float(np.percentile(values_ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(values_ms, 95)), 4),
+    }
+
+
+def _label(row: dict) -> str:
+    # Small corpora make create_index fall back (e.g. ivfpq -> flat); show both
+    if row["index_type"] == row["requested"]:
+        return row["index_type"]
+    return f"{row['requested']}->{row['index_type']}"
+
+
+def bench_embedding(embeddings, texts: List[str], batch_sizes: List[int], queries: List[str]) -> dict:
+    """Throughput of embed_documents per batch size, and embed_query latency.
+
+    `embeddings` is a HuggingFaceEmbeddings; its encode_kwargs are adjusted
+    in place for each batch size.
+    """
+    embeddings.embed_documents(texts[: max(batch_sizes)])  # load weights, warm kernels
+    throughput = []
+    for batch_size in batch_sizes:
+        embeddings.encode_kwargs["batch_size"] = batch_size
+        start = time.perf_counter()
+        embeddings.embed_documents(texts)
+        seconds = time.perf_counter() - start
+        throughput.append({
+            "batch_size": batch_size,
+            "docs": len(texts),
+            "seconds": round(seconds, 3),
+            "docs_per_sec": round(len(texts) / seconds, 1),
+        })
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        embeddings.embed_query(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {"throughput": throughput, "query": _percentiles(latencies)}
+
+
+def bench_search(vectorstore, query_vectors: np.ndarray, k_values: List[int]) -> List[dict]:
+    """Latency of similarity search (vector search plus docstore fetch) per k."""
+    rows = []
+    for k in k_values:
+        latencies = []
+        for vector in query_vectors:
+            start = time.perf_counter()
+            vectorstore.similarity_search_with_score_by_vector(vector.tolist(), k=k)
+            latencies.append((time.perf_counter() - start) * 1000)
+        rows.append({"k": k, **_percentiles(latencies)})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the therapist retrieval path.")
+    parser.add_argument("--batch-sizes", default="8,16,32,64,128", help="Embedding batch sizes to sweep")
+    parser.add_argument("--index-types", default="flat,ivf,hnsw,ivfpq", help="Index types to build and evaluate")
+    parser.add_argument("--k-max", type=int, default=20, help="Measure search latency for k = 1..k-max")
+    parser.add_argument("--holdout", type=float, default=0.1, help="Fraction of records used as queries")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threads", type=int, default=0, help="Torch threads (0 keeps the default)")
+    parser.add_argument("--allow-download", action="store_true", help="Allow fetching the embedding model")
+    parser.add_argument("--no-save", action="store_true", help="Do not write a results file")
+    args = parser.parse_args()
+
+    if not args.allow_download:
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    if args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+
+    # Imported after the offline switches so the model loader honours them
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    import multimodel_therapist as therapist
+    from bench import RESULTS_DIR, git_commit
+    from index_factory import build_vectorstore, evaluate_indexes, index_type_of, settings_from_env
+
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+    index_types = [t.strip() for t in args.index_types.split(",") if t.strip()]
+    k_values = list(range(1, args.k_max + 1))
+
+    docs = [doc for path in therapist.DATASET_PATHS for doc in therapist.load_json_data(path)]
+    order = np.random.default_rng(args.seed).permutation(len(docs))
+    n_queries = max(1, int(len(docs) * args.holdout))
+    query_docs = [docs[i] for i in order[:n_queries]]
+    base_docs = [docs[i] for i in order[n_queries:]]
+    print(f"{len(base_docs)} indexed records, {len(query_docs)} held-out queries", file=sys.stderr)
+
+    embeddings = HuggingFaceEmbeddings(
+        model_name=therapist.EMBED_MODEL,
+        model_kwargs={"device": "cpu"},
+        encode_kwargs={},
+    )
+    base_texts = [d.page_content for d in base_docs]
+    query_texts = [d.page_content for d in query_docs]
+    embedding = bench_embedding(embeddings, base_texts, batch_sizes, query_texts)
+
+    base_vectors = np.asarray(embeddings.embed_documents(base_texts), dtype=np.float32)
+    query_vectors = np.asarray(embeddings.embed_documents(query_texts), dtype=np.float32)
+
+    builds = []
+    for index_type in index_types:
+        settings = dict(settings_from_env(), index_type=index_type)
+        start = time.perf_counter()
+        vectorstore = build_vectorstore(
+            list(zip(base_texts, base_vectors.tolist())),
+            embeddings,
+            metadatas=[d.metadata for d in base_docs],
+            **settings,
+        )
+        build_seconds = time.perf_counter() - start
+        builds.append({
+            "index_type": index_type_of(vectorstore.index),
+            "requested": index_type,
+            "build_seconds": round(build_seconds, 4),
+            "search": bench_search(vectorstore, query_vectors, k_values),
+        })
+
+    recall_k = sorted({1, 3, 5, 10, args.k_max} & set(k_values))
+    recall = evaluate_indexes(
+        base_vectors,
+        query_vectors,
+        k_values=recall_k,
+        settings_list=[dict(settings_from_env(), index_type=t) for t in index_types],
+    )
+
+    run = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "cpu_count": os.cpu_count(),
+        "embed_model": therapist.EMBED_MODEL,
+        "records": len(docs),
+        "holdout": n_queries,
+        "embedding": embedding,
+        "builds": builds,
+        "recall": recall,
+    }
+
+    for row in embedding["throughput"]:
+        print(f"embed  batch={row['batch_size']:<4} {row['docs_per_sec']:>8} docs/s")
+    print(f"embed  query p50={embedding['query']['p50_ms']}ms p95={embedding['query']['p95_ms']}ms")
+    for build in builds:
+        by_k = {row["k"]: row for row in build["search"]}
+        spot = ", ".join(f"k={k}: {by_k[k]['p50_ms']}ms" for k in (1, 5, 10, args.k_max) if k in by_k)
+        print(f"build  {_label(build):<12} {build['build_seconds']}s  search p50 {spot}")
+    for row in recall:
+        scores = " ".join(f"{key}={value}" for key, value in row.items() if key.startswith("recall@"))
+        print(f"recall {_label(row):<12} {scores}")
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"retrieval_{time.strftime('%Y%m%d-%H%M%S')}_{run['commit']}.json")
+        with open(path, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"Saved {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""Offline, resumable builder for large therapist corpora.
+
+Streams the JSON datasets row by row, embeds fixed-size batches across a pool
+of worker processes and checkpoints every batch as a shard under --work-dir.
+An interrupted build re-run with the same arguments skips finished shards.
+Once all shards exist they are merged into the FAISS index (type chosen by FAISS_INDEX_TYPE, see
+index_factory.py) and published with
+the same manifest the incremental IndexManager uses, so later syncs only embed
+new rows.
+
+Usage:
+    python build_index.py --workers 4 --batch-size 256
+    python build_index.py --work-dir /data/index_build --threads-per-worker 2
+"""
+
+import argparse
+import concurrent.futures
+import json
+import logging
+import multiprocessing
+import os
+import re
+import time
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+from index_manager import save_index, sync_lock
+import ingestion
+from ingestion import ingest_rows
+
+logger = logging.getLogger("build_index")
+
+_WORKER_EMBEDDINGS = None
+_SEPARATORS = re.compile(r"[\s,]*")
+
+
+def iter_json_array(path: str, chunk_size: int = 1 << 20) -> Iterator[dict]:
+    """Yield the elements of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    with open(path, "r") as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} does not contain a JSON array")
+        # Decode in place from pos; the buffer is only trimmed when a chunk is read
+        pos = 1
+        eof = False
+        while True:
+            pos = _SEPARATORS.match(buffer, pos).end()
+            if buffer.startswith("]", pos):
+                return
+            try:
+                item, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield item
+
+
+def iter_records(dataset_paths: List[str]):
+    """Stream (row, source) pairs from every dataset."""
+    for path in dataset_paths:
+        source = os.path.basename(path)
+        for row in iter_json_array(path):
+            yield row, source
+
+
+def iter_batches(dataset_paths: List[str], batch_size: int, to_document) -> Iterator[Tuple[list, list]]:
+    """Group ingested records into (ids, documents) batches in a deterministic order.
+
+    Rows sharing a Context are merged by ingestion, so records are collected
+    before batching; only the compact records (not the raw file) stay in memory.
+    """
+    records = ingest_rows(iter_records(dataset_paths))
+    hashes, docs = [], []
+    for h, (record, source) in records.items():
+        hashes.append(h)
+        docs.append(to_document(record, h, source))
+        if len(docs) == batch_size:
+            yield hashes, docs
+            hashes, docs = [], []
+    if docs:
+        yield hashes, docs
+
+
+# ---------- Worker process ----------
+def _init_worker(model_name: str, batch_size: int, threads: int) -> None:
+    global _WORKER_EMBEDDINGS
+    # Each worker gets its own slice of the CPU instead of fighting over all cores
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    from langchain_huggingface import HuggingFaceEmbeddings
+    _WORKER_EMBEDDINGS = HuggingFaceEmbeddings(
+        model_name=model_name,
+        encode_kwargs={"batch_size": batch_size},
+    )
+
+
+def _embed_batch(texts: List[str]) -> np.ndarray:
+    return np.asarray(_WORKER_EMBEDDINGS.embed_documents(texts), dtype=np.float32)
+
+
+# ---------- Shards ----------
+def _shard_path(work_dir: str, n: int) -> str:
+    return os.path.join(work_dir, f"shard_{n:06d}.npz")
+
+
+def _write_shard(work_dir: str, n: int, hashes: list, docs: list, vectors: np.ndarray) -> None:
+    tmp = os.path.join(work_dir, f".shard_{n:06d}.tmp.npz")
+    np.savez(
+        tmp,
+        ids=np.array(hashes),
+        texts=np.array([d.page_content for d in docs]),
+        metadatas=np.array([json.dumps(d.metadata) for d in docs]),
+        vectors=vectors,
+    )
+    os.replace(tmp, _shard_path(work_dir, n))
+
+
+def _dataset_fingerprint(paths: List[str]) -> List[dict]:
+    """Path, size and mtime of each dataset, so edited files invalidate old shards."""
+    fingerprint = []
+    for path in paths:
+        st = os.stat(path)
+        fingerprint.append({"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns})
+    return fingerprint
+
+
+def _check_work_dir(work_dir: str, params: dict) -> None:
+    """Refuse to resume shards produced with different inputs."""
+    os.makedirs(work_dir, exist_ok=True)
+    params_path = os.path.join(work_dir, "build.json")
+    if os.path.exists(params_path):
+        with open(params_path, "r") as f:
+            previous = json.load(f)
+        if previous != params:
+            raise SystemExit(
+                f"{work_dir} holds shards from a different build ({previous}); "
+                "remove it or pass another --work-dir"
+            )
+    else:
+        with open(params_path, "w") as f:
+            json.dump(params, f)
+
+
+def embed_shards(dataset_paths, to_document, work_dir, model_name, batch_size, workers, threads) -> int:
+    """Embed every missing shard; return the number of shards in the build."""
+    start = time.perf_counter()
+    embedded_docs = 0
+    ctx = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(model_name, batch_size, threads),
+    ) as pool:
+        pending = {}
+        shard_count = 0
+
+        def drain(return_when):
+            nonlocal embedded_docs
+            done, _ = concurrent.futures.wait(pending, return_when=return_when)
+            for future in done:
+                n, hashes, docs = pending.pop(future)
+                _write_shard(work_dir, n, hashes, docs, future.result())
+                embedded_docs += len(docs)
+                elapsed = time.perf_counter() - start
+                logger.info("shard %d done: %d docs embedded, %.1f docs/sec", n, embedded_docs, embedded_docs / elapsed)
+
+        for n, (hashes, docs) in enumerate(iter_batches(dataset_paths, batch_size, to_document)):
+            shard_count = n + 1
+            if os.path.exists(_shard_path(work_dir, n)):
+                continue
+            future = pool.submit(_embed_batch, [d.page_content for d in docs])
+            pending[future] = (n, hashes, docs)
+            # Bound the number of batches held in memory while streaming
+            if len(pending) >= 2 * workers:
+                drain(concurrent.futures.FIRST_COMPLETED)
+        while pending:
+            drain(concurrent.futures.FIRST_COMPLETED)
+
+    elapsed = time.perf_counter() - start
+    logger.info("Embedded %d docs in %.1fs (%.1f docs/sec)", embedded_docs, elapsed, embedded_docs / elapsed if elapsed else 0.0)
+    return shard_count
+
+
+def merge_shards(work_dir: str, shard_count: int, embeddings, index_settings: dict):
+    """Concatenate all shards into one FAISS vectorstore; return (vectorstore, rows)."""
+    from index_factory import build_vectorstore
+
+    ids, texts, metadatas, vectors = [], [], [], []
+    for n in range(shard_count):
+        with np.load(_shard_path(work_dir, n)) as shard:
+            ids.extend(shard["ids"].tolist())
+            texts.extend(shard["texts"].tolist())
+            metadatas.extend(json.loads(m) for m in shard["metadatas"].tolist())
+            vectors.append(shard["vectors"])
+    matrix = np.concatenate(vectors)
+    vectorstore = build_vectorstore(
+        list(zip(texts, matrix.tolist())), embeddings, metadatas=metadatas, ids=ids, **index_settings
+    )
+    rows = {h: m.get("source", "") for h, m in zip(ids, metadatas)}
+    return vectorstore, rows
+
+
+def main():
+    import multimodel_therapist as therapist
+
+    parser = argparse.ArgumentParser(description="Build the therapist FAISS index offline.")
+    parser.add_argument("--datasets", nargs="+", default=therapist.DATASET_PATHS, help="JSON datasets to index")
+    parser.add_argument("--index-path", default=therapist.FAISS_INDEX_PATH, help="Where to publish the index")
+    parser.add_argument("--work-dir", default=therapist.FAISS_INDEX_PATH + ".build", help="Shard checkpoint directory")
+    parser.add_argument("--batch-size", type=int, default=256, help="Rows per shard / embedding batch")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="Embedding processes")
+    parser.add_argument("--threads-per-worker", type=int, default=0, help="torch threads per worker (0 = library default)")
+    parser.add_argument("--keep-shards", action="store_true", help="Keep the work dir after publishing")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    _check_work_dir(args.work_dir, {
+        "datasets": _dataset_fingerprint(args.datasets),
+        "batch_size": args.batch_size,
+        "embed_model": therapist.EMBED_MODEL,
+        "max_response_chars": ingestion.MAX_RESPONSE_CHARS,
+        "max_responses": ingestion.MAX_RESPONSES_PER_CONTEXT,
+    })
+
+    start = time.perf_counter()
+    shard_count = embed_shards(
+        args.datasets, therapist.record_to_document, args.work_dir,
+        therapist.EMBED_MODEL, args.batch_size, args.workers, args.threads_per_worker,
+    )
+    vectorstore, rows = merge_shards(args.work_dir, shard_count, therapist.get_embeddings(), therapist.INDEX_SETTINGS)
+    with sync_lock(args.index_path):
+        save_index(vectorstore, args.index_path, rows, therapist.EMBED_MODEL, therapist.INDEX_SETTINGS["index_type"])
+
+    if not args.keep_shards:
+        import shutil
+        shutil.rmtree(args.work_dir, ignore_errors=True)
+
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        "docs": len(rows),
+        "shards": shard_count,
+        "seconds": round(elapsed, 2),
+        "docs_per_sec": round(len(rows) / elapsed, 1) if elapsed else None,
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Per-session conversation history with a bounded prompt footprint.
+
+The most recent turns are kept verbatim. When they exceed the token budget the
+oldest turns are folded into a running summary, which is itself capped, so the
+history block sent with every request stays roughly constant in size no matter
+how long the conversation runs.
+"""
+
+import os
+import re
+from typing import Callable, List, Optional
+
+from session_store import SessionStore, get_session_store
+from token_counter import count_tokens
+
+# Recent-turn and summary budgets (tokens, see token_counter.py)
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "600"))
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "150"))
+MEMORY_SESSION_TTL = float(os.getenv("MEMORY_SESSION_TTL", "86400"))
+
+_FIRST_SENTENCE = re.compile(r"^(.+?[.!?])(\s|$)")
+
+
+def _gist(text: str, max_words: int = 20) -> str:
+    """First sentence of `text`, capped at `max_words` words."""
+    text = " ".join(text.split())
+    match = _FIRST_SENTENCE.match(text)
+    words = (match.group(1) if match else text).split()
+    gist = " ".join(words[:max_words])
+    return gist + ("…" if len(words) > max_words else "")
+
+
+def extractive_summarizer(summary: str, user_text: str, reply_text: str, speaker: str) -> str:
+    """Default summarizer: appends the gist of a turn without an LLM call."""
+    line = f"User said: {_gist(user_text)} {speaker} replied: {_gist(reply_text)}"
+    return f"{summary}\n{line}" if summary else line
+
+
+class ConversationMemory:
+    """Per-session conversation state kept in a SessionStore.
+
+    A turn costs one store read (`load`) before generation and one write
+    (`record`) after it; `render` works on the loaded state without I/O.
+    Concurrent turns of one session are last-writer-wins: each records onto
+    the state it loaded, so the later write drops the other turn.
+
+    Args:
+        namespace: Key prefix separating personas that share a store.
+        store: Backend; defaults to the process-wide store (SESSION_BACKEND).
+        token_budget: Max tokens of verbatim recent turns.
+        summary_tokens: Max tokens of the running summary; oldest lines drop first.
+        summarizer: (summary, user_text, reply_text, speaker) -> new summary.
+        ttl_seconds: Idle time after which a session is forgotten.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        store: Optional[SessionStore] = None,
+        token_budget: int = MEMORY_TOKEN_BUDGET,
+        summary_tokens: int = MEMORY_SUMMARY_TOKENS,
+        summarizer: Callable[[str, str, str, str], str] = extractive_summarizer,
+        ttl_seconds: float = MEMORY_SESSION_TTL,
+    ):
+        self.namespace = namespace
+        self._store = store
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.summarizer = summarizer
+        self.ttl_seconds = ttl_seconds
+
+    @property
+    def store(self) -> SessionStore:
+        # Resolved lazily so importing a persona module never opens a connection
+        if self._store is None:
+            self._store = get_session_store()
+        return self._store
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.namespace}:{session_id}"
+
+    def load(self, session_id: Optional[str]) -> dict:
+        """Fetch the session's state (empty for new or anonymous sessions)."""
+        if not session_id:
+            return {}
+        return self.store.get(self._key(session_id)) or {}
+
+    def render(self, state: dict, speaker: str) -> str:
+        """History block for the prompt: summary first, then recent turns."""
+        lines: List[str] = []
+        if state.get("summary"):
+            lines.append(f"Summary of earlier conversation:\n{state['summary']}\n")
+        for user_text, reply_text in state.get("turns", []):
+            lines.append(f"User: {user_text}\n{speaker}: {reply_text}")
+        return "\n".join(lines)
+
+    def record(self, session_id: Optional[str], state: dict, user_text: str, reply_text: str, speaker: str) -> None:
+        """Add a completed turn to `state`, compact it and write it back."""
+        if not session_id:
+            return
+        state = {"summary": state.get("summary", ""), "turns": list(state.get("turns", []))}
+        state["turns"].append([user_text, reply_text])
+        self._compact(state, speaker)
+        self.store.set(self._key(session_id), state, ttl=self.ttl_seconds)
+
+    def _compact(self, state: dict, speaker: str) -> None:
+        turns = state["turns"]
+        # Always keep the latest turn verbatim, even if it alone exceeds the budget
+        while len(turns) > 1 and sum(count_tokens(u) + count_tokens(r) for u, r in turns) > self.token_budget:
+            user_text, reply_text = turns.pop(0)
+            state["summary"] = self.summarizer(state["summary"], user_text, reply_text, speaker)
+        summary_lines = state["summary"].split("\n") if state["summary"] else []
+        while len(summary_lines) > 1 and count_tokens("\n".join(summary_lines)) > self.summary_tokens:
+            summary_lines.pop(0)
+        state["summary"] = "\n".join(summary_lines)
+
+    def clear(self, session_id: str) -> None:
+        self.store.delete(self._key(session_id))
@@ -0,0 +1,119 @@
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_query(text: str) -> str:
+    """Canonical cache key for a query: lowercased with collapsed whitespace.
+
+    MiniLM uses an uncased tokenizer, so lowercasing does not change the vector
+    and lets "I feel anxious" and "i feel  anxious " share one entry.
+    """
+    return " ".join(text.lower().split())
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Bounded, thread-safe LRU cache in front of an embedding model.
+
+    Only `embed_query` is cached; `embed_documents` is used for index building
+    and passes straight through. Entries evicted from memory can optionally be
+    spilled to a SQLite file and are promoted back on the next lookup.
+    """
+
+    def __init__(self, base: Embeddings, max_size: int = 1024, spill_path: Optional[str] = None):
+        self.base = base
+        self.max_size = max(0, max_size)
+        self.spill_path = spill_path
+        self.hits = 0
+        self.spill_hits = 0
+        self.misses = 0
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._spill = None
+        if spill_path:
+            self._spill = sqlite3.connect(spill_path, check_same_thread=False)
+            self._spill.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings (query TEXT PRIMARY KEY, vector TEXT NOT NULL)"
+            )
+            self._spill.commit()
+
+    # ---------- Embeddings interface ----------
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return list(vector)
+
+        vector = self._read_spill(key)
+        if vector is not None:
+            with self._lock:
+                self.spill_hits += 1
+        else:
+            vector = self.base.embed_query(key)
+            with self._lock:
+                self.misses += 1
+
+        self._put(key, vector)
+        return list(vector)
+
+    # ---------- Cache internals ----------
+    def _put(self, key: str, vector: List[float]) -> None:
+        if self.max_size == 0:
+            return
+        evicted = []
+        with self._lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                evicted.append(self._cache.popitem(last=False))
+        if evicted:
+            self._write_spill(evicted)
+
+    def _read_spill(self, key: str) -> Optional[List[float]]:
+        if self._spill is None:
+            return None
+        with self._spill_lock:
+            row = self._spill.execute(
+                "SELECT vector FROM query_embeddings WHERE query = ?", (key,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _write_spill(self, items) -> None:
+        if self._spill is None:
+            return
+        with self._spill_lock:
+            self._spill.executemany(
+                "INSERT OR REPLACE INTO query_embeddings (query, vector) VALUES (?, ?)",
+                [(key, json.dumps(vector)) for key, vector in items],
+            )
+            self._spill.commit()
+
+    def clear(self) -> None:
+        """Drop all in-memory entries and reset counters (the spill file is kept)."""
+        with self._lock:
+            self._cache.clear()
+            self.hits = self.spill_hits = self.misses = 0
+
+    def stats(self) -> dict:
+        """Hit/miss counters for monitoring how much embedding work is saved."""
+        with self._lock:
+            lookups = self.hits + self.spill_hits + self.misses
+            return {
+                "size": len(self._cache),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "spill_hits": self.spill_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.spill_hits) / lookups if lookups else 0.0,
+            }
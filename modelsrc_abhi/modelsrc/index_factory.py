@@ -0,0 +1,257 @@
+"""Configurable FAISS index types for the therapist vectorstore.
+
+Supported types (FAISS_INDEX_TYPE):
+    flat   exact search, memory grows with dim * 4 bytes per vector (default)
+    ivf    inverted lists over k-means centroids; searches FAISS_NPROBE lists
+    hnsw   graph index, no training, fast queries, no in-place deletions
+    ivfpq  IVF with product-quantized vectors for large memory savings
+
+All types use the L2 metric so relevance scores stay comparable across them.
+
+Usage:
+    python index_factory.py --eval        # recall@k and latency vs flat
+"""
+
+import logging
+import math
+import os
+import time
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.faiss import dependable_faiss_import
+
+logger = logging.getLogger("index_factory")
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+
+
+def settings_from_env() -> dict:
+    """Index settings from FAISS_* environment variables."""
+    settings = {
+        "index_type": os.getenv("FAISS_INDEX_TYPE", "flat").lower(),
+        "nlist": int(os.getenv("FAISS_NLIST", "0")),  # 0 = 4 * sqrt(n)
+        "nprobe": int(os.getenv("FAISS_NPROBE", "8")),
+        "hnsw_m": int(os.getenv("FAISS_HNSW_M", "32")),
+        "ef_construction": int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "64")),
+        "ef_search": int(os.getenv("FAISS_HNSW_EF_SEARCH", "64")),
+        "pq_m": int(os.getenv("FAISS_PQ_M", "16")),
+        "pq_bits": int(os.getenv("FAISS_PQ_BITS", "8")),
+    }
+    if settings["index_type"] not in INDEX_TYPES:
+        raise ValueError(f"FAISS_INDEX_TYPE must be one of {INDEX_TYPES}, got {settings['index_type']!r}")
+    return settings
+
+
+def effective_index_type(n: int, dim: int, index_type: str = "flat", pq_m: int = 16, pq_bits: int = 8, **_) -> str:
+    """Type create_index actually builds for `n` vectors of dimension `dim`.
+
+    ivfpq falls back to flat when the vectors cannot train its codebooks.
+    """
+    if index_type == "ivfpq" and (dim % pq_m != 0 or n < 2 ** pq_bits):
+        return "flat"
+    return index_type
+
+
+def create_index(
+    vectors: np.ndarray,
+    index_type: str = "flat",
+    nlist: int = 0,
+    nprobe: int = 8,
+    hnsw_m: int = 32,
+    ef_construction: int = 64,
+    ef_search: int = 64,
+    pq_m: int = 16,
+    pq_bits: int = 8,
+):
+    """Create an empty (but trained, where required) FAISS index for `vectors`.
+
+    `vectors` is only used to size and train the index; the caller adds them.
+    Types that cannot be trained on so few vectors fall back to flat.
+    """
+    faiss = dependable_faiss_import()
+    n, dim = vectors.shape
+
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dim)
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+        index.hnsw.efSearch = ef_search
+        return index
+
+    nlist = nlist or max(1, int(4 * math.sqrt(n)))
+    # k-means wants ~39 points per centroid; fewer trains poorly
+    nlist = max(1, min(nlist, n // 39 or 1))
+    quantizer = faiss.IndexFlatL2(dim)
+    if index_type == "ivf":
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_L2)
+    elif index_type == "ivfpq":
+        if effective_index_type(n, dim, index_type, pq_m=pq_m, pq_bits=pq_bits) == "flat":
+            logger.warning("ivfpq needs dim %% pq_m == 0 and >= %d vectors; using flat", 2 ** pq_bits)
+            return faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_bits)
+    else:
+        raise ValueError(f"Unknown index type {index_type!r}; expected one of {INDEX_TYPES}")
+
+    index.train(np.ascontiguousarray(vectors, dtype=np.float32))
+    index.nprobe = min(nprobe, nlist)
+    ensure_direct_map(index)
+    return index
+
+
+def ensure_direct_map(index) -> None:
+    """Let IVF indexes reconstruct vectors by position.
+
+    LangChain's MMR search calls index.reconstruct(), which IVF indexes only
+    support with a direct map. It is kept up to date by later adds and is
+    persisted by write_index. Other index types are left alone.
+    """
+    faiss = dependable_faiss_import()
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return
+    if ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.make_direct_map()
+
+
+def apply_search_params(index, nprobe: int = 8, ef_search: int = 64, **_) -> None:
+    """Set query-time knobs on a loaded index (they are not all persisted)."""
+    faiss = dependable_faiss_import()
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+        return
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return
+    ivf.nprobe = min(nprobe, ivf.nlist)
+
+
+def supports_removal(index) -> bool:
+    """Whether LangChain's FAISS.delete works on this index.
+
+    It assumes remove_ids compacts the remaining ids, which only flat indexes
+    do; IVF keeps sparse ids and HNSW graphs cannot delete at all.
+    """
+    faiss = dependable_faiss_import()
+    return isinstance(index, faiss.IndexFlat)
+
+
+def reconstruct_vectors(index, positions: List[int]) -> np.ndarray:
+    """Stored vectors at `positions` (exact for flat, HNSW and IVF-Flat)."""
+    ensure_direct_map(index)
+    return np.vstack([index.reconstruct(int(i)) for i in positions]) if positions else np.empty((0, index.d))
+
+
+def index_type_of(index) -> str:
+    faiss = dependable_faiss_import()
+    if hasattr(index, "hnsw"):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def build_vectorstore(
+    text_embeddings: List[Tuple[str, List[float]]],
+    embeddings,
+    metadatas: Optional[Iterable[dict]] = None,
+    ids: Optional[List[str]] = None,
+    **settings,
+) -> FAISS:
+    """LangChain FAISS vectorstore backed by the configured index type."""
+    vectors = np.asarray([vector for _, vector in text_embeddings], dtype=np.float32)
+    index = create_index(vectors, **settings)
+    vectorstore = FAISS(embeddings, index, InMemoryDocstore(), {})
+    vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+    return vectorstore
+
+
+# ---------- Evaluation ----------
+def evaluate_indexes(base: np.ndarray, queries: np.ndarray, k_values=(1, 3, 10), settings_list=None) -> List[dict]:
+    """Recall@k and per-query latency of each index type against exact search.
+
+    Args:
+        base: Vectors to index.
+        queries: Held-out query vectors (not contained in `base`).
+        settings_list: Index settings dicts to compare; defaults to every type.
+
+    Returns:
+        One result dict per index type.
+    """
+    faiss = dependable_faiss_import()
+    base = np.ascontiguousarray(base, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    max_k = min(max(k_values), len(base))
+    if settings_list is None:
+        settings_list = [dict(settings_from_env(), index_type=t) for t in INDEX_TYPES]
+
+    exact = faiss.IndexFlatL2(base.shape[1])
+    exact.add(base)
+    _, truth = exact.search(queries, max_k)
+
+    results = []
+    for settings in settings_list:
+        start = time.perf_counter()
+        index = create_index(base, **settings)
+        index.add(base)
+        build_seconds = time.perf_counter() - start
+
+        latencies = []
+        found = np.empty_like(truth)
+        for i in range(len(queries)):
+            t = time.perf_counter()
+            _, found[i : i + 1] = index.search(queries[i : i + 1], max_k)
+            latencies.append((time.perf_counter() - t) * 1000)
+
+        recall = {}
+        for k in k_values:
+            k = min(k, max_k)
+            hits = sum(len(set(found[i, :k]) & set(truth[i, :k])) for i in range(len(queries)))
+            recall[f"recall@{k}"] = round(hits / (k * len(queries)), 4)
+
+        results.append({
+            "index_type": index_type_of(index),
+            "requested": settings["index_type"],
+            "build_seconds": round(build_seconds, 4),
+            "index_bytes": int(faiss.serialize_index(index).size),
+            "latency_ms_p50": round(float(np.percentile(latencies, 50)), 4),
+            "latency_ms_p95": round(float(np.percentile(latencies, 95)), 4),
+            **recall,
+        })
+    return results
+
+
+def main():
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Compare FAISS index types on the therapist corpus.")
+    parser.add_argument("--eval", action="store_true", help="Report recall@k and latency against flat")
+    parser.add_argument("--holdout", type=float, default=0.1, help="Fraction of rows used as queries")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if not args.eval:
+        parser.print_help()
+        return
+
+    import multimodel_therapist as therapist
+
+    docs = [doc for path in therapist.DATASET_PATHS for doc in therapist.load_json_data(path)]
+    vectors = np.asarray(therapist.get_embeddings().embed_documents([d.page_content for d in docs]), dtype=np.float32)
+    order = np.random.default_rng(args.seed).permutation(len(vectors))
+    n_queries = max(1, int(len(vectors) * args.holdout))
+    for row in evaluate_indexes(vectors[order[n_queries:]], vectors[order[:n_queries]]):
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
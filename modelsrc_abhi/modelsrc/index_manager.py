@@ -0,0 +1,297 @@
+"""Incremental maintenance of the therapist FAISS index.
+
+The saved index carries a manifest mapping the content hash of every dataset
+row to the file it came from. A sync embeds only rows whose hash is new, deletes
+rows that disappeared, and publishes the result by atomically repointing the
+index path (a symlink) at a freshly written version directory, so readers never
+observe a half-written index. Versions are written with index_store (memory-
+mapped FAISS index plus SQLite docstore, no pickles).
+
+Usage:
+    python index_manager.py            # sync faiss_index/ with the datasets
+    python index_manager.py --rebuild  # force a full re-embed
+"""
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from index_factory import (
+    apply_search_params,
+    build_vectorstore,
+    effective_index_type,
+    index_type_of,
+    reconstruct_vectors,
+    supports_removal,
+)
+from index_store import has_store, load_store, save_store
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locking, syncs must not overlap
+    fcntl = None
+
+logger = logging.getLogger("index_manager")
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def row_hash(row: dict) -> str:
+    """Stable content hash of a dataset row, used as its docstore id."""
+    canonical = json.dumps(row, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def load_rows(dataset_paths: Iterable[str]) -> "OrderedDict[str, Tuple[dict, str]]":
+    """Read every dataset and key rows by content hash (exact duplicates collapse)."""
+    rows: "OrderedDict[str, Tuple[dict, str]]" = OrderedDict()
+    for path in dataset_paths:
+        with open(path, "r") as f:
+            data = json.load(f)
+        source = os.path.basename(path)
+        for row in data:
+            rows.setdefault(row_hash(row), (row, source))
+    return rows
+
+
+def read_manifest(index_path: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(index_path, MANIFEST_NAME), "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+
+@contextlib.contextmanager
+def sync_lock(index_path: str):
+    """Serialize syncs across processes (e.g. several uvicorn workers booting)."""
+    if fcntl is None:
+        yield
+        return
+    with open(f"{index_path}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _publish(index_path: str, version_dir: str) -> None:
+    """Atomically point `index_path` at `version_dir` and drop stale versions.
+
+    The previous version is kept so a process that resolved the old symlink a
+    moment ago can still finish loading it.
+    """
+    previous = os.path.realpath(index_path) if os.path.islink(index_path) else None
+    if os.path.isdir(index_path) and not os.path.islink(index_path):
+        # One-time migration of a plain directory written by save_local
+        os.rename(index_path, f"{index_path}.legacy-{int(time.time())}")
+
+    tmp_link = f"{index_path}.link-{os.getpid()}"
+    os.symlink(os.path.basename(version_dir), tmp_link)
+    os.replace(tmp_link, index_path)
+
+    parent = os.path.dirname(index_path) or "."
+    prefix = os.path.basename(index_path) + ".v"
+    keep = {os.path.realpath(version_dir), previous}
+    for name in os.listdir(parent):
+        candidate = os.path.realpath(os.path.join(parent, name))
+        if name.startswith(prefix) and candidate not in keep:
+            shutil.rmtree(candidate, ignore_errors=True)
+
+
+def save_index(
+    vectorstore, index_path: str, rows: Dict[str, str], embed_model: str, requested_type: Optional[str] = None
+) -> None:
+    """Write `vectorstore` plus its manifest to a new version and publish it.
+
+    Args:
+        rows: Mapping of row hash -> source file for every indexed row.
+        requested_type: Configured index type, when it differs from the one
+            built (ivfpq falls back to flat on small corpora).
+    """
+    index_type = index_type_of(vectorstore.index)
+    version_dir = f"{index_path}.v{time.time_ns()}"
+    save_store(vectorstore, version_dir)
+    with open(os.path.join(version_dir, MANIFEST_NAME), "w") as f:
+        json.dump({
+            "version": MANIFEST_VERSION,
+            "embed_model": embed_model,
+            "index_type": index_type,
+            "requested_index_type": requested_type or index_type,
+            "dim": vectorstore.index.d,
+            "rows": rows,
+        }, f)
+    _publish(index_path, version_dir)
+
+
+def _rebuild_without(vectorstore, removed: List[str], settings: dict):
+    """Rebuild an index that cannot delete in place (HNSW, IVF) from its stored vectors."""
+    removed = set(removed)
+    keep = [(i, doc_id) for i, doc_id in vectorstore.index_to_docstore_id.items() if doc_id not in removed]
+    docs = [vectorstore.docstore.search(doc_id) for _, doc_id in keep]
+    vectors = reconstruct_vectors(vectorstore.index, [i for i, _ in keep])
+    return build_vectorstore(
+        [(doc.page_content, vector.tolist()) for doc, vector in zip(docs, vectors)],
+        vectorstore.embedding_function,
+        metadatas=[doc.metadata for doc in docs],
+        ids=[doc_id for _, doc_id in keep],
+        **settings,
+    )
+
+
+class IndexManager:
+    """Keeps a saved FAISS index in sync with one or more JSON datasets.
+
+    Args:
+        index_path: Path the serving code loads the index from.
+        dataset_paths: JSON files, each a list of row objects.
+        embeddings: Embedding model used for new rows and for queries.
+        to_document: Turns (row, row_hash, source) into the Document to index.
+        embed_model: Name recorded in the manifest; a change forces a rebuild.
+        index_settings: index_factory settings; changing the index type forces
+            a rebuild.
+        load_records: Reads the datasets into {content hash: (record, source)};
+            defaults to one record per raw row.
+    """
+
+    def __init__(
+        self,
+        index_path: str,
+        dataset_paths: List[str],
+        embeddings: Embeddings,
+        to_document: Callable[[dict, str, str], Document],
+        embed_model: str,
+        index_settings: Optional[dict] = None,
+        load_records: Callable[[List[str]], "OrderedDict[str, Tuple[dict, str]]"] = load_rows,
+    ):
+        self.index_path = index_path
+        self.dataset_paths = dataset_paths
+        self.embeddings = embeddings
+        self.to_document = to_document
+        self.embed_model = embed_model
+        self.index_settings = index_settings or {"index_type": "flat"}
+        self.load_records = load_records
+
+    def load(self, mmap: bool = True):
+        """Load the published index; mmap=False returns a mutable copy."""
+        if has_store(self.index_path):
+            vectorstore = load_store(self.index_path, self.embeddings, mmap=mmap)
+        else:
+            vectorstore = FAISS.load_local(self.index_path, self.embeddings, allow_dangerous_deserialization=True)
+        apply_search_params(vectorstore.index, **self.index_settings)
+        return vectorstore
+
+    def sync(self, rebuild: bool = False):
+        """Bring the saved index up to date and return (vectorstore, report).
+
+        `report` lists how many rows were added, removed and kept; when nothing
+        changed the existing index is loaded and nothing is written.
+        """
+        with sync_lock(self.index_path):
+            return self._sync(rebuild)
+
+    def _index_type_current(self, manifest: dict, n_rows: int) -> bool:
+        """Whether the saved index is what the configured type builds for `n_rows` rows."""
+        requested = self.index_settings["index_type"]
+        if manifest.get("requested_index_type", manifest.get("index_type")) != requested:
+            return False
+        if "dim" not in manifest:
+            return True
+        # E.g. an ivfpq corpus that has grown enough to train its codebooks
+        return manifest.get("index_type") == effective_index_type(n_rows, manifest["dim"], **self.index_settings)
+
+    def _sync(self, rebuild: bool):
+        start = time.perf_counter()
+        rows = self.load_records(self.dataset_paths)
+        if not rows:
+            raise ValueError(f"No rows found in {self.dataset_paths}")
+
+        manifest = None if rebuild else read_manifest(self.index_path)
+        if manifest is not None and not has_store(self.index_path):
+            # Pickled save_local output from before the SQLite docstore
+            manifest = None
+        if manifest is not None and manifest.get("embed_model") != self.embed_model:
+            logger.info("Embedding model changed; rebuilding the index")
+            manifest = None
+        if manifest is not None and not self._index_type_current(manifest, len(rows)):
+            logger.info("Index type changed to %s; rebuilding the index", self.index_settings["index_type"])
+            manifest = None
+
+        indexed: Dict[str, str] = manifest["rows"] if manifest else {}
+        added = [h for h in rows if h not in indexed]
+        removed = [h for h in indexed if h not in rows]
+        report = {"added": len(added), "removed": len(removed), "kept": len(rows) - len(added)}
+
+        if manifest is not None and not added and not removed:
+            report["seconds"] = time.perf_counter() - start
+            return self.load(), report
+
+        vectorstore = self.load(mmap=False) if manifest is not None else None
+        if vectorstore is not None and removed:
+            if supports_removal(vectorstore.index):
+                vectorstore.delete(removed)
+            elif index_type_of(vectorstore.index) != "ivfpq":
+                vectorstore = _rebuild_without(vectorstore, removed, self.index_settings)
+            else:
+                # PQ codes are lossy; rebuilding from them would compound the error
+                logger.info("Rows removed from an ivfpq index; re-embedding all rows")
+                vectorstore = None
+
+        to_embed = added if vectorstore is not None else list(rows)
+        new_docs = [self.to_document(rows[h][0], h, rows[h][1]) for h in to_embed]
+        if vectorstore is None:
+            texts = [doc.page_content for doc in new_docs]
+            vectorstore = build_vectorstore(
+                list(zip(texts, self.embeddings.embed_documents(texts))),
+                self.embeddings,
+                metadatas=[doc.metadata for doc in new_docs],
+                ids=to_embed,
+                **self.index_settings,
+            )
+        elif new_docs:
+            vectorstore.add_documents(new_docs, ids=to_embed)
+
+        save_index(
+            vectorstore,
+            self.index_path,
+            {h: source for h, (_, source) in rows.items()},
+            self.embed_model,
+            self.index_settings["index_type"],
+        )
+        # Serve from the memory-mapped copy so workers share one set of pages
+        vectorstore = self.load()
+
+        report["seconds"] = time.perf_counter() - start
+        logger.info("Index sync: %s", report)
+        return vectorstore, report
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sync the therapist FAISS index with its datasets.")
+    parser.add_argument("--rebuild", action="store_true", help="Re-embed every row from scratch")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    import multimodel_therapist
+
+    _, report = multimodel_therapist.sync_faiss_index(rebuild=args.rebuild)
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
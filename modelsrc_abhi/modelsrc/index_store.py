@@ -0,0 +1,164 @@
+"""Pickle-free on-disk format for the therapist vectorstore.
+
+A saved index directory contains:
+    index.faiss      the FAISS index, loaded memory-mapped and read-only
+    docstore.sqlite  one row per vector: position, docstore id, text, metadata
+
+Memory-mapping means every uvicorn worker shares the same page-cache copy of
+the vectors instead of holding a private one, and nothing is unpickled, so
+worker startup costs a couple of file opens regardless of corpus size.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import Mapping
+from typing import Dict, List, Union
+
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.faiss import dependable_faiss_import
+from langchain_core.documents import Document
+
+from index_factory import ensure_direct_map
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+
+
+def has_store(folder: str) -> bool:
+    """Whether `folder` was written by save_store (as opposed to save_local)."""
+    return os.path.exists(os.path.join(folder, DOCSTORE_FILE))
+
+
+class _ReadOnlyDB:
+    """One shared read-only SQLite connection.
+
+    The connection is opened eagerly so the store keeps working after a newer
+    index version is published and this one's files are unlinked.
+    """
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def fetchone(self, sql: str, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
+
+    def fetchall(self, sql: str, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+
+class SQLiteDocstore(Docstore):
+    """Read-only docstore served straight from docstore.sqlite."""
+
+    def __init__(self, db: _ReadOnlyDB):
+        self._db = db
+
+    def search(self, search: str) -> Union[str, Document]:
+        row = self._db.fetchone("SELECT page_content, metadata FROM docs WHERE id = ?", (search,))
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def delete(self, ids: List) -> None:
+        raise NotImplementedError("SQLiteDocstore is read-only; sync the index to change it")
+
+
+class SQLiteIdMap(Mapping):
+    """Read-only FAISS position -> docstore id mapping backed by docstore.sqlite."""
+
+    def __init__(self, db: _ReadOnlyDB):
+        self._db = db
+        self._len = db.fetchone("SELECT COUNT(*) FROM docs")[0]
+
+    def __getitem__(self, position: int) -> str:
+        row = self._db.fetchone("SELECT id FROM docs WHERE position = ?", (int(position),))
+        if row is None:
+            raise KeyError(position)
+        return row[0]
+
+    def __iter__(self):
+        return iter(p for (p,) in self._db.fetchall("SELECT position FROM docs ORDER BY position"))
+
+    def __len__(self) -> int:
+        return self._len
+
+
+def _read_index_mmap(path: str):
+    """Memory-map an index read-only.
+
+    Flat and HNSW storage is mapped with IO_FLAG_MMAP_IFC; IVF indexes need
+    IO_FLAG_MMAP instead, which maps their inverted lists.
+    """
+    faiss = dependable_faiss_import()
+    flat_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    index = faiss.read_index(path, flat_flag | faiss.IO_FLAG_READ_ONLY)
+    try:
+        faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return index
+    return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+
+
+def save_store(vectorstore: FAISS, folder: str) -> None:
+    """Write `vectorstore` to `folder` in the mmap/SQLite format."""
+    faiss = dependable_faiss_import()
+    os.makedirs(folder, exist_ok=True)
+    ensure_direct_map(vectorstore.index)
+    faiss.write_index(vectorstore.index, os.path.join(folder, INDEX_FILE))
+
+    db_path = os.path.join(folder, DOCSTORE_FILE)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(
+            "CREATE TABLE docs (position INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE,"
+            " page_content TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        rows = []
+        for position, doc_id in vectorstore.index_to_docstore_id.items():
+            doc = vectorstore.docstore.search(doc_id)
+            rows.append((int(position), doc_id, doc.page_content, json.dumps(doc.metadata)))
+        conn.executemany("INSERT INTO docs VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def load_store(folder: str, embeddings, mmap: bool = True) -> FAISS:
+    """Load a vectorstore written by save_store.
+
+    With mmap=True (serving) the index is memory-mapped read-only and documents
+    are fetched from SQLite on demand. With mmap=False everything is read into
+    mutable in-memory structures so the index can be updated and re-saved.
+    """
+    faiss = dependable_faiss_import()
+    index_path = os.path.join(folder, INDEX_FILE)
+    db_path = os.path.join(folder, DOCSTORE_FILE)
+
+    if mmap:
+        index = _read_index_mmap(index_path)
+        # Stores saved before IVF indexes kept a direct map (needed for MMR)
+        ensure_direct_map(index)
+        db = _ReadOnlyDB(db_path)
+        return FAISS(embeddings, index, SQLiteDocstore(db), SQLiteIdMap(db))
+
+    index = faiss.read_index(index_path)
+    ensure_direct_map(index)
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("SELECT position, id, page_content, metadata FROM docs ORDER BY position").fetchall()
+    finally:
+        conn.close()
+    docs: Dict[str, Document] = {}
+    id_map: Dict[int, str] = {}
+    for position, doc_id, page_content, metadata in rows:
+        docs[doc_id] = Document(id=doc_id, page_content=page_content, metadata=json.loads(metadata))
+        id_map[position] = doc_id
+    return FAISS(embeddings, index, InMemoryDocstore(docs), id_map)
@@ -0,0 +1,87 @@
+"""Typed ingestion of counselling transcripts into retrieval records.
+
+Dataset rows look like {"Context": <user's situation>, "Response": <counsellor
+reply>}. Many rows share the same Context with different Responses, so rows are
+grouped into one record per distinct situation:
+
+    {"context": str, "responses": [str, ...]}
+
+Only `context` is embedded (it is what a user query resembles); the responses
+travel as payload and are trimmed so a retrieved record adds a bounded number
+of tokens to the prompt.
+"""
+
+import json
+import logging
+import os
+import re
+from collections import OrderedDict
+from typing import Iterable, Tuple
+
+from index_manager import row_hash
+
+logger = logging.getLogger("ingestion")
+
+# Longest response kept per record (characters, cut at a sentence boundary)
+MAX_RESPONSE_CHARS = int(os.getenv("INGEST_MAX_RESPONSE_CHARS", "700"))
+# Distinct responses kept per context
+MAX_RESPONSES_PER_CONTEXT = int(os.getenv("INGEST_MAX_RESPONSES", "2"))
+
+_SENTENCE_END = re.compile(r"[.!?](?=\s|[A-Z]|$)")
+
+
+def clean_text(text: str) -> str:
+    """Collapse the whitespace runs and non-breaking spaces found in the dataset."""
+    # str.split() treats \u00a0 as whitespace too
+    return " ".join(text.split())
+
+
+def trim_response(text: str, max_chars: int = MAX_RESPONSE_CHARS) -> str:
+    """Shorten `text` to at most `max_chars`, preferring a sentence boundary."""
+    if len(text) <= max_chars:
+        return text
+    head = text[:max_chars]
+    ends = [m.end() for m in _SENTENCE_END.finditer(head)]
+    if ends and ends[-1] >= max_chars // 2:
+        return head[: ends[-1]].strip()
+    return head.rsplit(" ", 1)[0].rstrip(",;: ") + "…"
+
+
+def ingest_rows(rows: Iterable[Tuple[dict, str]]) -> "OrderedDict[str, Tuple[dict, str]]":
+    """Group (row, source) pairs into records keyed by record content hash.
+
+    Rows without a Context (or legacy "text") field are skipped. Responses are
+    cleaned, trimmed and deduplicated per context.
+    """
+    grouped: "OrderedDict[str, Tuple[dict, str]]" = OrderedDict()
+    skipped = 0
+    for row, source in rows:
+        context = clean_text(row.get("Context") or row.get("text") or "")
+        if not context:
+            skipped += 1
+            continue
+        record, _ = grouped.setdefault(context.lower(), ({"context": context, "responses": []}, source))
+        response = clean_text(row.get("Response") or "")
+        if response and len(record["responses"]) < MAX_RESPONSES_PER_CONTEXT:
+            response = trim_response(response)
+            if response not in record["responses"]:
+                record["responses"].append(response)
+    if skipped:
+        logger.warning("Skipped %d rows without a Context field", skipped)
+
+    return OrderedDict((row_hash(record), (record, source)) for record, source in grouped.values())
+
+
+def iter_dataset_rows(dataset_paths: Iterable[str]) -> Iterable[Tuple[dict, str]]:
+    """Yield (row, source file name) for every row of every dataset."""
+    for path in dataset_paths:
+        with open(path, "r") as f:
+            data = json.load(f)
+        source = os.path.basename(path)
+        for row in data:
+            yield row, source
+
+
+def load_records(dataset_paths: Iterable[str]) -> "OrderedDict[str, Tuple[dict, str]]":
+    """Read and ingest every dataset; drop-in loader for IndexManager."""
+    return ingest_rows(iter_dataset_rows(dataset_paths))
@@ -0,0 +1,554 @@
+"""Route chat calls across several LLM backends with timeouts, hedging and failover.
+
+Selected with LLM_BACKEND=router. Backends are tried in LLM_ROUTER_BACKENDS
+order:
+
+    timeout    a backend that has not produced its first token within its
+               timeout is abandoned and the next one is tried
+    hedging    when the first token takes longer than the backend's recent p95
+               time-to-first-token, a second request goes to the next backend
+               (or the same one when it is the only one); whichever produces a
+               token first wins and the other request is cancelled
+    failover   an error or 429 before the first token moves on to the next
+               backend; a 429 also benches the backend for its Retry-After
+               (or LLM_ROUTER_COOLDOWN) seconds
+
+Once tokens have been streamed to the caller the reply is committed to that
+backend; a later error, or a gap between chunks longer than the backend's
+timeout, is raised, not retried elsewhere.
+
+Routed calls run on one background event loop, also for sync callers, so a
+cancelled attempt (a losing hedge, a timeout, a caller that stopped reading)
+closes its upstream request instead of running on in a thread.
+
+    LLM_ROUTER_BACKENDS=groq,openai,local   preference order (see BACKENDS)
+    LLM_TIMEOUT_<NAME>=10                    first-token and between-chunk timeout
+    LLM_HEDGE=1                              enable hedged requests
+    LLM_HEDGE_AFTER_MS=1500                  hedge delay until a p95 is known
+    LLM_HEDGE_MIN_SAMPLES=20                 first-token samples needed for the p95
+    LLM_ROUTER_COOLDOWN=10                   seconds a rate-limited backend is skipped
+
+Backends:
+
+    groq     GROQ_API_KEY, GROQ_MODEL
+    openai   OPENAI_BASE_URL, OPENAI_API_KEY, OPENAI_MODEL
+    local    LOCAL_LLM_URL, LOCAL_LLM_MODEL (llama.cpp server, vLLM, Ollama, ...)
+    llamacpp in-process GGUF model, LLAMA_MODEL_PATH (see local_llm.py)
+    stub     stub_llm.StubChatModel
+
+For local testing, mock_llm_server.py serves the OpenAI-compatible API with
+configurable latency, errors and 429s.
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from response_cache import model_settings
+
+logger = logging.getLogger("llm_router")
+
+LLM_ROUTER_BACKENDS = [b.strip() for b in os.getenv("LLM_ROUTER_BACKENDS", "groq").split(",") if b.strip()]
+LLM_HEDGE = os.getenv("LLM_HEDGE", "1") != "0"
+LLM_HEDGE_AFTER_MS = float(os.getenv("LLM_HEDGE_AFTER_MS", "1500"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_ROUTER_COOLDOWN = float(os.getenv("LLM_ROUTER_COOLDOWN", "10"))
+DEFAULT_TIMEOUT = 10.0
+
+
+def backend_timeout(name: str) -> float:
+    return float(os.getenv(f"LLM_TIMEOUT_{name.upper()}", DEFAULT_TIMEOUT))
+
+
+# ---------- Backends ----------
+def _groq(timeout: float) -> BaseChatModel:
+    from langchain_groq import ChatGroq
+
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        raise RuntimeError("GROQ_API_KEY missing")
+    # No client-side retries: a 429 should fail over, not back off in place
+    return ChatGroq(
+        groq_api_key=api_key,
+        model_name=os.getenv("GROQ_MODEL", "llama-3.1-8b-instant"),
+        request_timeout=timeout,
+        max_retries=0,
+    )
+
+
+def _openai(timeout: float) -> BaseChatModel:
+    from openai_compat_llm import OpenAICompatChatModel
+
+    model = os.getenv("OPENAI_MODEL")
+    if not model:
+        raise RuntimeError("OPENAI_MODEL missing")
+    return OpenAICompatChatModel(
+        base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+        api_key=os.getenv("OPENAI_API_KEY"),
+        model=model,
+        timeout=timeout,
+    )
+
+
+def _local(timeout: float) -> BaseChatModel:
+    from openai_compat_llm import OpenAICompatChatModel
+
+    return OpenAICompatChatModel(
+        base_url=os.getenv("LOCAL_LLM_URL", "http://127.0.0.1:8080/v1"),
+        model=os.getenv("LOCAL_LLM_MODEL", "local"),
+        timeout=timeout,
+    )
+
+
+def _llamacpp(timeout: float) -> BaseChatModel:
+    import local_llm
+
+    # Load the model now, so a missing file or package skips the backend
+    local_llm.get_engine()
+    return local_llm.LlamaCppChatModel()
+
+
+def _stub(timeout: float) -> BaseChatModel:
+    from stub_llm import StubChatModel
+
+    return StubChatModel()
+
+
+# name -> factory(timeout seconds) returning a chat model
+BACKENDS: Dict[str, Callable[[float], BaseChatModel]] = {
+    "groq": _groq,
+    "openai": _openai,
+    "local": _local,
+    "llamacpp": _llamacpp,
+    "stub": _stub,
+}
+
+
+def register_backend(name: str, factory: Callable[[float], BaseChatModel]) -> None:
+    """Make another backend available to LLM_ROUTER_BACKENDS and LLM_BACKEND."""
+    BACKENDS[name] = factory
+
+
+def is_rate_limited(e: BaseException) -> bool:
+    return getattr(e, "status_code", None) == 429 or type(e).__name__ == "RateLimitError"
+
+
+def _retry_after(e: BaseException) -> Optional[float]:
+    if getattr(e, "retry_after", None) is not None:
+        return e.retry_after
+    response = getattr(e, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+# ---------- Routing state ----------
+class Route:
+    """One backend with its first-token latency history and rate-limit state.
+
+    Args:
+        name: Backend name, for stats and logs.
+        model: The backend's chat model.
+        timeout: Seconds allowed until the first token, and between chunks.
+        window: First-token samples kept for the p95.
+    """
+
+    def __init__(self, name: str, model: BaseChatModel, timeout: float, window: int = 200):
+        self.name = name
+        self.model = model
+        self.timeout = timeout
+        self._ttft = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.hedges = 0
+        self.wins = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.rate_limited = 0
+
+    def available(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+    def hedge_after(self) -> float:
+        """Seconds to wait for the first token before hedging."""
+        with self._lock:
+            samples = sorted(self._ttft)
+        if len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_AFTER_MS / 1000
+        return samples[int(0.95 * (len(samples) - 1))]
+
+    def started(self, hedge: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            if hedge:
+                self.hedges += 1
+
+    def first_token(self, seconds: float) -> None:
+        with self._lock:
+            self._ttft.append(seconds)
+            self.wins += 1
+
+    def failed(self, e: BaseException) -> None:
+        with self._lock:
+            if isinstance(e, TimeoutError):
+                self.timeouts += 1
+            else:
+                self.errors += 1
+            if is_rate_limited(e):
+                self.rate_limited += 1
+                self.cooldown_until = time.monotonic() + (_retry_after(e) or LLM_ROUTER_COOLDOWN)
+
+    def stats(self) -> dict:
+        p95 = self.hedge_after() if len(self._ttft) >= LLM_HEDGE_MIN_SAMPLES else None
+        with self._lock:
+            return {
+                "name": self.name,
+                "timeout": self.timeout,
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "wins": self.wins,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "rate_limited": self.rate_limited,
+                "cooling_down": not self.available(time.monotonic()),
+                "ttft_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            }
+
+
+class _Attempt:
+    """One request to one backend within a routed call."""
+
+    def __init__(self, route: Route, hedge: bool):
+        self.route = route
+        self.hedge = hedge
+        self.started = time.monotonic()
+        self.deadline = self.started + route.timeout
+        self.cancelled = False
+        self.task: Optional[asyncio.Task] = None
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        if self.task is not None:
+            self.task.cancel()
+
+
+class _Race:
+    """Bookkeeping for one routed call: running attempts and what to start next.
+
+    The driver (RouterChatModel._race) only moves chunks and starts or cancels
+    the attempts this class hands them.
+    """
+
+    def __init__(self, routes: List[Route], hedge: bool):
+        self.pending = list(routes)
+        self.solo = routes[0] if len(routes) == 1 else None
+        self.hedge = hedge
+        self.hedged = False
+        self.live: List[_Attempt] = []
+        self.error: Optional[BaseException] = None
+
+    def next_attempt(self, hedge: bool = False) -> Optional[_Attempt]:
+        if self.pending:
+            route = self.pending.pop(0)
+        elif hedge and self.solo is not None:
+            route = self.solo
+        else:
+            return None
+        route.started(hedge)
+        attempt = _Attempt(route, hedge)
+        self.live.append(attempt)
+        return attempt
+
+    def _can_hedge(self) -> bool:
+        return (
+            self.hedge and not self.hedged and len(self.live) == 1
+            and bool(self.pending or self.solo is not None)
+        )
+
+    def _hedge_at(self) -> float:
+        primary = self.live[0]
+        return primary.started + primary.route.hedge_after()
+
+    def wait_time(self) -> float:
+        """Seconds until the next first-token timeout or hedge is due."""
+        due = [a.deadline for a in self.live]
+        if self._can_hedge():
+            due.append(self._hedge_at())
+        return max(0.0, min(due) - time.monotonic())
+
+    def _drop(self, attempt: _Attempt, e: BaseException) -> Optional[_Attempt]:
+        attempt.cancel()
+        self.live.remove(attempt)
+        attempt.route.failed(e)
+        self.error = e
+        logger.warning("LLM backend %s failed: %s", attempt.route.name, e)
+        if self.live:
+            return None
+        replacement = self.next_attempt()
+        if replacement is None:
+            raise self.error
+        return replacement
+
+    def on_timer(self) -> List[_Attempt]:
+        """Apply due timeouts and hedges; returns the attempts to start."""
+        now = time.monotonic()
+        started = []
+        for attempt in [a for a in self.live if now >= a.deadline]:
+            e = TimeoutError(f"no first token from {attempt.route.name} within {attempt.route.timeout}s")
+            replacement = self._drop(attempt, e)
+            if replacement is not None:
+                started.append(replacement)
+        if self._can_hedge() and now >= self._hedge_at():
+            self.hedged = True
+            started.append(self.next_attempt(hedge=True))
+        return started
+
+    def on_error(self, attempt: _Attempt, e: BaseException) -> Optional[_Attempt]:
+        """Record a failed attempt; returns a replacement to start, if needed."""
+        return self._drop(attempt, e)
+
+    def on_first(self, winner: _Attempt) -> None:
+        winner.route.first_token(time.monotonic() - winner.started)
+        for attempt in self.live:
+            if attempt is not winner:
+                attempt.cancel()
+        self.live = [winner]
+
+    def cancel_all(self) -> None:
+        for attempt in self.live:
+            attempt.cancel()
+
+
+# ---------- Router loop ----------
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_LOOP_LOCK = threading.Lock()
+
+
+def _router_loop() -> asyncio.AbstractEventLoop:
+    """Event loop thread that runs every routed call.
+
+    Sync and async callers alike get their chunks relayed from here, so an
+    abandoned attempt is a task that can be cancelled (closing its upstream
+    request) and each backend's async client only ever sees one loop.
+    """
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-router", daemon=True).start()
+            _LOOP = loop
+        return _LOOP
+
+
+# ---------- Router model ----------
+class RouterChatModel(BaseChatModel):
+    """Chat model that routes each call over `routes` (see module docstring).
+
+    Args:
+        routes: Backends in preference order.
+        hedge: Send hedged requests for slow first tokens.
+    """
+
+    routes: List[Route]
+    hedge: bool = LLM_HEDGE
+
+    @property
+    def _llm_type(self) -> str:
+        return "router"
+
+    @property
+    def _default_params(self) -> Dict[str, Any]:
+        return {"routes": [model_settings(route.model) for route in self.routes]}
+
+    def _plan(self) -> List[Route]:
+        # Rate-limited backends are skipped while any other is available
+        now = time.monotonic()
+        return [r for r in self.routes if r.available(now)] or list(self.routes)
+
+    async def _apump(self, attempt: _Attempt, messages, stop, kwargs, events: asyncio.Queue) -> None:
+        try:
+            async for message in attempt.route.model.astream(messages, stop=stop, **kwargs):
+                events.put_nowait((attempt, "chunk", message))
+            events.put_nowait((attempt, "done", None))
+        except Exception as e:
+            events.put_nowait((attempt, "error", e))
+
+    async def _race(self, messages, stop, kwargs) -> AsyncIterator[BaseMessage]:
+        race = _Race(self._plan(), self.hedge)
+        events: asyncio.Queue = asyncio.Queue()
+
+        def launch(attempt: _Attempt) -> None:
+            attempt.task = asyncio.create_task(self._apump(attempt, messages, stop, kwargs, events))
+
+        launch(race.next_attempt())
+        winner = None
+        try:
+            while True:
+                try:
+                    attempt, kind, value = await asyncio.wait_for(
+                        events.get(), winner.route.timeout if winner else race.wait_time()
+                    )
+                except asyncio.TimeoutError:
+                    if winner is not None:
+                        e = TimeoutError(f"{winner.route.name} sent nothing for {winner.route.timeout}s mid-reply")
+                        winner.route.failed(e)
+                        raise e
+                    for attempt in race.on_timer():
+                        launch(attempt)
+                    continue
+                if attempt.cancelled:
+                    continue
+                if kind == "error":
+                    if winner is not None:
+                        raise value
+                    replacement = race.on_error(attempt, value)
+                    if replacement is not None:
+                        launch(replacement)
+                    continue
+                if winner is None:
+                    winner = attempt
+                    race.on_first(attempt)
+                if kind == "done":
+                    return
+                yield value
+        finally:
+            race.cancel_all()
+
+    async def _relay(self, messages, stop, kwargs, emit: Callable[[tuple], None]) -> None:
+        try:
+            async for message in self._race(messages, stop, kwargs):
+                emit(("chunk", message))
+            emit(("done", None))
+        except Exception as e:
+            emit(("error", e))
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        events: queue.Queue = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(
+            self._relay(messages, stop, kwargs, events.put), _router_loop()
+        )
+        try:
+            while True:
+                kind, value = events.get()
+                if kind == "error":
+                    raise value
+                if kind == "done":
+                    return
+                if run_manager:
+                    run_manager.on_llm_new_token(value.content)
+                yield ChatGenerationChunk(message=value)
+        finally:
+            # Cancels the race task, which closes every upstream request
+            future.cancel()
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+
+        def emit(event: tuple) -> None:
+            loop.call_soon_threadsafe(events.put_nowait, event)
+
+        future = asyncio.run_coroutine_threadsafe(self._relay(messages, stop, kwargs, emit), _router_loop())
+        try:
+            while True:
+                kind, value = await events.get()
+                if kind == "error":
+                    raise value
+                if kind == "done":
+                    return
+                if run_manager:
+                    await run_manager.on_llm_new_token(value.content)
+                yield ChatGenerationChunk(message=value)
+        finally:
+            future.cancel()
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        text = "".join(chunk.text for chunk in self._stream(messages, stop, run_manager, **kwargs))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        parts = [chunk.text async for chunk in self._astream(messages, stop, run_manager, **kwargs)]
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(parts)))])
+
+    def stats(self) -> dict:
+        return {"hedge": self.hedge, "routes": [route.stats() for route in self.routes]}
+
+
+# ---------- Construction ----------
+def build_router(names: Optional[List[str]] = None) -> RouterChatModel:
+    """Router over the named backends; backends missing configuration are skipped."""
+    routes = []
+    for name in names or LLM_ROUTER_BACKENDS:
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown LLM backend {name!r}; known: {', '.join(sorted(BACKENDS))}")
+        timeout = backend_timeout(name)
+        try:
+            routes.append(Route(name, BACKENDS[name](timeout), timeout))
+        except RuntimeError as e:
+            logger.warning("Skipping LLM backend %s: %s", name, e)
+    if not routes:
+        raise RuntimeError("No usable LLM backend in LLM_ROUTER_BACKENDS")
+    return RouterChatModel(routes=routes)
+
+
+_ROUTER: Optional[RouterChatModel] = None
+_ROUTER_LOCK = threading.Lock()
+
+
+def get_router() -> RouterChatModel:
+    """Process-wide router, so both personas share latency history and cooldowns."""
+    global _ROUTER
+    with _ROUTER_LOCK:
+        if _ROUTER is None:
+            _ROUTER = build_router()
+        return _ROUTER
+
+
+def build_llm(name: str) -> BaseChatModel:
+    """Chat model for an LLM_BACKEND value: "router" or a single backend name."""
+    if name == "router":
+        return get_router()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM_BACKEND {name!r}; use router or one of {', '.join(sorted(BACKENDS))}")
+    return BACKENDS[name](backend_timeout(name))
+
+
+def stats() -> Optional[dict]:
+    """Router counters, or None when no router is in use."""
+    return _ROUTER.stats() if _ROUTER is not None else None
@@ -0,0 +1,448 @@
+"""Local CPU inference on a quantized GGUF chat model via llama.cpp.
+
+Selected with LLM_BACKEND=llamacpp, or listed as the llamacpp backend in
+LLM_ROUTER_BACKENDS (e.g. "groq,llamacpp" to fall back to the local model
+while the provider is failing or rate-limiting us).
+
+Concurrent requests are served with continuous batching. One llama.cpp context
+holds LLAMA_SLOTS sequences and a single scheduler thread owns it. Each step
+packs the next token of every generating sequence, plus prompt chunks of newly
+admitted requests, into one batch and runs one llama_decode over it, then
+samples a token per sequence. Requests therefore share forward passes, a
+finished request frees its slot for the next waiting one at once, and every
+token is streamed to its caller as soon as it is sampled.
+
+    LLAMA_MODEL_PATH          GGUF file (required), e.g. a Q4_K_M 1-3B chat model
+    LLAMA_SLOTS=4             concurrent sequences
+    LLAMA_SLOT_CTX=4096       context tokens per sequence (prompt + reply)
+    LLAMA_BATCH=512           tokens per decode step; long prompts are prefilled in chunks
+    LLAMA_THREADS=0           CPU threads (0 keeps the llama.cpp default)
+    LLAMA_MAX_TOKENS=512      reply length cap
+    LLAMA_TEMPERATURE=0.7
+    LLAMA_TOP_K=40
+    LLAMA_TOP_P=0.95
+
+Needs the optional llama-cpp-python package, imported on first use.
+"""
+
+import asyncio
+import atexit
+import codecs
+import os
+import queue
+import threading
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+LLAMA_MODEL_PATH = os.getenv("LLAMA_MODEL_PATH", "")
+LLAMA_SLOTS = int(os.getenv("LLAMA_SLOTS", "4"))
+LLAMA_SLOT_CTX = int(os.getenv("LLAMA_SLOT_CTX", "4096"))
+LLAMA_BATCH = int(os.getenv("LLAMA_BATCH", "512"))
+LLAMA_THREADS = int(os.getenv("LLAMA_THREADS", "0"))
+LLAMA_MAX_TOKENS = int(os.getenv("LLAMA_MAX_TOKENS", "512"))
+LLAMA_TEMPERATURE = float(os.getenv("LLAMA_TEMPERATURE", "0.7"))
+LLAMA_TOP_K = int(os.getenv("LLAMA_TOP_K", "40"))
+LLAMA_TOP_P = float(os.getenv("LLAMA_TOP_P", "0.95"))
+
+_ROLES = {"system": "system", "human": "user", "ai": "assistant"}
+
+# Used when the GGUF file carries no chat template
+_CHATML = (
+    "{% for m in messages %}<|im_start|>{{ m['role'] }}\n{{ m['content'] }}<|im_end|>\n{% endfor %}"
+    "{% if add_generation_prompt %}<|im_start|>assistant\n{% endif %}"
+)
+
+
+def _import_llama():
+    try:
+        import llama_cpp
+        from llama_cpp import _internals, llama_chat_format
+    except ImportError as e:
+        raise RuntimeError("llama-cpp-python is not installed (pip install llama-cpp-python)") from e
+    return llama_cpp, _internals, llama_chat_format
+
+
+# ---------- Engine ----------
+class _Request:
+    """One generation; occupies a slot (sequence id) of the engine while running."""
+
+    def __init__(self, prompt: List[int], max_tokens: int, temperature: float, top_k: int,
+                 top_p: float, stop: Optional[List[str]], emit: Callable[[Any], None]):
+        self.prompt = prompt
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.top_k = top_k
+        self.top_p = top_p
+        self.stop = [s for s in (stop or []) if s]
+        self.emit = emit  # receives text pieces, then None, or an exception
+        self.cancelled = False
+        self.slot: Optional[int] = None
+        self.pos = 0  # tokens of this sequence in the KV cache
+        self.last: Optional[int] = None  # sampled token to feed in the next step
+        self.generated = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self._held = ""  # tail that could still become a stop string
+
+    def push(self, piece: bytes) -> bool:
+        """Emit decoded text; returns True when a stop string ends the reply."""
+        text = self._held + self._decoder.decode(piece)
+        self._held = ""
+        for stop in self.stop:
+            index = text.find(stop)
+            if index >= 0:
+                if index:
+                    self.emit(text[:index])
+                return True
+        keep = max((len(s) for s in self.stop), default=1) - 1
+        if keep:
+            text, self._held = text[:-keep], text[-keep:]
+        if text:
+            self.emit(text)
+        return False
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        if error is None:
+            tail = self._held + self._decoder.decode(b"", final=True)
+            if tail:
+                self.emit(tail)
+        self.emit(error)
+
+
+class LlamaEngine:
+    """A GGUF model with one multi-sequence context and a continuous-batching scheduler.
+
+    Args:
+        model_path: GGUF file.
+        slots: Sequences decoded together.
+        slot_ctx: Context tokens per sequence.
+        n_batch: Tokens per decode step.
+        threads: CPU threads, or 0 for the llama.cpp default.
+    """
+
+    def __init__(self, model_path: str, slots: int = LLAMA_SLOTS, slot_ctx: int = LLAMA_SLOT_CTX,
+                 n_batch: int = LLAMA_BATCH, threads: int = LLAMA_THREADS):
+        if slots < 1 or slots > n_batch:
+            # Every generating sequence adds one token to each decode step
+            raise ValueError(f"LLAMA_SLOTS={slots} must be between 1 and LLAMA_BATCH={n_batch}")
+        llama_cpp, internals, chat_format = _import_llama()
+        self.model_path = model_path
+        self.slots = slots
+        self.slot_ctx = slot_ctx
+        self.n_batch = n_batch
+
+        self.model = internals.LlamaModel(
+            path_model=model_path, params=llama_cpp.llama_model_default_params(), verbose=False
+        )
+        params = llama_cpp.llama_context_default_params()
+        params.n_ctx = slots * slot_ctx  # split evenly between the sequences
+        params.n_batch = params.n_ubatch = n_batch
+        params.n_seq_max = slots
+        if threads:
+            params.n_threads = params.n_threads_batch = threads
+        self.ctx = internals.LlamaContext(model=self.model, params=params, verbose=False)
+        self._batch = internals.LlamaBatch(n_tokens=n_batch, embd=0, n_seq_max=1, verbose=False)
+
+        self.n_vocab = self.model.n_vocab()
+        self._eog = {t for t in (self.model.token_eos(), self.model.token_eot()) if t >= 0}
+        self._bos_text = self.model.token_get_text(self.model.token_bos()) if self.model.token_bos() >= 0 else ""
+        eos_text = self.model.token_get_text(self.model.token_eos()) if self.model.token_eos() >= 0 else ""
+        self._format = chat_format.Jinja2ChatFormatter(
+            template=self.model.metadata().get("tokenizer.chat_template", _CHATML),
+            eos_token=eos_text,
+            bos_token=self._bos_text,
+        )
+        self._rng = np.random.default_rng()
+
+        # Guards the queues and counters below for stats(). Only the engine
+        # thread changes _active (under the lock), so it may read it without
+        self._cond = threading.Condition()
+        self._waiting: deque = deque()
+        self._free = list(range(slots))
+        self._active: Dict[int, _Request] = {}
+        self._closed = False
+        self.requests = 0
+        self.steps = 0
+        self.decoded_tokens = 0
+        self._thread = threading.Thread(target=self._run, name="llama-engine", daemon=True)
+        self._thread.start()
+
+    def tokenize(self, messages: List[dict]) -> List[int]:
+        prompt = self._format(messages=messages).prompt
+        add_bos = self.model.add_bos_token() and not (self._bos_text and prompt.startswith(self._bos_text))
+        return self.model.tokenize(prompt.encode("utf-8"), add_bos, True)
+
+    def submit(self, messages: List[dict], emit: Callable[[Any], None], max_tokens: int = LLAMA_MAX_TOKENS,
+               temperature: float = LLAMA_TEMPERATURE, top_k: int = LLAMA_TOP_K, top_p: float = LLAMA_TOP_P,
+               stop: Optional[List[str]] = None) -> _Request:
+        """Queue a chat completion; `emit` is called from the engine thread.
+
+        Returns the request; set its `cancelled` flag to stop generating.
+        """
+        prompt = self.tokenize(messages)
+        if len(prompt) >= self.slot_ctx:
+            raise ValueError(f"Prompt of {len(prompt)} tokens does not fit LLAMA_SLOT_CTX={self.slot_ctx}")
+        request = _Request(prompt, max_tokens, temperature, top_k, top_p, stop, emit)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("llama.cpp engine is closed")
+            self._waiting.append(request)
+            self.requests += 1
+            self._cond.notify()
+        return request
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed and not self._waiting and not self._active:
+                    self._cond.wait()
+                if self._closed:
+                    break
+                while self._waiting and self._free:
+                    request = self._waiting.popleft()
+                    if not request.cancelled:
+                        request.slot = self._free.pop()
+                        self._active[request.slot] = request
+            try:
+                self._step()
+            except Exception as e:
+                for request in list(self._active.values()):
+                    self._release(request, e)
+
+        closed = RuntimeError("llama.cpp engine is closed")
+        for request in list(self._active.values()) + list(self._waiting):
+            request.finish(closed)
+
+    def _add(self, token: int, pos: int, seq_id: int, logits: bool) -> int:
+        batch = self._batch.batch
+        i = batch.n_tokens
+        batch.token[i] = token
+        batch.pos[i] = pos
+        batch.n_seq_id[i] = 1
+        batch.seq_id[i][0] = seq_id
+        batch.logits[i] = logits
+        batch.n_tokens = i + 1
+        return i
+
+    def _step(self) -> None:
+        """Decode one batch across all active sequences and sample their next tokens."""
+        self._batch.reset()
+        to_sample = []
+        for request in list(self._active.values()):
+            if request.cancelled:
+                self._release(request)
+
+        # Generating sequences first, one token each, so a long prompt being
+        # prefilled does not stall the replies already streaming
+        for request in self._active.values():
+            if request.last is not None:
+                to_sample.append((self._add(request.last, request.pos, request.slot, True), request))
+                request.pos += 1
+        budget = self.n_batch - self._batch.batch.n_tokens
+        for request in self._active.values():
+            if request.last is not None or budget <= 0:
+                continue
+            chunk = request.prompt[request.pos:request.pos + budget]
+            for token in chunk:
+                last = request.pos == len(request.prompt) - 1
+                index = self._add(token, request.pos, request.slot, last)
+                request.pos += 1
+                if last:
+                    to_sample.append((index, request))
+            budget -= len(chunk)
+
+        if not self._batch.batch.n_tokens:
+            return
+        self.ctx.decode(self._batch)
+        with self._cond:
+            self.steps += 1
+            self.decoded_tokens += self._batch.batch.n_tokens
+
+        for index, request in to_sample:
+            token = self._sample(index, request)
+            request.generated += 1
+            if token in self._eog:
+                self._release(request)
+                continue
+            stopped = request.push(self.model.detokenize([token]))
+            if stopped or request.generated >= request.max_tokens or request.pos >= self.slot_ctx:
+                self._release(request)
+            else:
+                request.last = token
+
+    def _sample(self, index: int, request: _Request) -> int:
+        logits = np.ctypeslib.as_array(self.ctx.get_logits_ith(index), shape=(self.n_vocab,))
+        if request.temperature <= 0:
+            return int(np.argmax(logits))
+        top_k = min(request.top_k or self.n_vocab, self.n_vocab)
+        candidates = np.argpartition(-logits, top_k - 1)[:top_k] if top_k < self.n_vocab else np.arange(self.n_vocab)
+        scores = logits[candidates].astype(np.float64) / request.temperature
+        probs = np.exp(scores - scores.max())
+        probs /= probs.sum()
+        if request.top_p < 1.0:
+            order = np.argsort(-probs)
+            keep = order[: int(np.searchsorted(np.cumsum(probs[order]), request.top_p)) + 1]
+            candidates, probs = candidates[keep], probs[keep] / probs[keep].sum()
+        return int(self._rng.choice(candidates, p=probs))
+
+    def _release(self, request: _Request, error: Optional[BaseException] = None) -> None:
+        self.ctx.kv_cache_seq_rm(request.slot, -1, -1)
+        with self._cond:
+            del self._active[request.slot]
+            self._free.append(request.slot)
+        if not request.cancelled:
+            request.finish(error)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "model": os.path.basename(self.model_path),
+                "slots": self.slots,
+                "active": len(self._active),
+                "waiting": len(self._waiting),
+                "requests": self.requests,
+                "steps": self.steps,
+                "tokens_per_step": round(self.decoded_tokens / self.steps, 2) if self.steps else None,
+            }
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=30)
+
+
+_ENGINES: Dict[str, LlamaEngine] = {}
+_ENGINES_LOCK = threading.Lock()
+
+
+def get_engine(model_path: str = LLAMA_MODEL_PATH) -> LlamaEngine:
+    """Process-wide engine per model file (loading a model is expensive)."""
+    if not model_path:
+        raise RuntimeError("LLAMA_MODEL_PATH missing. Point it at a GGUF chat model")
+    with _ENGINES_LOCK:
+        if model_path not in _ENGINES:
+            engine = LlamaEngine(model_path)
+            atexit.register(engine.close)
+            _ENGINES[model_path] = engine
+        return _ENGINES[model_path]
+
+
+def stats() -> Optional[dict]:
+    """Counters of the loaded engines, or None when none is loaded."""
+    with _ENGINES_LOCK:
+        return {path: engine.stats() for path, engine in _ENGINES.items()} or None
+
+
+# ---------- Chat model ----------
+class LlamaCppChatModel(BaseChatModel):
+    """Chat model served by the shared local LlamaEngine; drop-in for ChatGroq.
+
+    Args:
+        model_path: GGUF file.
+        max_tokens: Reply length cap.
+        temperature: Sampling temperature (0 is greedy).
+        top_k: Sample among the k most likely tokens.
+        top_p: Nucleus sampling threshold.
+    """
+
+    model_path: str = LLAMA_MODEL_PATH
+    max_tokens: int = LLAMA_MAX_TOKENS
+    temperature: float = LLAMA_TEMPERATURE
+    top_k: int = LLAMA_TOP_K
+    top_p: float = LLAMA_TOP_P
+
+    @property
+    def _llm_type(self) -> str:
+        return "llamacpp"
+
+    @property
+    def _default_params(self) -> Dict[str, Any]:
+        return {
+            "model": os.path.basename(self.model_path),
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "top_k": self.top_k,
+            "top_p": self.top_p,
+        }
+
+    def _submit(self, messages: List[BaseMessage], stop: Optional[List[str]], emit) -> _Request:
+        return get_engine(self.model_path).submit(
+            [{"role": _ROLES.get(m.type, "user"), "content": m.content} for m in messages],
+            emit,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            top_k=self.top_k,
+            top_p=self.top_p,
+            stop=stop,
+        )
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        pieces: queue.Queue = queue.Queue()
+        request = self._submit(messages, stop, pieces.put)
+        try:
+            while True:
+                piece = pieces.get()
+                if piece is None:
+                    return
+                if isinstance(piece, BaseException):
+                    raise piece
+                if run_manager:
+                    run_manager.on_llm_new_token(piece)
+                yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        finally:
+            request.cancelled = True
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        loop = asyncio.get_running_loop()
+        pieces: asyncio.Queue = asyncio.Queue()
+        request = self._submit(messages, stop, lambda piece: loop.call_soon_threadsafe(pieces.put_nowait, piece))
+        try:
+            while True:
+                piece = await pieces.get()
+                if piece is None:
+                    return
+                if isinstance(piece, BaseException):
+                    raise piece
+                if run_manager:
+                    await run_manager.on_llm_new_token(piece)
+                yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        finally:
+            request.cancelled = True
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        text = "".join(chunk.text for chunk in self._stream(messages, stop, run_manager, **kwargs))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        parts = [chunk.text async for chunk in self._astream(messages, stop, run_manager, **kwargs)]
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(parts)))])
@@ -0,0 +1,177 @@
+"""Local OpenAI-compatible chat server with injectable latency, errors and 429s.
+
+Stands in for a provider or local model server when testing the router
+(llm_router.py) offline:
+
+    MOCK_LLM_PORT=8081 MOCK_LLM_SLOW_RATE=0.1 python mock_llm_server.py
+    LLM_BACKEND=router LLM_ROUTER_BACKENDS=local,openai \
+        LOCAL_LLM_URL=http://127.0.0.1:8081/v1 ... uvicorn app:app
+
+    MOCK_LLM_TTFT_MS=200          delay before the first token
+    MOCK_LLM_TOKENS_PER_SEC=100   generation rate after that
+    MOCK_LLM_REPLY_TOKENS=40      reply length in tokens
+    MOCK_LLM_SLOW_RATE=0          fraction of requests whose first token is
+    MOCK_LLM_SLOW_MS=3000         delayed by this much more (tail latency)
+    MOCK_LLM_ERROR_RATE=0         fraction answered with 500
+    MOCK_LLM_RATE_LIMIT_RATE=0    fraction answered with 429 + Retry-After
+
+Serves POST /v1/chat/completions (streaming and non-streaming) and GET /stats.
+The settings live on server.state.config and may be changed while running.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _config_from_env() -> dict:
+    return {
+        "ttft_ms": float(os.getenv("MOCK_LLM_TTFT_MS", "200")),
+        "tokens_per_sec": float(os.getenv("MOCK_LLM_TOKENS_PER_SEC", "100")),
+        "reply_tokens": int(os.getenv("MOCK_LLM_REPLY_TOKENS", "40")),
+        "slow_rate": float(os.getenv("MOCK_LLM_SLOW_RATE", "0")),
+        "slow_ms": float(os.getenv("MOCK_LLM_SLOW_MS", "3000")),
+        "error_rate": float(os.getenv("MOCK_LLM_ERROR_RATE", "0")),
+        "rate_limit_rate": float(os.getenv("MOCK_LLM_RATE_LIMIT_RATE", "0")),
+    }
+
+
+class MockState:
+    def __init__(self, config: dict):
+        self.lock = threading.Lock()
+        self.config = config
+        self.requests = 0
+        self.completed = 0
+        self.disconnected = 0
+        self.errors = 0
+        self.rate_limited = 0
+
+    def count(self, field: str) -> None:
+        with self.lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "completed": self.completed,
+                "disconnected": self.disconnected,
+                "errors": self.errors,
+                "rate_limited": self.rate_limited,
+                "config": dict(self.config),
+            }
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None  # set by make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._reply(200, self.state.stats())
+        else:
+            self._reply(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._reply(404, {"error": {"message": "not found"}})
+            return
+        state = self.state
+        config = dict(state.config)
+        state.count("requests")
+
+        roll = random.random()
+        if roll < config["rate_limit_rate"]:
+            state.count("rate_limited")
+            self._reply(429, {"error": {"message": "rate limit exceeded"}}, {"Retry-After": "1"})
+            return
+        if roll < config["rate_limit_rate"] + config["error_rate"]:
+            state.count("errors")
+            self._reply(500, {"error": {"message": "internal error"}})
+            return
+
+        delay = config["ttft_ms"]
+        if random.random() < config["slow_rate"]:
+            delay += config["slow_ms"]
+        time.sleep(delay / 1000)
+
+        completion_id = "chatcmpl-" + uuid.uuid4().hex
+        tokens = [f"token{i} " for i in range(config["reply_tokens"])]
+        interval = 1.0 / config["tokens_per_sec"] if config["tokens_per_sec"] > 0 else 0.0
+
+        if not payload.get("stream"):
+            time.sleep(interval * len(tokens))
+            self._reply(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "model": payload.get("model"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(tokens)}}],
+            })
+            state.count("completed")
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(interval)
+                event = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "model": payload.get("model"),
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                }
+                self._write_chunk(f"data: {json.dumps(event)}\n\n".encode())
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away, e.g. the router cancelled a losing hedge
+            state.count("disconnected")
+            self.close_connection = True
+            return
+        state.count("completed")
+
+
+def make_server(host="127.0.0.1", port=8081, **config):
+    """Create (but do not start) a mock server; port 0 picks a free port.
+
+    Keyword arguments override the MOCK_LLM_* settings (ttft_ms, slow_rate, ...).
+    """
+    handler = type("MockHandler", (Handler,), {"state": MockState({**_config_from_env(), **config})})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = handler.state
+    return server
+
+
+if __name__ == "__main__":
+    server = make_server(port=int(os.getenv("MOCK_LLM_PORT", "8081")))
+    print(f"Mock LLM server on http://{server.server_address[0]}:{server.server_address[1]}/v1")
+    server.serve_forever()
@@ -1,13 +1,20 @@
 import os
 import json
+import asyncio
 import warnings
-from typing import List
+from typing import AsyncIterator, List, Optional
 
 from dotenv import load_dotenv
 from langchain_groq import ChatGroq
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
+from conversation_memory import ConversationMemory
+from response_cache import RESPONSE_CACHE, model_settings, prompt_key
+from session_store import InMemorySessionStore
+from singleflight import SINGLE_FLIGHT
+from telemetry import atimed_iter, span, timed_iter
+
 # ---------- Environment & Warnings ----------
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 warnings.filterwarnings("ignore")
@@ -16,6 +23,10 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
 # ---------- Constants ----------
 MODEL_NAME = "llama-3.1-8b-instant"
+# groq, stub for benchmarks and offline runs (see stub_llm.py), router for
+# timeouts/hedging/failover across backends, or a single backend from
+# llm_router.BACKENDS (openai, local, llamacpp)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "groq").lower()
 
 # ---------- Prompt Template ----------
 prompt_template = """
@@ -62,60 +73,123 @@ prompt = PromptTemplate(
 )
 
 # ---------- Initialize LLM with LCEL ----------
-llm = ChatGroq(
-    groq_api_key=GROQ_API_KEY,
-    model_name=MODEL_NAME,
-)
+def _build_llm():
+    """Chat model selected by LLM_BACKEND."""
+    if LLM_BACKEND == "stub":
+        from stub_llm import StubChatModel
+        return StubChatModel()
+    if LLM_BACKEND != "groq":
+        import llm_router
+        return llm_router.build_llm(LLM_BACKEND)
+    return ChatGroq(
+        groq_api_key=GROQ_API_KEY,
+        model_name=MODEL_NAME,
+    )
+
+
+llm = _build_llm()
 
 # Modern LCEL chain
 chain = prompt | llm | StrOutputParser()
 
 # ---------- FastAPI Integration Helper ----------
-_FRIEND_CHAIN = chain if GROQ_API_KEY else None
+# The API renders the prompt itself (it is the response cache key) and runs
+# only the model part of the chain
+_FRIEND_CHAIN = llm | StrOutputParser() if GROQ_API_KEY or LLM_BACKEND != "groq" else None
+_MODEL_SETTINGS = model_settings(llm)
+# Per-session friend conversation history (see conversation_memory.py)
+MEMORY = ConversationMemory("friend")
 
 def _ensure_friend_chain():
     """Lazy-initialize and cache the friend chain.
 
     This avoids re-creating the model on every request.
     """
-    global _FRIEND_CHAIN
+    global _FRIEND_CHAIN, _MODEL_SETTINGS
     if _FRIEND_CHAIN is not None:
         return _FRIEND_CHAIN
 
-    if not GROQ_API_KEY:
+    if not GROQ_API_KEY and LLM_BACKEND == "groq":
         raise RuntimeError("GROQ_API_KEY missing. Set it in environment or .env")
 
-    friend_llm = ChatGroq(
-        groq_api_key=GROQ_API_KEY,
-        model_name=MODEL_NAME,
-    )
-    _FRIEND_CHAIN = prompt | friend_llm | StrOutputParser()
+    friend_llm = _build_llm()
+    _MODEL_SETTINGS = model_settings(friend_llm)
+    _FRIEND_CHAIN = friend_llm | StrOutputParser()
     return _FRIEND_CHAIN
 
 
-def get_friend_response(query: str, mode: str, friend_name: str) -> str:
+def warm_up() -> None:
+    """Create the friend chain ahead of the first request."""
+    _ensure_friend_chain()
+
+
+def is_ready() -> bool:
+    """Whether the friend chain has been initialized."""
+    return _FRIEND_CHAIN is not None
+
+
+def _render(query: str, mode: str, friend_name: str, state: dict):
+    """Rendered prompt, its response cache key (None when caching is off for
+    `mode`) and its single-flight key."""
+    prompt_value = prompt.invoke({
+        "query": query,
+        "mode": mode,
+        "friend_name": friend_name,
+        "context": MEMORY.render(state, friend_name),
+    })
+    key = prompt_key(prompt_value, _MODEL_SETTINGS)
+    return prompt_value, (key if RESPONSE_CACHE.enabled_for("friend", mode) else None), key
+
+
+def get_friend_response(query: str, mode: str, friend_name: str, session_id: Optional[str] = None) -> str:
     """Public function used by the FastAPI app to get a best-friend style response.
 
     Args:
         query: User's input message/question.
         mode: Conversation mode determining tone/style.
         friend_name: Persona name of the AI friend.
+        session_id: Optional conversation id; when given, earlier turns of the
+            session are included (token-budgeted) and this turn is recorded.
 
     Returns:
         The model-generated friend response as a string.
     """
     friend_chain = _ensure_friend_chain()
 
-    return friend_chain.invoke({
-        "query": query,
-        "mode": mode,
-        "friend_name": friend_name,
-        "context": "",
-    })
+    with span("memory"):
+        state = MEMORY.load(session_id)
+    prompt_value, cache_key, flight_key = _render(query, mode, friend_name, state)
+    # Streamed internally so time-to-first-token is measured too
+    reply = RESPONSE_CACHE.invoke(cache_key, lambda: SINGLE_FLIGHT.do(
+        flight_key, lambda: "".join(timed_iter(friend_chain.stream(prompt_value)))
+    ))
+    with span("memory"):
+        MEMORY.record(session_id, state, query, reply, friend_name)
+    return reply
+
+
+async def astream_friend_response(query: str, mode: str, friend_name: str, session_id: Optional[str] = None) -> AsyncIterator[str]:
+    """Streaming counterpart of get_friend_response.
+
+    Yields the friend reply chunk by chunk as the model generates it.
+    """
+    friend_chain = _ensure_friend_chain()
+
+    with span("memory"):
+        state = await asyncio.to_thread(MEMORY.load, session_id)
+    prompt_value, cache_key, flight_key = _render(query, mode, friend_name, state)
+    reply = []
+    async for chunk in RESPONSE_CACHE.astream(cache_key, lambda: SINGLE_FLIGHT.stream(
+        flight_key, lambda: atimed_iter(friend_chain.astream(prompt_value))
+    )):
+        reply.append(chunk)
+        yield chunk
+    with span("memory"):
+        await asyncio.to_thread(MEMORY.record, session_id, state, query, "".join(reply), friend_name)
 
 # ---------- Main CLI ----------
 def main():
-    if not GROQ_API_KEY:
+    if not GROQ_API_KEY and LLM_BACKEND == "groq":
         print("❌ GROQ_API_KEY missing. Set it in .env first.")
         return
 
@@ -133,7 +207,8 @@ def main():
 
     print(f"\nYou're now chatting with {friend_name} ({mode} mode). Type 'exit' to end.\n")
 
-    context = ""  # Stores all previous messages
+    # Keeps recent messages, summarizes older ones
+    memory = ConversationMemory("cli", store=InMemorySessionStore())
 
     while True:
         user_input = input("You: ").strip()
@@ -141,12 +216,13 @@ def main():
             print(f"\n{friend_name}: Aww, okay. I'm really glad we talked today. Take care, okay? 🧡\n")
             break
 
+        state = memory.load("cli")
         try:
             reply = chain.invoke({
                 "query": user_input,
                 "mode": mode,
                 "friend_name": friend_name,
-                "context": context
+                "context": memory.render(state, friend_name)
             })
         except Exception as e:
             print(f"⚠️ Error from model: {e}")
@@ -154,8 +230,8 @@ def main():
 
         print(f"{friend_name}: {reply}\n")
 
-        # Append both sides to context
-        context += f"User: {user_input}\n{friend_name}: {reply}\n"
+        # Record both sides; older turns get folded into a summary
+        memory.record("cli", state, user_input, reply, friend_name)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,9 +1,12 @@
 # sunny_cli_manual.py
 
 import os
-import json
+import time
+import asyncio
+import logging
+import threading
 import warnings
-from typing import List
+from typing import AsyncIterator, List, Optional
 
 from dotenv import load_dotenv
 
@@ -11,10 +14,24 @@ from dotenv import load_dotenv
 from langchain_groq import ChatGroq
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
-from langchain_core.prompts import PromptTemplate
+from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.documents import Document
 
+from embedding_cache import CachedQueryEmbeddings
+from retrieval_cache import SemanticResultCache
+from response_cache import RESPONSE_CACHE, model_settings, prompt_key
+from retriever import TherapistRetriever
+from index_manager import IndexManager
+from index_factory import apply_search_params, settings_from_env
+from index_store import has_store, load_store
+from ingestion import load_records
+from conversation_memory import ConversationMemory
+from session_store import InMemorySessionStore
+from singleflight import SINGLE_FLIGHT
+from telemetry import atimed_iter, span, timed_iter
+from token_counter import log_prompt_size
+
 # Speech
 import pyttsx3
 
@@ -23,6 +40,7 @@ os.environ["TOKENIZERS_PARALLELISM"] = "false"
 warnings.filterwarnings("ignore")
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+logger = logging.getLogger("multimodel_therapist")
 
 # ---------- Constants ----------
 EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
@@ -30,33 +48,52 @@ EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_PATH = os.path.join(BASE_DIR, "combined_dataset_fixed.json")
 FAISS_INDEX_PATH = os.path.join(BASE_DIR, "faiss_index")
+# Additional transcript datasets (same row format), separated by os.pathsep
+EXTRA_DATASETS = [p for p in os.getenv("EXTRA_DATASETS", "").split(os.pathsep) if p]
+DATASET_PATHS = [DATA_PATH] + EXTRA_DATASETS
+# Sync the saved index with the datasets on startup (embeds only changed rows);
+# set to 0 to load whatever index is on disk as-is.
+INDEX_AUTO_SYNC = os.getenv("INDEX_AUTO_SYNC", "1") != "0"
+# FAISS index type and tuning (FAISS_INDEX_TYPE=flat|ivf|hnsw|ivfpq, see index_factory.py)
+INDEX_SETTINGS = settings_from_env()
 MODEL_NAME = "llama-3.1-8b-instant"
+# groq, stub for benchmarks and offline runs (see stub_llm.py), router for
+# timeouts/hedging/failover across backends, or a single backend from
+# llm_router.BACKENDS (openai, local, llamacpp)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "groq").lower()
+THERAPIST_NAME = "Sunny"
+# Query embedding cache: max in-memory entries, and an optional SQLite file
+# that receives evicted entries so they survive restarts.
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "1024"))
+EMBED_CACHE_SPILL_PATH = os.getenv("EMBED_CACHE_SPILL_PATH")
+# Retrieval result cache: queries whose embeddings are within this cosine
+# distance of a cached query reuse its top-k documents.
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "256"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "600"))
+RESULT_CACHE_MAX_DISTANCE = float(os.getenv("RESULT_CACHE_MAX_DISTANCE", "0.05"))
+# Retrieval defaults: documents per query, minimum relevance (cosine
+# similarity) for a document to enter the prompt, and MMR diversification.
+RETRIEVER_K = int(os.getenv("RETRIEVER_K", "3"))
+RETRIEVER_SCORE_THRESHOLD = float(os.environ["RETRIEVER_SCORE_THRESHOLD"]) if os.getenv("RETRIEVER_SCORE_THRESHOLD") else None
+RETRIEVER_USE_MMR = os.getenv("RETRIEVER_USE_MMR", "0") == "1"
 
 # ---------- Prompt ----------
-prompt_template = """
-You are "Sunny", a compassionate, empathetic, and non-judgmental virtual therapist.
+# Static instructions live in the system message so every request shares an
+# identical prefix that provider-side prompt caching can reuse. Anything that
+# changes per turn goes in the compact human message below.
+system_prompt = """You are "Sunny", a compassionate, empathetic, and non-judgmental virtual therapist.
 Treat the dialogue as a real, human-like therapy session.
 
-You receive sensor and facial data that reflect the user's emotional and physical state. 
-Use this data to gently acknowledge their condition before proceeding to your response.
-
-Context from similar past sessions:
-{context}
+Each user message comes with sensor and facial data that reflect the user's emotional and physical state ("State"), excerpts from similar past counselling sessions, and the conversation so far.
+Use the state data to gently acknowledge their condition before proceeding to your response.
 
-User emotional and physiological parameters:
-{parameters}
-
-User message:
-{query}
-
-Sunny:
 1. Begin by empathetically acknowledging the user's current state based on their parameters (mood, stress, fatigue, and recovery).
    - For example:
      - If mood = sad and stress is high → "I can sense you're feeling low and a bit stressed right now."
      - If fatigue is high but recovery is improving → "It seems you've been tired lately, but you're slowly getting back on track."
    - Keep it natural and warm — not robotic.
 
-2. Then, interpret and respond to the user's message ({query}) thoughtfully and conversationally.
+2. Then, interpret and respond to the user's message thoughtfully and conversationally.
    - Offer emotional validation.
    - Ask gentle, open-ended questions if appropriate.
    - Provide coping suggestions or reflections related to their context.
@@ -64,85 +101,231 @@ Sunny:
 3. Keep the tone warm, conversational, and human-like — like a supportive therapist who genuinely cares.
 """
 
+turn_template = """Similar past sessions:
+{context}
+
+Session so far:
+{history}
+
+State: {parameters}
+
+User message:
+{query}"""
+
+
+prompt = ChatPromptTemplate.from_messages([
+    ("system", system_prompt),
+    ("human", turn_template),
+])
+
+
+def format_parameters(parameters: dict) -> str:
+    """Compact one-line rendering of the sensor parameters (cheaper than JSON)."""
+    return ", ".join(
+        f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}"
+        for key, value in parameters.items()
+    )
 
-prompt = PromptTemplate(
-    template=prompt_template,
-    input_variables=["context", "query", "parameters"]
-)
 
 # ---------- Data & Index Utilities ----------
+def record_to_document(record: dict, record_id, source: str) -> Document:
+    """Embed only the user's situation; counsellor responses ride along as metadata."""
+    return Document(
+        page_content=record["context"],
+        metadata={"id": record_id, "source": source, "responses": record["responses"]},
+    )
+
+
 def load_json_data(filepath: str) -> List[Document]:
-    with open(filepath, "r") as f:
-        data = json.load(f)
-    docs: List[Document] = []
-    for i, row in enumerate(data):
-        content = row.get("text", json.dumps(row))
-        docs.append(Document(page_content=content, metadata={"id": i}))
-    return docs
-
-
-def build_faiss_index(docs: List[Document]):
-    embeddings = HuggingFaceEmbeddings(model_name=EMBED_MODEL)
-    vectorstore = FAISS.from_documents(docs, embeddings)
-    vectorstore.save_local(FAISS_INDEX_PATH)
-    return vectorstore
+    records = load_records([filepath])
+    return [record_to_document(record, record_id, source) for record_id, (record, source) in records.items()]
+
+
+_EMBEDDINGS = None
+
+def get_embeddings():
+    """Return the process-wide embedding model, loading it on first use.
+
+    Loading MiniLM takes seconds, so the index builder, the index loader and the
+    retriever all share one instance. Query embeddings go through an LRU cache
+    because common openers ("I can't sleep") repeat constantly.
+    """
+    global _EMBEDDINGS
+    if _EMBEDDINGS is None:
+        _EMBEDDINGS = CachedQueryEmbeddings(
+            HuggingFaceEmbeddings(model_name=EMBED_MODEL),
+            max_size=EMBED_CACHE_SIZE,
+            spill_path=EMBED_CACHE_SPILL_PATH,
+        )
+    return _EMBEDDINGS
+
+
+_RESULT_CACHE = SemanticResultCache(
+    max_size=RESULT_CACHE_SIZE,
+    ttl_seconds=RESULT_CACHE_TTL,
+    max_distance=RESULT_CACHE_MAX_DISTANCE,
+)
 
 
 def load_faiss_index():
-    embeddings = HuggingFaceEmbeddings(model_name=EMBED_MODEL)
-    return FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
+    embeddings = get_embeddings()
+    if has_store(FAISS_INDEX_PATH):
+        # Memory-mapped index and SQLite docstore: shared across workers, no unpickling
+        vectorstore = load_store(FAISS_INDEX_PATH, embeddings)
+    else:
+        vectorstore = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
+    apply_search_params(vectorstore.index, **INDEX_SETTINGS)
+    _RESULT_CACHE.invalidate()
+    return vectorstore
+
+
+def sync_faiss_index(rebuild: bool = False):
+    """Bring the saved index in line with DATASET_PATHS and return (vectorstore, report).
+
+    Only new or changed rows are embedded; see index_manager.IndexManager.
+    """
+    manager = IndexManager(
+        FAISS_INDEX_PATH, DATASET_PATHS, get_embeddings(), record_to_document, EMBED_MODEL, INDEX_SETTINGS,
+        load_records=load_records,
+    )
+    vectorstore, report = manager.sync(rebuild=rebuild)
+    _RESULT_CACHE.invalidate()
+    return vectorstore, report
 
 
 # ---------- LLM + Retrieval with LCEL ----------
-def get_custom_chain(vectorstore):
-    llm = ChatGroq(
+def _build_llm():
+    """Chat model selected by LLM_BACKEND."""
+    if LLM_BACKEND == "stub":
+        from stub_llm import StubChatModel
+        return StubChatModel()
+    if LLM_BACKEND != "groq":
+        import llm_router
+        return llm_router.build_llm(LLM_BACKEND)
+    if not GROQ_API_KEY:
+        raise RuntimeError("GROQ_API_KEY missing. Set it in environment or .env")
+    return ChatGroq(
         groq_api_key=GROQ_API_KEY,
         model_name=MODEL_NAME,
     )
-    
-    # Modern LCEL chain
-    chain = prompt | llm | StrOutputParser()
-
-    def run(query: str, parameters: dict, context: str):
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
-        docs = retriever.invoke(query)
-        retrieved_context = "\n\n".join([d.page_content for d in docs])
-        
-        return chain.invoke({
-            "query": query,
-            "parameters": json.dumps(parameters),
-            "context": retrieved_context or context
-        })
 
+
+def get_custom_chain(vectorstore):
+    llm = _build_llm()
+
+    # Modern LCEL chain; the prompt is rendered separately so it can be measured
+    # and used as the response cache key
+    chain = llm | StrOutputParser()
+    settings = model_settings(llm)
+
+    # Built once per vectorstore and shared by every request
+    retriever = TherapistRetriever(
+        vectorstore,
+        get_embeddings(),
+        result_cache=_RESULT_CACHE,
+        k=RETRIEVER_K,
+        score_threshold=RETRIEVER_SCORE_THRESHOLD,
+        use_mmr=RETRIEVER_USE_MMR,
+    )
+
+    def _render(query: str, parameters: dict, context: str, history: str, results):
+        with span("prompt"):
+            prompt_value = prompt.invoke({
+                "query": query,
+                "parameters": format_parameters(parameters),
+                "context": TherapistRetriever.format_context(results) or context,
+                "history": history or "(start of session)",
+            })
+        log_prompt_size("therapist", prompt_value)
+        return prompt_value
+
+    def _keys(prompt_value):
+        # (response cache key or None when caching is off, single-flight key)
+        key = prompt_key(prompt_value, settings)
+        return (key if RESPONSE_CACHE.enabled_for("therapist") else None), key
+
+    def run(query: str, parameters: dict, context: str, history: str = "", **search_kwargs):
+        results = retriever.search(query, **search_kwargs)
+        prompt_value = _render(query, parameters, context, history, results)
+        cache_key, flight_key = _keys(prompt_value)
+        # Streamed internally so time-to-first-token is measured too
+        return RESPONSE_CACHE.invoke(cache_key, lambda: SINGLE_FLIGHT.do(
+            flight_key, lambda: "".join(timed_iter(chain.stream(prompt_value)))
+        ))
+
+    async def astream(query: str, parameters: dict, context: str, history: str = "", **search_kwargs):
+        # Same inputs as run(), but tokens are yielded as Groq produces them
+        results = await retriever.asearch(query, **search_kwargs)
+        prompt_value = _render(query, parameters, context, history, results)
+        cache_key, flight_key = _keys(prompt_value)
+        async for chunk in RESPONSE_CACHE.astream(cache_key, lambda: SINGLE_FLIGHT.stream(
+            flight_key, lambda: atimed_iter(chain.astream(prompt_value))
+        )):
+            yield chunk
+
+    run.astream = astream
+    run.retriever = retriever
     return run
 
 
 # ---------- FastAPI Integration Helper ----------
 _THERAPIST_CHAIN = None
+# Per-session therapist conversation history (see conversation_memory.py)
+MEMORY = ConversationMemory("therapist")
+_CHAIN_LOCK = threading.Lock()
 
 def _ensure_chain():
     """Lazy-initialize and cache the therapist chain with FAISS retriever.
 
-    This avoids reloading the vector store and model on every request.
+    This avoids reloading the vector store and model on every request. The lock
+    makes concurrent first callers (e.g. startup warm-up racing an early request)
+    wait for a single initialization instead of each loading the index.
     """
     global _THERAPIST_CHAIN
     if _THERAPIST_CHAIN is not None:
         return _THERAPIST_CHAIN
 
-    if not GROQ_API_KEY:
-        raise RuntimeError("GROQ_API_KEY missing. Set it in environment or .env")
+    with _CHAIN_LOCK:
+        if _THERAPIST_CHAIN is not None:
+            return _THERAPIST_CHAIN
 
-    if os.path.exists(FAISS_INDEX_PATH):
-        vs = load_faiss_index()
-    else:
-        docs = load_json_data(DATA_PATH)
-        vs = build_faiss_index(docs)
+        if INDEX_AUTO_SYNC or not os.path.exists(FAISS_INDEX_PATH):
+            vs, _ = sync_faiss_index()
+        else:
+            vs = load_faiss_index()
 
-    _THERAPIST_CHAIN = get_custom_chain(vs)
+        _THERAPIST_CHAIN = get_custom_chain(vs)
     return _THERAPIST_CHAIN
 
 
-def get_therapist_response(query: str, stress: float, mood: str, fatigue: float, recovery: float, fer_mood: str) -> str:
+def warm_up() -> None:
+    """Load the index, embedder and LLM client, then exercise them once.
+
+    Meant to be called at application startup so the first real request does not
+    pay for model loading. The throwaway query also pulls the embedding model
+    weights and the FAISS index pages into memory.
+    """
+    start = time.perf_counter()
+    chain = _ensure_chain()
+    chain.retriever.search("I feel anxious")
+    logger.info("Therapist retrieval warm-up finished in %.2fs", time.perf_counter() - start)
+
+
+def is_ready() -> bool:
+    """Whether the therapist chain has been initialized."""
+    return _THERAPIST_CHAIN is not None
+
+
+def cache_stats() -> dict:
+    """Hit/miss counters of the therapist retrieval caches."""
+    stats = {}
+    if _EMBEDDINGS is not None:
+        stats["query_embeddings"] = _EMBEDDINGS.stats()
+    stats["retrieval_results"] = _RESULT_CACHE.stats()
+    return stats
+
+
+def get_therapist_response(query: str, stress: float, mood: str, fatigue: float, recovery: float, fer_mood: str, session_id: Optional[str] = None) -> str:
     """Public function used by the FastAPI app to get a therapist-style response.
 
     Args:
@@ -152,6 +335,8 @@ def get_therapist_response(query: str, stress: float, mood: str, fatigue: float,
         fatigue: Fatigue level as float.
         recovery: Recovery level as float.
         fer_mood: Facial emotion recognition mood label.
+        session_id: Optional conversation id; when given, earlier turns of the
+            session are included (token-budgeted) and this turn is recorded.
 
     Returns:
         The model-generated therapist response as a string.
@@ -166,23 +351,50 @@ def get_therapist_response(query: str, stress: float, mood: str, fatigue: float,
         "fer_mood": fer_mood,
     }
 
-    # Context can be replaced with conversation history if available
     context = "[]"
-    return chain(query, parameters, context)
+    with span("memory"):
+        state = MEMORY.load(session_id)
+    reply = chain(query, parameters, context, MEMORY.render(state, THERAPIST_NAME))
+    with span("memory"):
+        MEMORY.record(session_id, state, query, reply, THERAPIST_NAME)
+    return reply
+
+
+async def astream_therapist_response(query: str, stress: float, mood: str, fatigue: float, recovery: float, fer_mood: str, session_id: Optional[str] = None) -> AsyncIterator[str]:
+    """Streaming counterpart of get_therapist_response.
+
+    Yields the therapist reply chunk by chunk as the model generates it, so the
+    client can render the first words without waiting for the full completion.
+    """
+    chain = await asyncio.to_thread(_ensure_chain)
+
+    parameters = {
+        "mood": mood,
+        "fatigue": float(fatigue),
+        "recovery": float(recovery),
+        "stress": float(stress),
+        "fer_mood": fer_mood,
+    }
+
+    context = "[]"
+    with span("memory"):
+        state = await asyncio.to_thread(MEMORY.load, session_id)
+    reply = []
+    async for chunk in chain.astream(query, parameters, context, MEMORY.render(state, THERAPIST_NAME)):
+        reply.append(chunk)
+        yield chunk
+    with span("memory"):
+        await asyncio.to_thread(MEMORY.record, session_id, state, query, "".join(reply), THERAPIST_NAME)
 
 
 # ---------- Main CLI ----------
 def main():
-    if not GROQ_API_KEY:
+    if not GROQ_API_KEY and LLM_BACKEND == "groq":
         print("GROQ_API_KEY missing. Set it in .env first.")
         return
 
-    # Load or build vectorstore
-    if os.path.exists(FAISS_INDEX_PATH):
-        vs = load_faiss_index()
-    else:
-        docs = load_json_data(DATA_PATH)
-        vs = build_faiss_index(docs)
+    # Load the vectorstore, embedding any new dataset rows
+    vs, _ = sync_faiss_index()
 
     # Create custom chain
     chain = get_custom_chain(vs)
@@ -204,6 +416,7 @@ def main():
     }
 
     context = "[]"  # Placeholder
+    memory = ConversationMemory("cli", store=InMemorySessionStore())
 
     print("\nType your messages to Sunny. Type 'exit' to quit.\n")
 
@@ -213,7 +426,9 @@ def main():
             print("Ending session. Take care!")
             break
 
-        reply = chain(user_input, parameters, context)
+        state = memory.load("cli")
+        reply = chain(user_input, parameters, context, memory.render(state, THERAPIST_NAME))
+        memory.record("cli", state, user_input, reply, THERAPIST_NAME)
         print(f"Sunny: {reply}\n")
 
 
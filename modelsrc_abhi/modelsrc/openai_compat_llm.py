@@ -0,0 +1,172 @@
+"""Chat model for any OpenAI-compatible /chat/completions endpoint.
+
+Covers hosted OpenAI-compatible providers as well as local model servers
+(llama.cpp server, vLLM, Ollama, LM Studio), which all expose the same API.
+Talks to the endpoint directly over httpx with pooled connections, streaming
+tokens from the server-sent events.
+
+Errors carry the HTTP status and any Retry-After, like the Groq client's, so
+the router (llm_router.py) and the API can tell rate limiting from failures.
+"""
+
+import json
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import httpx
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+_ROLES = {"system": "system", "human": "user", "ai": "assistant"}
+
+
+class UpstreamError(Exception):
+    """Non-2xx reply from the endpoint."""
+
+    def __init__(self, status_code: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status_code}: {message}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    try:
+        return float(response.headers["retry-after"])
+    except (KeyError, ValueError):
+        return None
+
+
+def _parse_line(line: str) -> Optional[str]:
+    """Token text of one SSE line: "" for non-data lines, None at [DONE]."""
+    if not line.startswith("data:"):
+        return ""
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return None
+    choices = json.loads(data).get("choices") or [{}]
+    return (choices[0].get("delta") or {}).get("content") or ""
+
+
+class OpenAICompatChatModel(BaseChatModel):
+    """Streaming chat model for an OpenAI-compatible endpoint.
+
+    Args:
+        base_url: API root, e.g. "https://api.openai.com/v1" or "http://127.0.0.1:8080/v1".
+        model: Model name sent with every request.
+        api_key: Bearer token, if the endpoint needs one.
+        temperature: Sampling temperature (None uses the server default).
+        max_tokens: Reply length cap (None uses the server default).
+        timeout: Connect timeout and longest gap between streamed chunks, in seconds.
+    """
+
+    base_url: str
+    model: str
+    api_key: Optional[str] = None
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = None
+    timeout: float = 30.0
+
+    _client: Optional[httpx.Client] = PrivateAttr(default=None)
+    _aclient: Optional[httpx.AsyncClient] = PrivateAttr(default=None)
+
+    @property
+    def _llm_type(self) -> str:
+        return "openai-compat"
+
+    @property
+    def _default_params(self) -> Dict[str, Any]:
+        params = {"base_url": self.base_url, "model": self.model}
+        if self.temperature is not None:
+            params["temperature"] = self.temperature
+        if self.max_tokens is not None:
+            params["max_tokens"] = self.max_tokens
+        return params
+
+    def _client_kwargs(self) -> dict:
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        return {"base_url": self.base_url.rstrip("/"), "headers": headers, "timeout": self.timeout}
+
+    def _get_client(self) -> httpx.Client:
+        if self._client is None:
+            self._client = httpx.Client(**self._client_kwargs())
+        return self._client
+
+    def _get_aclient(self) -> httpx.AsyncClient:
+        if self._aclient is None:
+            self._aclient = httpx.AsyncClient(**self._client_kwargs())
+        return self._aclient
+
+    def _payload(self, messages: List[BaseMessage], stop: Optional[List[str]]) -> dict:
+        payload = {
+            "model": self.model,
+            "messages": [{"role": _ROLES.get(m.type, "user"), "content": m.content} for m in messages],
+            "stream": True,
+        }
+        if self.temperature is not None:
+            payload["temperature"] = self.temperature
+        if self.max_tokens is not None:
+            payload["max_tokens"] = self.max_tokens
+        if stop:
+            payload["stop"] = stop
+        return payload
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        with self._get_client().stream("POST", "/chat/completions", json=self._payload(messages, stop)) as response:
+            if response.status_code >= 400:
+                raise UpstreamError(response.status_code, response.read().decode(errors="replace"), _retry_after(response))
+            for line in response.iter_lines():
+                text = _parse_line(line)
+                if text is None:
+                    return
+                if text:
+                    if run_manager:
+                        run_manager.on_llm_new_token(text)
+                    yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        async with self._get_aclient().stream("POST", "/chat/completions", json=self._payload(messages, stop)) as response:
+            if response.status_code >= 400:
+                body = (await response.aread()).decode(errors="replace")
+                raise UpstreamError(response.status_code, body, _retry_after(response))
+            async for line in response.aiter_lines():
+                text = _parse_line(line)
+                if text is None:
+                    return
+                if text:
+                    if run_manager:
+                        await run_manager.on_llm_new_token(text)
+                    yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        text = "".join(chunk.text for chunk in self._stream(messages, stop, run_manager, **kwargs))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        parts = [chunk.text async for chunk in self._astream(messages, stop, run_manager, **kwargs)]
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(parts)))])
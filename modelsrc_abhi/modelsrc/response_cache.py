@@ -0,0 +1,143 @@
+"""Opt-in cache of complete LLM replies, keyed on the rendered prompt.
+
+The key is a hash of the exact prompt messages sent to the model plus the model
+settings (backend, model name, temperature, ...), so a hit is only possible
+when the model would receive byte-identical input: stock openers, quick-reply
+chips, repeated first turns. Anything that changes the prompt (history,
+retrieved context, sensor readings) changes the key.
+
+Entries live in an InMemorySessionStore, which already provides LRU eviction
+and per-key TTL.
+
+    RESPONSE_CACHE=1                 enable (off by default)
+    RESPONSE_CACHE_MODES=*           which turns may be cached: "*", or a comma-
+                                     separated list of personas and persona:mode
+                                     pairs, e.g. "therapist,friend:Funny,friend:Hype"
+    RESPONSE_CACHE_TTL=3600          seconds
+    RESPONSE_CACHE_SIZE=2000         max entries
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import AsyncIterator, Callable, Optional
+
+from session_store import InMemorySessionStore
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "0") != "0"
+RESPONSE_CACHE_MODES = os.getenv("RESPONSE_CACHE_MODES", "*")
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2000"))
+
+
+def model_settings(llm) -> dict:
+    """Generation settings of a LangChain chat model that affect its output."""
+    params = dict(getattr(llm, "_default_params", {}) or {})
+    params.pop("stream", None)
+    return {"type": llm._llm_type, **params}
+
+
+def prompt_key(prompt_value, settings: dict) -> str:
+    """Cache key for a rendered PromptValue under the given model settings."""
+    messages = [(message.type, message.content) for message in prompt_value.to_messages()]
+    raw = json.dumps({"messages": messages, "model": settings}, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """LRU/TTL cache of replies with per-persona/mode enable flags.
+
+    Args:
+        enabled: Master switch.
+        modes: "*" or comma-separated "persona" / "persona:mode" entries.
+        ttl_seconds: Lifetime of an entry.
+        max_entries: LRU capacity.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = RESPONSE_CACHE_ENABLED,
+        modes: str = RESPONSE_CACHE_MODES,
+        ttl_seconds: float = RESPONSE_CACHE_TTL,
+        max_entries: int = RESPONSE_CACHE_SIZE,
+    ):
+        self.enabled = enabled
+        self.modes = {m.strip().lower() for m in modes.split(",") if m.strip()}
+        self.ttl_seconds = ttl_seconds
+        self._store = InMemorySessionStore(max_entries=max_entries)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def enabled_for(self, persona: str, mode: Optional[str] = None) -> bool:
+        if not self.enabled:
+            return False
+        persona = persona.lower()
+        return bool(
+            {"*", persona} & self.modes
+            or (mode is not None and f"{persona}:{mode.lower()}" in self.modes)
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._store.get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return entry["reply"]
+
+    def put(self, key: str, reply: str) -> None:
+        if not reply:
+            return
+        self._store.set(key, {"reply": reply}, ttl=self.ttl_seconds)
+        with self._lock:
+            self.stores += 1
+
+    def invoke(self, key: Optional[str], generate: Callable[[], str]) -> str:
+        """Cached reply for `key`, or generate() and remember it. None bypasses."""
+        if key is None:
+            return generate()
+        reply = self.get(key)
+        if reply is None:
+            reply = generate()
+            self.put(key, reply)
+        return reply
+
+    async def astream(self, key: Optional[str], generate: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Streaming counterpart of invoke: a hit is yielded as a single chunk.
+
+        Only replies that streamed to completion are stored.
+        """
+        if key is None:
+            async for chunk in generate():
+                yield chunk
+            return
+        reply = self.get(key)
+        if reply is not None:
+            yield reply
+            return
+        parts = []
+        async for chunk in generate():
+            parts.append(chunk)
+            yield chunk
+        self.put(key, "".join(parts))
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "modes": sorted(self.modes),
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+# Shared by both personas; entries of different personas never collide
+# because their prompts differ
+RESPONSE_CACHE = ResponseCache()
@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional
+
+import numpy as np
+
+
+class SemanticResultCache:
+    """Caches top-k retrieval results keyed by the query embedding.
+
+    A lookup hits when a cached query embedding lies within `max_distance`
+    cosine distance of the new one, so paraphrases that embed almost
+    identically skip the FAISS search. Entries expire after `ttl_seconds` and
+    the least recently used entry is evicted beyond `max_size`.
+
+    `key` lets callers separate results produced with different search settings
+    (e.g. k), which must never be served for one another. Call `invalidate()`
+    whenever the underlying index changes.
+    """
+
+    def __init__(self, max_size: int = 256, ttl_seconds: float = 600.0, max_distance: float = 0.05):
+        self.max_size = max(0, max_size)
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._next_id = 0
+        self._matrix = None
+        self._matrix_ids: List[int] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _purge_expired(self, now: float) -> None:
+        expired = [i for i, entry in self._entries.items() if now - entry[3] > self.ttl_seconds]
+        for i in expired:
+            del self._entries[i]
+        if expired:
+            self._matrix = None
+
+    def get(self, embedding, key: Hashable = None) -> Optional[Any]:
+        """Return cached results for the nearest cached query, or None on a miss."""
+        unit = self._unit(embedding)
+        with self._lock:
+            self._purge_expired(time.monotonic())
+            if self._entries:
+                if self._matrix is None:
+                    self._matrix_ids = list(self._entries.keys())
+                    self._matrix = np.stack([self._entries[i][0] for i in self._matrix_ids])
+                distances = 1.0 - self._matrix @ unit
+                for idx in np.argsort(distances):
+                    if distances[idx] > self.max_distance:
+                        break
+                    entry_id = self._matrix_ids[idx]
+                    _, entry_key, results, _ = self._entries[entry_id]
+                    if entry_key == key:
+                        self._entries.move_to_end(entry_id)
+                        self.hits += 1
+                        return results
+            self.misses += 1
+            return None
+
+    def put(self, embedding, results: Any, key: Hashable = None, generation: Optional[int] = None) -> None:
+        """Store results for a query embedding.
+
+        Pass the `generation` read before running the search so results computed
+        against an index that was swapped out in the meantime are dropped.
+        """
+        if self.max_size == 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[self._next_id] = (self._unit(embedding), key, results, time.monotonic())
+            self._next_id += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def invalidate(self) -> None:
+        """Drop every entry; call after the index is rebuilt or modified."""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self.generation += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "generation": self.generation,
+            }
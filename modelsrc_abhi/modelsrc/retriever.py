@@ -0,0 +1,113 @@
+import asyncio
+from typing import List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from retrieval_cache import SemanticResultCache
+from telemetry import span
+
+ScoredDocument = Tuple[Document, float]
+
+
+def distance_to_relevance(distance: float) -> float:
+    """Convert a FAISS L2 distance into a cosine-similarity relevance score.
+
+    The index stores unit-normalized MiniLM vectors and IndexFlatL2 reports the
+    squared L2 distance, which for unit vectors equals 2 - 2 * cos(a, b).
+    """
+    return 1.0 - float(distance) / 2.0
+
+
+class TherapistRetriever:
+    """Reusable retrieval component, created once per vectorstore.
+
+    Embeds the query through the shared (cached) embedder, consults the
+    semantic result cache and otherwise runs a similarity or MMR search. Results
+    carry a relevance score in [-1, 1] (higher is better) so weak matches can be
+    dropped before they inflate the prompt.
+    """
+
+    def __init__(
+        self,
+        vectorstore,
+        embeddings: Embeddings,
+        result_cache: Optional[SemanticResultCache] = None,
+        k: int = 3,
+        score_threshold: Optional[float] = None,
+        use_mmr: bool = False,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+    ):
+        self.vectorstore = vectorstore
+        self.embeddings = embeddings
+        self.result_cache = result_cache
+        self.k = k
+        self.score_threshold = score_threshold
+        self.use_mmr = use_mmr
+        self.fetch_k = fetch_k
+        self.lambda_mult = lambda_mult
+
+    def _search_by_vector(self, embedding: List[float], k: int, use_mmr: bool) -> List[ScoredDocument]:
+        if use_mmr:
+            hits = self.vectorstore.max_marginal_relevance_search_with_score_by_vector(
+                embedding, k=k, fetch_k=max(self.fetch_k, k), lambda_mult=self.lambda_mult
+            )
+        else:
+            hits = self.vectorstore.similarity_search_with_score_by_vector(embedding, k=k)
+        return [(doc, distance_to_relevance(distance)) for doc, distance in hits]
+
+    def search(
+        self,
+        query: str,
+        k: Optional[int] = None,
+        score_threshold: Optional[float] = None,
+        use_mmr: Optional[bool] = None,
+    ) -> List[ScoredDocument]:
+        """Return up to `k` (document, relevance) pairs for `query`, best first.
+
+        Arguments left as None fall back to the defaults given at construction.
+        """
+        k = k or self.k
+        use_mmr = self.use_mmr if use_mmr is None else use_mmr
+        score_threshold = self.score_threshold if score_threshold is None else score_threshold
+
+        with span("embed"):
+            embedding = self.embeddings.embed_query(query)
+        # The cutoff is applied after the cache so one entry serves every threshold
+        cache_key = (k, use_mmr)
+        results = None
+        if self.result_cache is not None:
+            generation = self.result_cache.generation
+            results = self.result_cache.get(embedding, key=cache_key)
+        if results is None:
+            with span("faiss"):
+                results = self._search_by_vector(embedding, k, use_mmr)
+            if self.result_cache is not None:
+                self.result_cache.put(embedding, results, key=cache_key, generation=generation)
+
+        if score_threshold is not None:
+            results = [(doc, score) for doc, score in results if score >= score_threshold]
+        return results
+
+    async def asearch(self, query: str, **kwargs) -> List[ScoredDocument]:
+        """Async variant of search; embedding and FAISS run off the event loop."""
+        return await asyncio.to_thread(self.search, query, **kwargs)
+
+    @staticmethod
+    def format_context(results: List[ScoredDocument]) -> str:
+        """Join retrieved documents into the prompt's context block.
+
+        Ingested records embed only the situation and carry counsellor
+        responses in metadata; both are rendered as a short exchange.
+        """
+        blocks = []
+        for doc, _ in results:
+            responses = doc.metadata.get("responses")
+            if responses is None:
+                blocks.append(doc.page_content)
+                continue
+            lines = [f"Situation: {doc.page_content}"]
+            lines.extend(f"Counsellor: {response}" for response in responses)
+            blocks.append("\n".join(lines))
+        return "\n\n".join(blocks)
@@ -0,0 +1,150 @@
+"""Session-state backends shared by the chat personas.
+
+Values are JSON-serializable dicts. Two implementations:
+
+    memory  in-process LRU with TTL; fine for a single uvicorn worker
+    redis   any Redis-protocol server; state survives restarts and is shared
+            by every worker
+
+Batch operations (get_many / set_many) go out as one pipelined round trip on
+Redis, so a chat turn costs two round trips (a read before generation, a write
+after it) regardless of how many keys it touches.
+
+The read and the write are not one atomic update. Two turns of the same session
+running at once both read the same state, and the later write wins: the other
+turn is lost from the stored state. Clients send one turn at a time per session,
+so this is accepted rather than holding a lock across LLM generation.
+
+Select with SESSION_BACKEND=memory|redis and REDIS_URL.
+"""
+
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+
+
+class SessionStore(ABC):
+    """Key/value store for per-session state with optional TTL (seconds)."""
+
+    @abstractmethod
+    def get_many(self, keys: List[str]) -> List[Optional[dict]]:
+        """Values for `keys` in order (None where missing or expired)."""
+
+    @abstractmethod
+    def set_many(self, items: Dict[str, dict], ttl: Optional[float] = None) -> None:
+        """Write all `items`; `ttl` applies to each key."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove `key` if present."""
+
+    def get(self, key: str) -> Optional[dict]:
+        return self.get_many([key])[0]
+
+    def set(self, key: str, value: dict, ttl: Optional[float] = None) -> None:
+        self.set_many({key: value}, ttl=ttl)
+
+
+class InMemorySessionStore(SessionStore):
+    """Thread-safe in-process store with LRU eviction and per-key expiry.
+
+    Values are stored serialized so callers never share mutable state with the
+    store, matching the semantics of the Redis backend.
+    """
+
+    def __init__(self, max_entries: int = SESSION_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: List[str]) -> List[Optional[dict]]:
+        now = time.monotonic()
+        values = []
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is not None and entry[1] is not None and entry[1] <= now:
+                    del self._data[key]
+                    entry = None
+                if entry is None:
+                    values.append(None)
+                    continue
+                self._data.move_to_end(key)
+                values.append(json.loads(entry[0]))
+        return values
+
+    def set_many(self, items: Dict[str, dict], ttl: Optional[float] = None) -> None:
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            for key, value in items.items():
+                self._data[key] = (json.dumps(value), expires)
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class RedisSessionStore(SessionStore):
+    """Store backed by a Redis-protocol server.
+
+    Args:
+        url: Connection URL, used when `client` is not given.
+        client: Pre-built client (e.g. a local stand-in server's client).
+        prefix: Namespace prepended to every key.
+    """
+
+    def __init__(self, url: str = REDIS_URL, client=None, prefix: str = "mentally:"):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("SESSION_BACKEND=redis requires the 'redis' package") from e
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def get_many(self, keys: List[str]) -> List[Optional[dict]]:
+        if not keys:
+            return []
+        raw = self.client.mget([self.prefix + key for key in keys])
+        return [json.loads(value) if value is not None else None for value in raw]
+
+    def set_many(self, items: Dict[str, dict], ttl: Optional[float] = None) -> None:
+        if not items:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.set(self.prefix + key, json.dumps(value), px=int(ttl * 1000) if ttl else None)
+        pipe.execute()
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+
+_DEFAULT_STORE = None
+_DEFAULT_STORE_LOCK = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """Process-wide store selected by SESSION_BACKEND."""
+    global _DEFAULT_STORE
+    with _DEFAULT_STORE_LOCK:
+        if _DEFAULT_STORE is None:
+            if SESSION_BACKEND == "redis":
+                _DEFAULT_STORE = RedisSessionStore(REDIS_URL)
+            elif SESSION_BACKEND == "memory":
+                _DEFAULT_STORE = InMemorySessionStore()
+            else:
+                raise ValueError(f"SESSION_BACKEND must be 'memory' or 'redis', got {SESSION_BACKEND!r}")
+        return _DEFAULT_STORE
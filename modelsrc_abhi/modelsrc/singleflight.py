@@ -0,0 +1,188 @@
+"""Coalesce identical in-flight LLM calls (single-flight).
+
+When the same rendered prompt is requested again while a call for it is still
+running (client retries, several users pressing the same quick-reply), the
+later callers wait for the running call instead of sending a duplicate
+request upstream:
+
+    do(key, fn)            blocking callers share fn()'s result or exception
+    stream(key, factory)   async streams share one upstream token stream; a
+                           late joiner first receives the chunks produced so
+                           far, then follows along live
+
+A caller whose shared call failed elsewhere gets a SharedCallError chained to
+the original exception.
+
+Keys come from response_cache.prompt_key, so only byte-identical prompts for
+the same model settings are merged. Disable with SINGLE_FLIGHT=0.
+"""
+
+import asyncio
+import os
+import threading
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT", "1") != "0"
+
+
+class SharedCallError(RuntimeError):
+    """A coalesced call failed in the caller that ran it; __cause__ is the original error.
+
+    Each waiting caller gets its own instance, so tracebacks do not pile up on
+    one shared exception. The status_code and retry_after of the original are
+    kept so callers can still tell rate limiting from other failures.
+    """
+
+    def __init__(self, message: str, cause: BaseException):
+        super().__init__(message)
+        self.status_code = getattr(cause, "status_code", None)
+        self.retry_after = getattr(cause, "retry_after", None)
+
+
+def _shared_error(e: BaseException, cancelled: bool = False) -> SharedCallError:
+    message = "shared stream was cancelled" if cancelled else str(e) or type(e).__name__
+    return SharedCallError(message, e)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class _Flight:
+    """One shared upstream stream and its replay buffer."""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self.cancelled = False
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self.wake = asyncio.Event()
+
+    def notify(self) -> None:
+        # Swap in a fresh event so each wait() sees only later changes
+        wake, self.wake = self.wake, asyncio.Event()
+        wake.set()
+
+
+class SingleFlight:
+    """Per-key deduplication of concurrent calls.
+
+    Args:
+        enabled: When False every call runs on its own.
+    """
+
+    def __init__(self, enabled: bool = SINGLE_FLIGHT_ENABLED):
+        self.enabled = enabled
+        self._calls: Dict[str, _Call] = {}
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def _count(self, leader: bool) -> None:
+        with self._lock:
+            if leader:
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+    def do(self, key: Optional[str], fn: Callable[[], str]) -> str:
+        """Run fn() once for all concurrent callers with the same key."""
+        if not self.enabled or key is None:
+            return fn()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.followers += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise _shared_error(call.error) from call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def stream(self, key: Optional[str], factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Join (or start) the shared stream for `key` and yield its chunks.
+
+        The upstream stream runs in its own task so it survives the caller that
+        started it disconnecting; it is cancelled once no subscriber is left.
+        """
+        if not self.enabled or key is None:
+            async for chunk in factory():
+                yield chunk
+            return
+
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.create_task(self._produce(key, flight, factory))
+        self._count(leader)
+        flight.subscribers += 1
+
+        position = 0
+        try:
+            while True:
+                while position < len(flight.chunks):
+                    yield flight.chunks[position]
+                    position += 1
+                if flight.finished:
+                    if flight.error is not None:
+                        raise _shared_error(flight.error, flight.cancelled) from flight.error
+                    return
+                await flight.wake.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.finished:
+                flight.task.cancel()
+
+    async def _produce(self, key: str, flight: _Flight, factory: Callable[[], AsyncIterator[str]]) -> None:
+        try:
+            async for chunk in factory():
+                flight.chunks.append(chunk)
+                flight.notify()
+        except asyncio.CancelledError as e:
+            flight.error = e
+            # A CancelledError from inside the upstream call is just a failure
+            flight.cancelled = asyncio.current_task().cancelling() > 0
+            if flight.cancelled:
+                raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.finished = True
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.notify()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "in_flight": len(self._calls) + len(self._flights),
+            }
+
+
+# Shared by both personas (keys include the full prompt, so they never collide)
+SINGLE_FLIGHT = SingleFlight()
@@ -0,0 +1,106 @@
+"""Local stand-in for the Groq chat model, for benchmarks and offline runs.
+
+Selected with LLM_BACKEND=stub. Replies after a configurable time-to-first-token
+and then emits tokens at a fixed rate, so load tests exercise the real
+retrieval, prompt and streaming paths with predictable LLM timing and no
+network or API key.
+
+    STUB_LLM_TTFT_MS         delay before the first token (default 300)
+    STUB_LLM_TOKENS_PER_SEC  generation rate after that (default 200)
+    STUB_LLM_REPLY_TOKENS    reply length in tokens (default 120)
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+STUB_LLM_TTFT_MS = float(os.getenv("STUB_LLM_TTFT_MS", "300"))
+STUB_LLM_TOKENS_PER_SEC = float(os.getenv("STUB_LLM_TOKENS_PER_SEC", "200"))
+STUB_LLM_REPLY_TOKENS = int(os.getenv("STUB_LLM_REPLY_TOKENS", "120"))
+
+_REPLY_WORDS = (
+    "I hear you, and it makes sense that you feel this way right now. "
+    "It sounds like a lot has been building up. Would you like to tell me more "
+    "about what has been weighing on you the most? Sometimes naming it helps. "
+    "Let's take it one step at a time, together."
+).split()
+
+
+class StubChatModel(BaseChatModel):
+    """Chat model with synthetic, deterministic output and configurable timing."""
+
+    ttft_ms: float = STUB_LLM_TTFT_MS
+    tokens_per_sec: float = STUB_LLM_TOKENS_PER_SEC
+    reply_tokens: int = STUB_LLM_REPLY_TOKENS
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _tokens(self, messages: List[BaseMessage]) -> List[str]:
+        # Start at a prompt-dependent offset so different prompts differ
+        digest = hashlib.sha1(str(messages[-1].content).encode()).digest()
+        offset = digest[0] % len(_REPLY_WORDS)
+        return [
+            _REPLY_WORDS[(offset + i) % len(_REPLY_WORDS)] + " "
+            for i in range(self.reply_tokens)
+        ]
+
+    @property
+    def _token_interval(self) -> float:
+        return 1.0 / self.tokens_per_sec if self.tokens_per_sec > 0 else 0.0
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tokens = self._tokens(messages)
+        time.sleep(self.ttft_ms / 1000 + self._token_interval * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tokens = self._tokens(messages)
+        await asyncio.sleep(self.ttft_ms / 1000 + self._token_interval * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.ttft_ms / 1000)
+        for i, token in enumerate(self._tokens(messages)):
+            if i:
+                time.sleep(self._token_interval)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.ttft_ms / 1000)
+        for i, token in enumerate(self._tokens(messages)):
+            if i:
+                await asyncio.sleep(self._token_interval)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
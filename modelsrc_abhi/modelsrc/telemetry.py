@@ -0,0 +1,171 @@
+"""Request-scoped stage timings, exported as Prometheus histograms.
+
+Each HTTP request gets a RequestTimings object in a context variable (set by
+the middleware in app.py). Code on the request path wraps its stages in
+`span("embed")`, `span("faiss")`, ... and the durations are
+
+    - observed into the `chat_stage_seconds` histogram (per endpoint and stage)
+    - collected on the request, for the optional Server-Timing response header
+
+Context variables follow the request into worker threads (asyncio.to_thread
+and FastAPI's threadpool copy the context), so spans recorded there land on
+the right request. Without a current request (CLI, warm-up) spans still feed
+the histograms under endpoint="none".
+
+Implements the Prometheus text format directly so no client library is needed.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Upper bounds in seconds; covers cache hits (ms) through slow LLM replies
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """Thread-safe cumulative histogram with a fixed label set."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], buckets: Sequence[float] = STAGE_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (+Inf last), then sum
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: list(series) for key, series in sorted(self._series.items())}
+        for key, series in snapshot.items():
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key))
+            prefix = labels + "," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("chat_stage_seconds", "Duration of a request stage.", ["endpoint", "stage"])
+REQUEST_SECONDS = Histogram("chat_request_seconds", "Time until the response headers were sent.", ["endpoint", "status"])
+_REGISTRY = [REQUEST_SECONDS, STAGE_SECONDS]
+
+
+class RequestTimings:
+    """Stage durations collected for one request."""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        # Repeated stages (e.g. several avatar tasks) are summed
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def server_timing(self, total: Optional[float] = None) -> str:
+        """Server-Timing header value, durations in milliseconds."""
+        with self._lock:
+            items = list(self.stages.items())
+        if total is not None:
+            items.append(("total", total))
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in items)
+
+
+_CURRENT: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def begin_request(endpoint: str) -> RequestTimings:
+    """Start collecting timings for the request running in this context."""
+    timings = RequestTimings(endpoint)
+    _CURRENT.set(timings)
+    return timings
+
+
+def current() -> Optional[RequestTimings]:
+    return _CURRENT.get()
+
+
+def record(stage: str, seconds: float) -> None:
+    """Record an already-measured stage duration."""
+    timings = _CURRENT.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+    STAGE_SECONDS.observe(seconds, endpoint=timings.endpoint if timings else "none", stage=stage)
+
+
+def observe_request(endpoint: str, status: int, seconds: float) -> None:
+    REQUEST_SECONDS.observe(seconds, endpoint=endpoint, status=status)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time the enclosed block as `stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def timed_iter(chunks: Iterable[str], stage: str = "llm") -> Iterator[str]:
+    """Relay a token iterator, recording `<stage>_ttft` and `<stage>_total`."""
+    start = time.perf_counter()
+    first = True
+    try:
+        for chunk in chunks:
+            if first:
+                record(f"{stage}_ttft", time.perf_counter() - start)
+                first = False
+            yield chunk
+    finally:
+        record(f"{stage}_total", time.perf_counter() - start)
+
+
+async def atimed_iter(chunks: AsyncIterator[str], stage: str = "llm") -> AsyncIterator[str]:
+    """Async counterpart of timed_iter."""
+    start = time.perf_counter()
+    first = True
+    try:
+        async for chunk in chunks:
+            if first:
+                record(f"{stage}_ttft", time.perf_counter() - start)
+                first = False
+            yield chunk
+    finally:
+        record(f"{stage}_total", time.perf_counter() - start)
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines: List[str] = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
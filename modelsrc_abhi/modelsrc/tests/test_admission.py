@@ -0,0 +1,164 @@
+import asyncio
+import ipaddress
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+import admission
+
+PROXIES = [ipaddress.ip_network("10.0.0.0/8")]
+
+
+def scope(client="203.0.113.7", headers=(), user=None):
+    s = {"type": "http", "client": (client, 50000), "headers": list(headers)}
+    if user is not None:
+        s["user"] = user
+    return s
+
+
+class User:
+    def __init__(self, name, authenticated=True):
+        self.display_name = name
+        self.is_authenticated = authenticated
+
+
+# ---------- Client keys ----------
+def test_forwarded_for_ignored_from_untrusted_peer():
+    s = scope(headers=[(b"x-forwarded-for", b"198.51.100.1")])
+    assert admission._client_key(s, PROXIES) == "ip:203.0.113.7"
+
+
+def test_user_id_header_is_not_trusted():
+    s = scope(headers=[(b"x-user-id", b"someone-else")])
+    assert admission._client_key(s, PROXIES) == "ip:203.0.113.7"
+
+
+def test_rightmost_untrusted_hop_behind_trusted_proxy():
+    # The client spoofed the leftmost entry; our proxies appended the rest
+    s = scope(client="10.0.0.2", headers=[(b"x-forwarded-for", b"1.2.3.4, 198.51.100.9, 10.0.0.1")])
+    assert admission._client_key(s, PROXIES) == "ip:198.51.100.9"
+
+
+def test_repeated_forwarded_for_headers_are_joined_in_order():
+    s = scope(client="10.0.0.2", headers=[
+        (b"x-forwarded-for", b"1.2.3.4"),
+        (b"x-forwarded-for", b"198.51.100.9"),
+    ])
+    assert admission._client_key(s, PROXIES) == "ip:198.51.100.9"
+
+
+def test_trusted_proxy_without_forwarded_for_uses_peer():
+    assert admission._client_key(scope(client="10.0.0.2"), PROXIES) == "ip:10.0.0.2"
+
+
+def test_authenticated_user_wins():
+    assert admission._client_key(scope(user=User("alice")), PROXIES) == "user:alice"
+    assert admission._client_key(scope(user=User("anon", authenticated=False)), PROXIES) == "ip:203.0.113.7"
+
+
+# ---------- Responses ----------
+def make_app(limiters, rate_limiter=None):
+    app = FastAPI()
+
+    @app.get("/slow")
+    async def slow():
+        await asyncio.sleep(0.2)
+        return {"ok": True}
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for i in range(3):
+                await asyncio.sleep(0.05)
+                yield f"{i}\n"
+        return StreamingResponse(chunks())
+
+    app.add_middleware(admission.AdmissionMiddleware, limiters=limiters, rate_limiter=rate_limiter)
+    return app
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _client(app, **kwargs):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app, **kwargs), base_url="http://test")
+
+
+def test_queue_overflow_is_rejected_with_503():
+    async def main():
+        limiter = admission.ConcurrencyLimiter(max_concurrent=1, max_queue=1, queue_timeout=1)
+        async with await _client(make_app({"/slow": limiter})) as client:
+            responses = await asyncio.gather(*(client.get("/slow") for _ in range(4)))
+        return responses, limiter.stats()
+
+    responses, stats = run(main())
+    codes = sorted(r.status_code for r in responses)
+    assert codes == [200, 200, 503, 503]
+    assert all(r.headers["retry-after"] == "1" for r in responses if r.status_code == 503)
+    assert stats["admitted"] == 2 and stats["rejected"] == 2 and stats["active"] == 0
+
+
+def test_queue_timeout_is_rejected_with_503():
+    async def main():
+        limiter = admission.ConcurrencyLimiter(max_concurrent=1, max_queue=5, queue_timeout=0.05)
+        async with await _client(make_app({"/slow": limiter})) as client:
+            return await asyncio.gather(client.get("/slow"), client.get("/slow"))
+
+    assert sorted(r.status_code for r in run(main())) == [200, 503]
+
+
+def test_stream_holds_its_slot_until_finished():
+    async def main():
+        limiter = admission.ConcurrencyLimiter(max_concurrent=1, max_queue=0, queue_timeout=1)
+        async with await _client(make_app({"/stream": limiter})) as client:
+            first = asyncio.create_task(client.get("/stream"))
+            await asyncio.sleep(0.07)  # first stream has started but not finished
+            second = await client.get("/stream")
+            return (await first), second, limiter.stats()
+
+    first, second, stats = run(main())
+    assert first.status_code == 200 and first.text == "0\n1\n2\n"
+    assert second.status_code == 503
+    assert stats["active"] == 0
+
+
+def test_rate_limit_is_rejected_with_429():
+    async def main():
+        limiter = admission.ConcurrencyLimiter(max_concurrent=10, max_queue=10, queue_timeout=1)
+        rate_limiter = admission.RateLimiter(per_minute=60, burst=2)
+        app = make_app({"/slow": limiter}, rate_limiter)
+        async with await _client(app, client=("203.0.113.7", 1)) as client:
+            spoofed = {"x-forwarded-for": "198.51.100.1", "x-user-id": "fresh"}
+            return [await client.get("/slow", headers=spoofed) for _ in range(3)]
+
+    responses = run(main())
+    assert [r.status_code for r in responses] == [200, 200, 429]
+    assert int(responses[-1].headers["retry-after"]) >= 1
+
+
+def test_unguarded_paths_pass_through():
+    async def main():
+        async with await _client(make_app({})) as client:
+            return await client.get("/slow")
+
+    assert run(main()).status_code == 200
+
+
+def test_rate_limiting_defaults_off_without_trusted_proxies(monkeypatch, caplog):
+    monkeypatch.setattr(admission, "TRUSTED_PROXIES", [])
+    monkeypatch.setattr(admission, "RATE_LIMIT_CONFIGURED", False)
+    monkeypatch.setattr(admission, "RATE_LIMIT_PER_MINUTE", 0.0)
+
+    assert admission.default_rate_limiter() is None
+    assert "TRUSTED_PROXIES" in caplog.text
+
+
+def test_explicit_rate_limit_without_proxies_warns(monkeypatch, caplog):
+    monkeypatch.setattr(admission, "TRUSTED_PROXIES", [])
+    monkeypatch.setattr(admission, "RATE_LIMIT_CONFIGURED", True)
+    monkeypatch.setattr(admission, "RATE_LIMIT_PER_MINUTE", 30.0)
+
+    assert admission.default_rate_limiter() is not None
+    assert "share one" in caplog.text
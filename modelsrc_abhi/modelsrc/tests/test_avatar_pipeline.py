@@ -0,0 +1,57 @@
+import asyncio
+
+import avatar_pipeline
+from avatar_pipeline import SentenceSegmenter
+
+
+async def _tokens(text):
+    for word in text.split(" "):
+        yield word + " "
+
+
+def test_segmenter_merges_short_sentences():
+    segmenter = SentenceSegmenter(min_chars=10)
+    assert segmenter.feed("Hi. That sounds really hard. ") == ["Hi. That sounds really hard."]
+    assert segmenter.feed("Tell me more") == []
+    assert segmenter.flush() == "Tell me more"
+
+
+def test_stream_ends_before_the_avatar_has_spoken(monkeypatch):
+    async def main():
+        release, spoken = asyncio.Event(), []
+
+        async def send_task(session_id, text, task_type="talk"):
+            await release.wait()
+            spoken.append(text)
+
+        monkeypatch.setattr(avatar_pipeline, "send_task", send_task)
+        text = "That sounds like a long day. Do you want to talk about it? I am here."
+        relayed = [c async for c in avatar_pipeline.speak_stream(_tokens(text), "s1")]
+
+        # The text stream is complete while every sentence is still pending
+        assert "".join(relayed).strip() == text
+        assert spoken == []
+        release.set()
+        await asyncio.gather(*avatar_pipeline._speakers)
+        return spoken
+
+    assert asyncio.run(main()) == [
+        "That sounds like a long day.", "Do you want to talk about it?", "I am here.",
+    ]
+
+
+def test_background_speaker_is_cancelled_after_drain_timeout(monkeypatch):
+    async def main():
+        async def send_task(session_id, text, task_type="talk"):
+            await asyncio.Event().wait()
+
+        monkeypatch.setattr(avatar_pipeline, "send_task", send_task)
+        monkeypatch.setattr(avatar_pipeline, "AVATAR_DRAIN_TIMEOUT", 0.05)
+        [c async for c in avatar_pipeline.speak_stream(_tokens("A sentence that never gets spoken."), "s1")]
+        speakers = list(avatar_pipeline._speakers)
+        await asyncio.gather(*speakers, return_exceptions=True)
+        return speakers
+
+    speakers = asyncio.run(main())
+    assert len(speakers) == 1 and speakers[0].cancelled()
+    assert not avatar_pipeline._speakers
@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from build_index import _check_work_dir, _dataset_fingerprint, iter_json_array
+
+ROWS = [{"Context": f"context {i}", "Response": "r" * (i % 7)} for i in range(50)]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 20])
+def test_iter_json_array_across_chunk_boundaries(tmp_path, chunk_size):
+    path = tmp_path / "rows.json"
+    path.write_text(json.dumps(ROWS, indent=2))
+
+    assert list(iter_json_array(str(path), chunk_size=chunk_size)) == ROWS
+
+
+def test_iter_json_array_empty_and_invalid(tmp_path):
+    empty = tmp_path / "empty.json"
+    empty.write_text(" [ ] ")
+    assert list(iter_json_array(str(empty))) == []
+
+    not_array = tmp_path / "object.json"
+    not_array.write_text('{"Context": "x"}')
+    with pytest.raises(ValueError):
+        list(iter_json_array(str(not_array)))
+
+    truncated = tmp_path / "truncated.json"
+    truncated.write_text('[{"Context": "x"}, {"Cont')
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_array(str(truncated), chunk_size=8))
+
+
+def test_edited_dataset_invalidates_work_dir(tmp_path):
+    dataset = tmp_path / "rows.json"
+    dataset.write_text(json.dumps(ROWS))
+    work_dir = str(tmp_path / "build")
+
+    def params():
+        return {"datasets": _dataset_fingerprint([str(dataset)]), "batch_size": 8}
+
+    _check_work_dir(work_dir, params())
+    _check_work_dir(work_dir, params())  # unchanged inputs resume
+
+    dataset.write_text(json.dumps(ROWS + [{"Context": "new", "Response": "row"}]))
+    with pytest.raises(SystemExit):
+        _check_work_dir(work_dir, params())
@@ -0,0 +1,89 @@
+from conversation_memory import ConversationMemory, extractive_summarizer
+from session_store import InMemorySessionStore
+from token_counter import count_tokens
+
+
+def memory(**kwargs):
+    return ConversationMemory("test", store=InMemorySessionStore(), **kwargs)
+
+
+def turn(memory, session_id, n):
+    state = memory.load(session_id)
+    memory.record(session_id, state, f"User message {n}. " + "word " * 20, f"Reply {n}. " + "word " * 20, "Counsellor")
+    return memory.load(session_id)
+
+
+def test_turns_within_budget_are_kept_verbatim():
+    mem = memory(token_budget=10_000)
+    for n in range(3):
+        state = turn(mem, "s1", n)
+
+    assert state["summary"] == ""
+    assert [user.split(".")[0] for user, _ in state["turns"]] == ["User message 0", "User message 1", "User message 2"]
+
+
+def test_turns_over_budget_fold_into_the_summary():
+    one_turn = count_tokens("User message 0. " + "word " * 20) + count_tokens("Reply 0. " + "word " * 20)
+    mem = memory(token_budget=int(one_turn * 2.5), summary_tokens=10_000)
+    for n in range(5):
+        state = turn(mem, "s1", n)
+
+    # Two turns fit; the three oldest are summarized in order
+    assert [user.split(".")[0] for user, _ in state["turns"]] == ["User message 3", "User message 4"]
+    assert state["summary"].split("\n") == [
+        f"User said: User message {n}. Counsellor replied: Reply {n}." for n in range(3)
+    ]
+
+
+def test_latest_turn_is_kept_even_if_it_alone_exceeds_the_budget():
+    mem = memory(token_budget=1)
+    state = turn(mem, "s1", 0)
+
+    assert len(state["turns"]) == 1 and state["summary"] == ""
+
+
+def test_summary_drops_its_oldest_lines_past_its_cap():
+    mem = memory(token_budget=1, summary_tokens=30)
+    for n in range(10):
+        state = turn(mem, "s1", n)
+
+    lines = state["summary"].split("\n")
+    assert count_tokens(state["summary"]) <= 30
+    assert lines[-1].startswith("User said: User message 8.")
+
+
+def test_render_and_anonymous_sessions():
+    mem = memory()
+    state = {"summary": "User said: hi", "turns": [["How are you?", "Fine."]]}
+
+    assert mem.render(state, "Counsellor") == (
+        "Summary of earlier conversation:\nUser said: hi\n\nUser: How are you?\nCounsellor: Fine."
+    )
+    mem.record(None, {}, "hello", "hi", "Counsellor")
+    assert mem.load(None) == {} and mem.load("") == {}
+
+
+def test_sessions_and_namespaces_are_separate():
+    store = InMemorySessionStore()
+    a, b = ConversationMemory("a", store=store), ConversationMemory("b", store=store)
+    a.record("s1", {}, "hello", "hi", "A")
+
+    assert a.load("s1")["turns"] == [["hello", "hi"]]
+    assert a.load("s2") == {} and b.load("s1") == {}
+    a.clear("s1")
+    assert a.load("s1") == {}
+
+
+def test_extractive_summarizer_caps_the_gist():
+    summary = extractive_summarizer("", "one " * 30, "Short reply! More.", "Counsellor")
+
+    assert summary == "User said: " + "one " * 19 + "one… Counsellor replied: Short reply!"
+
+
+def test_concurrent_turns_of_one_session_are_last_writer_wins():
+    mem = memory()
+    first, second = mem.load("s1"), mem.load("s1")
+    mem.record("s1", first, "first", "reply 1", "Counsellor")
+    mem.record("s1", second, "second", "reply 2", "Counsellor")
+
+    assert mem.load("s1")["turns"] == [["second", "reply 2"]]
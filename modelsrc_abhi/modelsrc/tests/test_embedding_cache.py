@@ -0,0 +1,76 @@
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import CachedQueryEmbeddings, normalize_query
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.queries = []
+
+    def embed_documents(self, texts):
+        return [[float(len(t))] for t in texts]
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [float(len(text)), 1.0]
+
+
+def test_normalized_queries_share_one_entry():
+    base = CountingEmbeddings()
+    cache = CachedQueryEmbeddings(base, max_size=4)
+
+    first = cache.embed_query("I feel  Anxious ")
+    second = cache.embed_query("i feel anxious")
+
+    assert first == second
+    assert base.queries == ["i feel anxious"]
+    assert normalize_query(" A\tB  c ") == "a b c"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    base = CountingEmbeddings()
+    cache = CachedQueryEmbeddings(base, max_size=2)
+    cache.embed_query("a")
+    cache.embed_query("b")
+    cache.embed_query("a")  # refreshes a, so b is now the oldest
+    cache.embed_query("c")
+
+    cache.embed_query("a")
+    assert base.queries == ["a", "b", "c"]
+    cache.embed_query("b")
+    assert base.queries == ["a", "b", "c", "b"]
+
+    stats = cache.stats()
+    assert (stats["size"], stats["hits"], stats["misses"]) == (2, 2, 4)
+    assert stats["hit_rate"] == 2 / 6
+
+
+def test_evicted_entries_spill_to_sqlite(tmp_path):
+    base = CountingEmbeddings()
+    cache = CachedQueryEmbeddings(base, max_size=1, spill_path=str(tmp_path / "spill.db"))
+    vector = cache.embed_query("a")
+    cache.embed_query("b")  # evicts a to the spill file
+
+    assert cache.embed_query("a") == vector
+    assert base.queries == ["a", "b"]
+    assert cache.stats()["spill_hits"] == 1
+
+
+def test_returned_vectors_are_copies_and_documents_bypass_the_cache():
+    base = CountingEmbeddings()
+    cache = CachedQueryEmbeddings(base, max_size=2)
+    cache.embed_query("a").append(99.0)
+
+    assert cache.embed_query("a") == [1.0, 1.0]
+    assert cache.embed_documents(["xy"]) == [[2.0]]
+    assert cache.stats()["size"] == 1
+
+
+def test_clear_resets_entries_and_counters():
+    cache = CachedQueryEmbeddings(CountingEmbeddings(), max_size=2)
+    cache.embed_query("a")
+    cache.embed_query("a")
+    cache.clear()
+
+    assert cache.stats() == {"size": 0, "max_size": 2, "hits": 0, "spill_hits": 0, "misses": 0, "hit_rate": 0.0}
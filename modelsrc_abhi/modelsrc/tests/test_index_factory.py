@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+import index_factory
+import index_store
+
+DIM = 32
+
+
+class ZeroEmbeddings(Embeddings):
+    # Searches below go through the *_by_vector methods; text is never embedded
+    def embed_documents(self, texts):
+        return [[0.0] * DIM for _ in texts]
+
+    def embed_query(self, text):
+        return [0.0] * DIM
+
+
+@pytest.fixture(scope="module")
+def vectors():
+    return np.random.default_rng(0).standard_normal((2000, DIM)).astype(np.float32)
+
+
+@pytest.fixture(scope="module")
+def ivf_store(vectors):
+    text_embeddings = [(f"doc {i}", v.tolist()) for i, v in enumerate(vectors)]
+    return index_factory.build_vectorstore(text_embeddings, ZeroEmbeddings(), index_type="ivf", nlist=16)
+
+
+def test_ivf_index_is_built(ivf_store):
+    assert index_factory.index_type_of(ivf_store.index) == "ivf"
+
+
+def test_mmr_on_ivf_in_memory(ivf_store, vectors):
+    hits = ivf_store.max_marginal_relevance_search_with_score_by_vector(vectors[0].tolist(), k=3, fetch_k=10)
+    assert len(hits) == 3
+    assert hits[0][0].page_content == "doc 0"
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_mmr_on_ivf_after_save_and_load(ivf_store, vectors, tmp_path, mmap):
+    index_store.save_store(ivf_store, str(tmp_path))
+    loaded = index_store.load_store(str(tmp_path), ZeroEmbeddings(), mmap=mmap)
+    hits = loaded.max_marginal_relevance_search_with_score_by_vector(vectors[0].tolist(), k=3, fetch_k=10)
+    assert len(hits) == 3
+    assert hits[0][0].page_content == "doc 0"
+
+
+def test_store_saved_without_direct_map_still_supports_mmr(vectors, tmp_path):
+    faiss = index_factory.dependable_faiss_import()
+    text_embeddings = [(f"doc {i}", v.tolist()) for i, v in enumerate(vectors)]
+    store = index_factory.build_vectorstore(text_embeddings, ZeroEmbeddings(), index_type="flat")
+    # Swap in an IVF index as older releases wrote it, i.e. without a direct map
+    legacy = faiss.IndexIVFFlat(faiss.IndexFlatL2(DIM), DIM, 16)
+    legacy.train(vectors)
+    legacy.add(vectors)
+    legacy_bytes = faiss.serialize_index(legacy)
+    store.index = legacy
+    index_store.save_store(store, str(tmp_path))
+    faiss.write_index(faiss.deserialize_index(legacy_bytes), str(tmp_path / index_store.INDEX_FILE))
+    on_disk = faiss.extract_index_ivf(faiss.read_index(str(tmp_path / index_store.INDEX_FILE)))
+    assert on_disk.direct_map.type == faiss.DirectMap.NoMap
+
+    loaded = index_store.load_store(str(tmp_path), ZeroEmbeddings(), mmap=True)
+    assert len(loaded.max_marginal_relevance_search_with_score_by_vector(vectors[0].tolist(), k=3)) == 3
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from index_manager import IndexManager, read_manifest
+
+DIM = 32
+
+
+class CountingEmbeddings(Embeddings):
+    """Deterministic per-text vectors; records every text it embeds."""
+
+    def __init__(self):
+        self.embedded = []
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+        return np.random.default_rng(seed).standard_normal(DIM).astype(np.float32).tolist()
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+def to_document(row, row_id, source):
+    return Document(page_content=row["Context"], metadata={"id": row_id, "source": source})
+
+
+def rows(n, start=0):
+    return [{"Context": f"context {i}", "Response": f"response {i}"} for i in range(start, start + n)]
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    dataset = tmp_path / "data.json"
+    embeddings = CountingEmbeddings()
+
+    def manager(data, **settings):
+        dataset.write_text(json.dumps(data))
+        return IndexManager(
+            str(tmp_path / "faiss_index"), [str(dataset)], embeddings, to_document, "test-model",
+            index_settings=settings or None,
+        )
+
+    manager.embeddings = embeddings
+    manager.index_path = str(tmp_path / "faiss_index")
+    return manager
+
+
+def test_ivfpq_fallback_on_small_corpus_is_not_rebuilt(corpus):
+    data = rows(67)
+    corpus(data, index_type="ivfpq", pq_m=8, pq_bits=8).sync()
+    manifest = read_manifest(corpus.index_path)
+    assert manifest["index_type"] == "flat"
+    assert manifest["requested_index_type"] == "ivfpq"
+
+    corpus.embeddings.embedded.clear()
+    _, report = corpus(data, index_type="ivfpq", pq_m=8, pq_bits=8).sync()
+
+    assert report["added"] == 0 and report["removed"] == 0
+    assert corpus.embeddings.embedded == []
+
+
+def test_ivfpq_corpus_that_outgrows_the_fallback_is_rebuilt(corpus):
+    corpus(rows(67), index_type="ivfpq", pq_m=8, pq_bits=8).sync()
+
+    vectorstore, _ = corpus(rows(300), index_type="ivfpq", pq_m=8, pq_bits=8).sync()
+
+    assert read_manifest(corpus.index_path)["index_type"] == "ivfpq"
+    assert vectorstore.index.ntotal == 300
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf"])
+def test_sync_embeds_only_changed_rows(corpus, index_type):
+    data = rows(100)
+    corpus(data, index_type=index_type).sync()
+    assert len(corpus.embeddings.embedded) == 100
+
+    def resync(new_data):
+        corpus.embeddings.embedded.clear()
+        vectorstore, report = corpus(new_data, index_type=index_type).sync()
+        return vectorstore, report, list(corpus.embeddings.embedded)
+
+    _, report, embedded = resync(data)
+    assert (report["added"], report["removed"], embedded) == (0, 0, [])
+
+    data = data + rows(1, start=100)
+    vectorstore, report, embedded = resync(data)
+    assert (report["added"], report["removed"], embedded) == (1, 0, ["context 100"])
+    assert vectorstore.index.ntotal == 101
+
+    data = [dict(data[0], Context="context 0, edited")] + data[1:]
+    vectorstore, report, embedded = resync(data)
+    assert (report["added"], report["removed"], embedded) == (1, 1, ["context 0, edited"])
+    hits = vectorstore.similarity_search("context 0, edited", k=1)
+    assert hits[0].page_content == "context 0, edited"
+
+    data = data[:-1]
+    vectorstore, report, embedded = resync(data)
+    assert (report["added"], report["removed"], embedded) == (0, 1, [])
+    assert vectorstore.index.ntotal == 100
+    assert len(read_manifest(corpus.index_path)["rows"]) == 100
+    assert "context 100" not in {d.page_content for d in vectorstore.similarity_search("context 100", k=100)}
+
+
+def test_removing_rows_from_ivfpq_re_embeds_everything(corpus):
+    data = rows(300)
+    corpus(data, index_type="ivfpq", pq_m=8, pq_bits=8).sync()
+    corpus.embeddings.embedded.clear()
+
+    vectorstore, report = corpus(data[1:], index_type="ivfpq", pq_m=8, pq_bits=8).sync()
+
+    assert report["removed"] == 1
+    assert len(corpus.embeddings.embedded) == 299
+    assert vectorstore.index.ntotal == 299
+
+
+def test_sync_publishes_versions_through_a_symlink(corpus):
+    index_path = corpus.index_path
+    corpus(rows(10)).sync()
+    first = os.path.realpath(index_path)
+    assert os.path.islink(index_path)
+
+    corpus(rows(11)).sync()
+    second = os.path.realpath(index_path)
+    corpus(rows(12)).sync()
+    third = os.path.realpath(index_path)
+
+    assert len({first, second, third}) == 3
+    # The previous version stays for readers still loading it; older ones go
+    assert not os.path.exists(first)
+    assert os.path.isdir(second) and os.path.isdir(third)
+    assert not [name for name in os.listdir(os.path.dirname(index_path)) if ".link-" in name]
+
+
+def test_legacy_directory_is_migrated(corpus):
+    from langchain_community.vectorstores import FAISS
+
+    index_path = corpus.index_path
+    data = rows(5)
+    texts = [row["Context"] for row in data]
+    FAISS.from_texts(texts, corpus.embeddings).save_local(index_path)
+
+    vectorstore, report = corpus(data).sync()
+
+    assert os.path.islink(index_path)
+    assert report["added"] == 5
+    legacy = [name for name in os.listdir(os.path.dirname(index_path)) if ".legacy-" in name]
+    assert len(legacy) == 1
+    assert vectorstore.similarity_search("context 3", k=1)[0].page_content == "context 3"
@@ -0,0 +1,77 @@
+import json
+
+import ingestion
+from ingestion import clean_text, ingest_rows, load_records, trim_response
+
+
+def test_rows_sharing_a_context_become_one_record():
+    rows = [
+        ({"Context": "I  can't sleep", "Response": "Try a routine."}, "a.json"),
+        ({"Context": "i can't sleep", "Response": "Limit caffeine."}, "a.json"),
+        ({"Context": "I feel alone", "Response": "That sounds hard."}, "b.json"),
+    ]
+
+    records = list(ingest_rows(rows).values())
+
+    assert records == [
+        ({"context": "I can't sleep", "responses": ["Try a routine.", "Limit caffeine."]}, "a.json"),
+        ({"context": "I feel alone", "responses": ["That sounds hard."]}, "b.json"),
+    ]
+
+
+def test_responses_are_deduplicated_and_capped(monkeypatch):
+    monkeypatch.setattr(ingestion, "MAX_RESPONSES_PER_CONTEXT", 2)
+    rows = [({"Context": "ctx", "Response": r}, "a.json") for r in ["one", "one ", "two", "three"]]
+
+    (record, _), = ingest_rows(rows).values()
+
+    assert record["responses"] == ["one", "two"]
+
+
+def test_rows_without_context_are_skipped_and_legacy_text_is_accepted():
+    rows = [({"Response": "orphan"}, "a.json"), ({"text": "legacy"}, "a.json")]
+
+    (record, _), = ingest_rows(rows).values()
+
+    assert record == {"context": "legacy", "responses": []}
+
+
+def test_record_keys_are_content_hashes():
+    rows = [({"Context": "ctx", "Response": "one"}, "a.json")]
+    first = ingest_rows(rows)
+    assert list(first) == list(ingest_rows(rows))
+
+    changed = ingest_rows([({"Context": "ctx", "Response": "two"}, "a.json")])
+    assert list(first) != list(changed)
+
+
+def test_trim_response_prefers_a_sentence_boundary():
+    text = "First sentence here. Second one follows. Third runs on and on and on."
+
+    assert trim_response(text, max_chars=len(text)) == text
+    assert trim_response(text, max_chars=45) == "First sentence here. Second one follows."
+    # No boundary in the back half: cut at a word and mark the elision
+    assert trim_response("word " * 20, max_chars=22) == "word word word word…"
+
+
+def test_long_responses_are_trimmed_on_ingest():
+    long = "This is one sentence. " * 100
+
+    (record, _), = ingest_rows([({"Context": "ctx", "Response": long}, "a.json")]).values()
+
+    response = record["responses"][0]
+    assert len(response) <= ingestion.MAX_RESPONSE_CHARS
+    assert response.endswith("sentence.")
+
+
+def test_load_records_reads_every_dataset(tmp_path):
+    paths = []
+    for name, rows in [("a.json", [{"Context": "one", "Response": "r1"}]), ("b.json", [{"Context": "two"}])]:
+        path = tmp_path / name
+        path.write_text(json.dumps(rows))
+        paths.append(str(path))
+
+    records = list(load_records(paths).values())
+
+    assert [(record["context"], source) for record, source in records] == [("one", "a.json"), ("two", "b.json")]
+    assert clean_text(" a \n b ") == "a b"
@@ -0,0 +1,180 @@
+import asyncio
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+import llm_router
+from llm_router import Route, RouterChatModel
+from mock_llm_server import make_server
+from openai_compat_llm import OpenAICompatChatModel
+
+PROMPT = [HumanMessage(content="hello")]
+
+
+@pytest.fixture
+def mock_server():
+    servers = []
+
+    def start(**config):
+        config = {"ttft_ms": 0, "tokens_per_sec": 0, "reply_tokens": 3, **config}
+        server = make_server(port=0, **config)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        host, port = server.server_address
+        return server, OpenAICompatChatModel(base_url=f"http://{host}:{port}/v1", model="mock")
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+class HangingChatModel(BaseChatModel):
+    """Never produces a token; records when its stream is cancelled."""
+
+    cancelled: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "hanging"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        raise NotImplementedError
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        raise AssertionError("the router must not call the blocking stream")
+
+    async def _astream(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            self.cancelled.set()
+            raise
+        yield ChatGenerationChunk(message=AIMessageChunk(content=""))
+
+
+def test_rate_limited_backend_fails_over_and_cools_down(mock_server):
+    limited, limited_model = mock_server(rate_limit_rate=1)
+    _, ok_model = mock_server()
+    router = RouterChatModel(
+        routes=[Route("limited", limited_model, 5), Route("ok", ok_model, 5)], hedge=False
+    )
+
+    assert router.invoke(PROMPT).content == "token0 token1 token2 "
+    first, second = router.stats()["routes"]
+    assert first["rate_limited"] == 1 and first["cooling_down"]
+    assert second["wins"] == 1
+
+    # While cooling down the limited backend is not tried at all
+    router.invoke(PROMPT)
+    assert limited.state.stats()["requests"] == 1
+
+
+def test_error_before_first_token_fails_over_async(mock_server):
+    _, failing_model = mock_server(error_rate=1)
+    _, ok_model = mock_server()
+    router = RouterChatModel(
+        routes=[Route("failing", failing_model, 5), Route("ok", ok_model, 5)], hedge=False
+    )
+
+    reply = asyncio.run(router.ainvoke(PROMPT))
+
+    assert reply.content == "token0 token1 token2 "
+    assert router.stats()["routes"][0]["errors"] == 1
+
+
+def test_first_token_timeout_fails_over(mock_server):
+    _, slow_model = mock_server(ttft_ms=2000)
+    _, ok_model = mock_server()
+    router = RouterChatModel(
+        routes=[Route("slow", slow_model, 0.2), Route("ok", ok_model, 5)], hedge=False
+    )
+
+    started = time.monotonic()
+    assert router.invoke(PROMPT).content == "token0 token1 token2 "
+    assert time.monotonic() - started < 1.5
+    assert router.stats()["routes"][0]["timeouts"] == 1
+
+
+def test_all_backends_failing_raises_last_error(mock_server):
+    _, failing_model = mock_server(error_rate=1)
+    router = RouterChatModel(routes=[Route("failing", failing_model, 5)], hedge=False)
+
+    with pytest.raises(Exception, match="HTTP 500"):
+        router.invoke(PROMPT)
+
+
+@pytest.mark.parametrize("sync", [True, False])
+def test_hedge_winner_cancels_losing_request(monkeypatch, mock_server, sync):
+    monkeypatch.setattr(llm_router, "LLM_HEDGE_AFTER_MS", 50)
+    hanging = HangingChatModel(cancelled=threading.Event())
+    _, ok_model = mock_server()
+    router = RouterChatModel(routes=[Route("hanging", hanging, 10), Route("ok", ok_model, 10)])
+
+    if sync:
+        reply = router.invoke(PROMPT)
+    else:
+        reply = asyncio.run(router.ainvoke(PROMPT))
+
+    assert reply.content == "token0 token1 token2 "
+    # The loser is cancelled, not left running until its own timeout
+    assert hanging.cancelled.wait(1)
+    assert router.stats()["routes"][1]["hedges"] == 1
+
+
+def test_closing_sync_stream_disconnects_upstream(mock_server):
+    server, model = mock_server(reply_tokens=200, tokens_per_sec=50)
+    router = RouterChatModel(routes=[Route("mock", model, 5)], hedge=False)
+
+    stream = router.stream(PROMPT)
+    next(stream)
+    stream.close()
+
+    deadline = time.monotonic() + 2
+    while server.state.stats()["disconnected"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert server.state.stats()["disconnected"] == 1
+
+
+class StallingChatModel(HangingChatModel):
+    """Sends one chunk, then goes silent."""
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        yield ChatGenerationChunk(message=AIMessageChunk(content="Hello"))
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            self.cancelled.set()
+            raise
+
+
+@pytest.mark.parametrize("sync", [True, False])
+def test_backend_stalling_mid_reply_times_out(mock_server, sync):
+    stalling = StallingChatModel(cancelled=threading.Event())
+    _, ok_model = mock_server()
+    router = RouterChatModel(routes=[Route("stalling", stalling, 0.2), Route("ok", ok_model, 5)], hedge=False)
+
+    started = time.monotonic()
+    received = []
+    with pytest.raises(TimeoutError, match="mid-reply"):
+        if sync:
+            for chunk in router.stream(PROMPT):
+                received.append(chunk.content)
+        else:
+            async def consume():
+                async for chunk in router.astream(PROMPT):
+                    received.append(chunk.content)
+            asyncio.run(consume())
+
+    # Committed to the first backend once it streamed; no failover mid-reply
+    assert received == ["Hello"]
+    assert time.monotonic() - started < 2
+    assert stalling.cancelled.wait(1)
+    assert router.stats()["routes"][0]["timeouts"] == 1
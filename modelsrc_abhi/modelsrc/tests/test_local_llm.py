@@ -0,0 +1,152 @@
+import ctypes
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import local_llm
+from local_llm import LlamaEngine
+
+
+@pytest.mark.parametrize("slots, n_batch", [(8, 4), (0, 512)])
+def test_engine_rejects_slots_that_cannot_share_a_batch(slots, n_batch):
+    # Checked before the model is loaded, so no GGUF file is needed
+    with pytest.raises(ValueError, match="LLAMA_SLOTS"):
+        LlamaEngine("missing.gguf", slots=slots, n_batch=n_batch)
+
+
+EOG = 0
+N_VOCAB = 50
+
+
+class FakeBatch:
+    def __init__(self, n_tokens, embd, n_seq_max, verbose):
+        self.batch = SimpleNamespace(
+            token=[0] * n_tokens, pos=[0] * n_tokens, n_seq_id=[0] * n_tokens,
+            seq_id=[[0] for _ in range(n_tokens)], logits=[False] * n_tokens, n_tokens=0,
+        )
+
+    def reset(self):
+        self.batch.n_tokens = 0
+
+
+class FakeContext:
+    """Records every decoded batch as (token, pos, seq) triples; the logits of a
+    sequence pick the next token from the script of its prompt's first token."""
+
+    def __init__(self, model, params, verbose):
+        self.scripts = model.scripts
+        self.decoded = []
+        self.removed = []
+        self._owner = {}  # seq id -> first prompt token
+        self._sampled = {}
+        self._logits = (ctypes.c_float * N_VOCAB)()
+
+    def decode(self, llama_batch):
+        batch = llama_batch.batch
+        self._batch = [(batch.token[i], batch.pos[i], batch.seq_id[i][0]) for i in range(batch.n_tokens)]
+        for token, pos, seq in self._batch:
+            if pos == 0:
+                self._owner[seq], self._sampled[seq] = token, 0
+        self.decoded.append(self._batch)
+
+    def get_logits_ith(self, index):
+        seq = self._batch[index][2]
+        token = self.scripts[self._owner[seq]][self._sampled[seq]]
+        self._sampled[seq] += 1
+        for i in range(N_VOCAB):
+            self._logits[i] = 1.0 if i == token else 0.0
+        return ctypes.cast(self._logits, ctypes.POINTER(ctypes.c_float))
+
+    def kv_cache_seq_rm(self, seq_id, p0, p1):
+        self.removed.append(seq_id)
+
+
+class FakeModel:
+    """Prompts are space-separated token ids; token t detokenizes to "t<t> "."""
+
+    scripts = {}
+
+    def __init__(self, path_model, params, verbose):
+        pass
+
+    def n_vocab(self):
+        return N_VOCAB
+
+    def token_eos(self):
+        return EOG
+
+    def token_eot(self):
+        return -1
+
+    def token_bos(self):
+        return -1
+
+    def token_get_text(self, token):
+        return ""
+
+    def metadata(self):
+        return {}
+
+    def add_bos_token(self):
+        return False
+
+    def tokenize(self, text, add_bos, special):
+        return [int(t) for t in text.split()]
+
+    def detokenize(self, tokens):
+        return "".join(f"t{t} " for t in tokens).encode()
+
+
+@pytest.fixture
+def fake_llama(monkeypatch):
+    llama_cpp = SimpleNamespace(
+        llama_model_default_params=SimpleNamespace, llama_context_default_params=SimpleNamespace
+    )
+    internals = SimpleNamespace(LlamaModel=FakeModel, LlamaContext=FakeContext, LlamaBatch=FakeBatch)
+    formatter = lambda **_: lambda messages: SimpleNamespace(prompt=messages[-1]["content"])
+    chat_format = SimpleNamespace(Jinja2ChatFormatter=formatter)
+    monkeypatch.setattr(local_llm, "_import_llama", lambda: (llama_cpp, internals, chat_format))
+    return FakeModel.scripts
+
+
+def test_scheduler_batches_slots_and_reuses_freed_ones(fake_llama):
+    fake_llama.update({10: [5, 6, EOG], 20: [7, 8, 9, 7, 8], 30: [3, EOG]})
+    engine = LlamaEngine("fake.gguf", slots=2, n_batch=8)
+    replies = {name: [] for name in "abc"}
+    finished = threading.Semaphore(0)
+
+    def emit(name):
+        def receive(piece):
+            replies[name].append(piece)
+            if piece is None or isinstance(piece, BaseException):
+                finished.release()
+        return receive
+
+    # Queue all three before the scheduler thread looks at the queue
+    with engine._cond:
+        for name, prompt, max_tokens in [("a", "10 11 12", 10), ("b", "20 21", 4), ("c", "30", 10)]:
+            engine.submit([{"role": "user", "content": prompt}], emit(name), max_tokens=max_tokens, temperature=0)
+    for _ in replies:
+        assert finished.acquire(timeout=5)
+    engine.close()
+
+    assert engine.ctx.decoded == [
+        # a and b are admitted into the two slots and prefilled in one batch
+        [(10, 0, 1), (11, 1, 1), (12, 2, 1), (20, 0, 0), (21, 1, 0)],
+        # then decode interleaves one token per generating sequence
+        [(5, 3, 1), (7, 2, 0)],
+        [(6, 4, 1), (8, 3, 0)],
+        # a hit EOG and freed slot 1; c, which was waiting, takes it at once
+        [(9, 4, 0), (30, 0, 1)],
+        # b reached max_tokens and freed slot 0
+        [(3, 1, 1)],
+    ]
+    assert replies == {
+        "a": ["t5 ", "t6 ", None],
+        "b": ["t7 ", "t8 ", "t9 ", "t7 ", None],
+        "c": ["t3 ", None],
+    }
+    assert engine.ctx.removed == [1, 0, 1]
+    stats = engine.stats()
+    assert (stats["active"], stats["waiting"], stats["requests"], stats["steps"]) == (0, 0, 3, 5)
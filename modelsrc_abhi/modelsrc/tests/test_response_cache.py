@@ -0,0 +1,86 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.prompts import ChatPromptTemplate
+
+from response_cache import ResponseCache, model_settings, prompt_key
+
+PROMPT = ChatPromptTemplate.from_messages([("system", "You are Sunny."), ("human", "{query}")])
+SETTINGS = {"type": "groq", "model_name": "llama-3.1-8b-instant", "temperature": 0.7}
+
+
+def key(query, settings=SETTINGS):
+    return prompt_key(PROMPT.invoke({"query": query}), settings)
+
+
+def test_key_depends_on_the_rendered_prompt_and_settings():
+    assert key("hello") == key("hello")
+    assert key("hello") != key("hello ")
+    assert key("hello") != key("hello", {**SETTINGS, "temperature": 0.0})
+    # Same text under a different role is a different prompt
+    swapped = ChatPromptTemplate.from_messages([("human", "You are Sunny."), ("human", "{query}")])
+    assert prompt_key(swapped.invoke({"query": "hello"}), SETTINGS) != key("hello")
+
+
+def test_model_settings_drop_the_stream_flag():
+    llm = SimpleNamespace(_llm_type="groq", _default_params={"model": "m", "temperature": 0.5, "stream": True})
+
+    assert model_settings(llm) == {"type": "groq", "model": "m", "temperature": 0.5}
+
+
+def test_enable_flags():
+    assert not ResponseCache(enabled=False, modes="*").enabled_for("therapist")
+    assert ResponseCache(enabled=True, modes="*").enabled_for("friend", "Funny")
+
+    cache = ResponseCache(enabled=True, modes="therapist, friend:Hype")
+    assert cache.enabled_for("Therapist")
+    assert cache.enabled_for("friend", "hype")
+    assert not cache.enabled_for("friend", "Funny")
+    assert not cache.enabled_for("friend")
+
+
+def test_invoke_generates_once_per_key():
+    cache = ResponseCache(enabled=True)
+    calls = []
+
+    def generate():
+        calls.append(1)
+        return "Hi there!"
+
+    assert cache.invoke(key("hello"), generate) == "Hi there!"
+    assert cache.invoke(key("hello"), generate) == "Hi there!"
+    assert cache.invoke(None, generate) == "Hi there!"
+
+    assert len(calls) == 2
+    assert cache.stats()["hits"] == 1 and cache.stats()["stores"] == 1
+
+
+def test_empty_replies_are_not_stored():
+    cache = ResponseCache(enabled=True)
+    cache.invoke(key("hello"), lambda: "")
+
+    assert cache.get(key("hello")) is None
+
+
+def test_astream_stores_only_completed_replies():
+    cache = ResponseCache(enabled=True)
+
+    async def generate():
+        yield "Hi "
+        yield "there!"
+
+    async def failing():
+        yield "Hi "
+        raise ConnectionError("dropped")
+
+    async def collect(k, gen):
+        return [chunk async for chunk in cache.astream(k, gen)]
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(collect(key("broken"), failing))
+    assert cache.get(key("broken")) is None
+
+    assert asyncio.run(collect(key("hello"), generate)) == ["Hi ", "there!"]
+    # A hit arrives as one chunk
+    assert asyncio.run(collect(key("hello"), generate)) == ["Hi there!"]
@@ -0,0 +1,71 @@
+import math
+from types import SimpleNamespace
+
+import retrieval_cache
+from retrieval_cache import SemanticResultCache
+
+
+def at_angle(degrees):
+    radians = math.radians(degrees)
+    return [math.cos(radians), math.sin(radians)]
+
+
+def test_hit_within_distance_threshold_only():
+    # cosine distance 1 - cos(5deg) ~ 0.0038, 1 - cos(30deg) ~ 0.134
+    cache = SemanticResultCache(max_distance=0.05)
+    cache.put(at_angle(0), ["doc"])
+
+    assert cache.get(at_angle(5)) == ["doc"]
+    assert cache.get([3.0, 0.0]) == ["doc"]  # scale does not matter
+    assert cache.get(at_angle(30)) is None
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (2, 1)
+
+
+def test_nearest_entry_with_matching_key_wins():
+    cache = SemanticResultCache(max_distance=0.05)
+    cache.put(at_angle(0), ["k3"], key=3)
+    cache.put(at_angle(2), ["k5"], key=5)
+
+    assert cache.get(at_angle(1), key=3) == ["k3"]
+    assert cache.get(at_angle(1), key=5) == ["k5"]
+    assert cache.get(at_angle(1), key=10) is None
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = SimpleNamespace(now=100.0)
+    monkeypatch.setattr(retrieval_cache, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    cache = SemanticResultCache(ttl_seconds=10)
+    cache.put(at_angle(0), ["doc"])
+
+    clock.now += 9
+    assert cache.get(at_angle(0)) == ["doc"]
+    clock.now += 2
+    assert cache.get(at_angle(0)) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticResultCache(max_size=2, max_distance=0.01)
+    cache.put(at_angle(0), ["a"])
+    cache.put(at_angle(45), ["b"])
+    cache.get(at_angle(0))
+    cache.put(at_angle(90), ["c"])
+
+    assert cache.get(at_angle(0)) == ["a"]
+    assert cache.get(at_angle(45)) is None
+    assert cache.get(at_angle(90)) == ["c"]
+
+
+def test_invalidate_drops_entries_and_stale_puts():
+    cache = SemanticResultCache()
+    cache.put(at_angle(0), ["old index"])
+    generation = cache.generation  # read before a search ...
+
+    cache.invalidate()  # ... while the index is swapped out
+    cache.put(at_angle(0), ["stale"], generation=generation)
+
+    assert cache.get(at_angle(0)) is None
+    assert cache.stats()["generation"] == generation + 1
+
+    cache.put(at_angle(0), ["new index"], generation=cache.generation)
+    assert cache.get(at_angle(0)) == ["new index"]
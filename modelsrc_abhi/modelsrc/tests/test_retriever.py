@@ -0,0 +1,87 @@
+import asyncio
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from retrieval_cache import SemanticResultCache
+from retriever import TherapistRetriever, distance_to_relevance
+
+DOCS = [Document(page_content=f"doc {i}") for i in range(5)]
+
+
+class FixedEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+    def embed_query(self, text):
+        return [1.0, 0.0]
+
+
+class FakeVectorstore:
+    """Returns DOCS with squared L2 distances 0.0, 0.4, 0.8, ...; records searches."""
+
+    def __init__(self):
+        self.searches = []
+
+    def _hits(self, k):
+        return [(doc, 0.4 * i) for i, doc in enumerate(DOCS[:k])]
+
+    def similarity_search_with_score_by_vector(self, embedding, k):
+        self.searches.append(("similarity", k))
+        return self._hits(k)
+
+    def max_marginal_relevance_search_with_score_by_vector(self, embedding, k, fetch_k, lambda_mult):
+        self.searches.append(("mmr", k, fetch_k))
+        return self._hits(k)
+
+
+def retriever(**kwargs):
+    store = FakeVectorstore()
+    return store, TherapistRetriever(store, FixedEmbeddings(), result_cache=SemanticResultCache(), **kwargs)
+
+
+def test_distance_to_relevance_for_unit_vectors():
+    assert distance_to_relevance(0.0) == 1.0
+    assert distance_to_relevance(2.0) == 0.0
+    assert distance_to_relevance(4.0) == -1.0
+
+
+def test_score_threshold_drops_weak_matches():
+    _, r = retriever(k=5, score_threshold=0.7)
+
+    results = r.search("q")
+    assert [doc.page_content for doc, _ in results] == ["doc 0", "doc 1"]
+    assert [round(score, 2) for _, score in results] == [1.0, 0.8]
+
+    # A per-call threshold overrides the default
+    assert len(r.search("q", score_threshold=0.9)) == 1
+    assert len(r.search("q", score_threshold=-1.0)) == 5
+
+
+def test_one_cache_entry_serves_every_threshold():
+    store, r = retriever(k=3)
+    r.search("q", score_threshold=0.9)
+    r.search("q", score_threshold=0.1)
+
+    assert store.searches == [("similarity", 3)]
+
+
+def test_cache_key_separates_k_and_mmr():
+    store, r = retriever(k=3, fetch_k=10)
+    r.search("q")
+    r.search("q", k=2)
+    r.search("q", use_mmr=True)
+    r.search("q", k=2)
+    r.search("q", use_mmr=True)
+
+    assert store.searches == [("similarity", 3), ("similarity", 2), ("mmr", 3, 10)]
+
+
+def test_asearch_and_format_context():
+    _, r = retriever(k=2)
+    results = asyncio.run(r.asearch("q"))
+    results[1] = (Document(page_content="can't sleep", metadata={"responses": ["Try a routine."]}), 0.5)
+
+    assert TherapistRetriever.format_context(results) == (
+        "doc 0\n\nSituation: can't sleep\nCounsellor: Try a routine."
+    )
@@ -0,0 +1,132 @@
+from types import SimpleNamespace
+
+import pytest
+
+import session_store
+from session_store import InMemorySessionStore, RedisSessionStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedis:
+    """The slice of redis.Redis the store uses; values expire on the given clock."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.data = {}  # key -> (bytes, expires_at or None)
+        self.round_trips = 0
+
+    def _get(self, key):
+        value, expires = self.data.get(key, (None, None))
+        if expires is not None and expires <= self.clock():
+            del self.data[key]
+            return None
+        return value
+
+    def mget(self, keys):
+        self.round_trips += 1
+        return [self._get(key) for key in keys]
+
+    def _set(self, key, value, px=None):
+        self.data[key] = (value.encode(), self.clock() + px / 1000 if px else None)
+
+    def delete(self, key):
+        self.round_trips += 1
+        self.data.pop(key, None)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def set(self, key, value, px=None):
+        self.commands.append((key, value, px))
+
+    def execute(self):
+        self.client.round_trips += 1
+        for key, value, px in self.commands:
+            self.client._set(key, value, px)
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(session_store, "time", SimpleNamespace(monotonic=clock))
+    if request.param == "memory":
+        store = InMemorySessionStore()
+    else:
+        store = RedisSessionStore(client=FakeRedis(clock))
+    store.clock = clock
+    return store
+
+
+def test_get_many_and_set_many_round_trip(store):
+    store.set_many({"a": {"turns": [1]}, "b": {"mood": "calm"}})
+
+    assert store.get_many(["b", "missing", "a"]) == [{"mood": "calm"}, None, {"turns": [1]}]
+    assert store.get("a") == {"turns": [1]}
+    assert store.get_many([]) == []
+
+
+def test_ttl_applies_to_every_key(store):
+    store.set_many({"a": {"n": 1}, "b": {"n": 2}}, ttl=30)
+    store.set("c", {"n": 3})
+
+    store.clock.now += 29
+    assert store.get_many(["a", "b", "c"]) == [{"n": 1}, {"n": 2}, {"n": 3}]
+    store.clock.now += 2
+    assert store.get_many(["a", "b", "c"]) == [None, None, {"n": 3}]
+
+
+def test_values_are_copies(store):
+    value = {"turns": []}
+    store.set("a", value)
+    value["turns"].append("changed")
+    store.get("a")["turns"].append("changed too")
+
+    assert store.get("a") == {"turns": []}
+
+
+def test_delete(store):
+    store.set("a", {"n": 1})
+    store.delete("a")
+    store.delete("never-set")
+
+    assert store.get("a") is None
+
+
+def test_redis_batches_are_one_round_trip_each():
+    client = FakeRedis(FakeClock())
+    store = RedisSessionStore(client=client, prefix="test:")
+
+    store.set_many({"a": {"n": 1}, "b": {"n": 2}, "c": {"n": 3}}, ttl=1.5)
+    assert client.round_trips == 1
+    assert store.get_many(["a", "b", "c"]) == [{"n": 1}, {"n": 2}, {"n": 3}]
+    assert client.round_trips == 2
+
+    assert sorted(client.data) == ["test:a", "test:b", "test:c"]
+    assert client.data["test:a"][1] == pytest.approx(client.clock() + 1.5)
+
+    store.set_many({})
+    store.get_many([])
+    assert client.round_trips == 2
+
+
+def test_memory_store_evicts_least_recently_used():
+    store = InMemorySessionStore(max_entries=2)
+    store.set("a", {"n": 1})
+    store.set("b", {"n": 2})
+    store.get("a")
+    store.set("c", {"n": 3})
+
+    assert store.get_many(["a", "b", "c"]) == [{"n": 1}, None, {"n": 3}]
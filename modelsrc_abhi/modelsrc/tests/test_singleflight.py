@@ -0,0 +1,178 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from singleflight import SharedCallError, SingleFlight
+
+
+class Upstream(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.retry_after = 2.0
+
+
+def _wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def _run_concurrently(flight, key, fn, callers):
+    """Start one leader, then callers - 1 followers; returns (threads, results)."""
+    results = [None] * callers
+
+    def call(i):
+        try:
+            results[i] = flight.do(key, fn)
+        except BaseException as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+    threads[0].start()
+    _wait_for(lambda: flight.stats()["leaders"] == 1)
+    for t in threads[1:]:
+        t.start()
+    _wait_for(lambda: flight.stats()["followers"] == callers - 1)
+    return threads, results
+
+
+def test_do_runs_once_for_concurrent_callers():
+    flight, release, calls = SingleFlight(), threading.Event(), []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return "reply"
+
+    threads, results = _run_concurrently(flight, "k", fn, 4)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert calls == [1]
+    assert results == ["reply"] * 4
+    assert flight.stats() == {"enabled": True, "leaders": 1, "followers": 3, "in_flight": 0}
+
+
+def test_do_gives_each_follower_its_own_error():
+    flight, release = SingleFlight(), threading.Event()
+    original = Upstream(429)
+
+    def fn():
+        release.wait(5)
+        raise original
+
+    threads, results = _run_concurrently(flight, "k", fn, 3)
+    release.set()
+    for t in threads:
+        t.join()
+
+    leader, *followers = results
+    assert leader is original
+    assert followers[0] is not followers[1]
+    for e in followers:
+        assert isinstance(e, SharedCallError)
+        assert e.__cause__ is original
+        assert e.status_code == 429 and e.retry_after == 2.0
+
+
+async def _collect(stream):
+    try:
+        return [chunk async for chunk in stream]
+    except Exception as e:
+        return e
+
+
+def test_stream_shares_one_upstream_and_replays_to_late_joiners():
+    async def main():
+        flight, calls, gate = SingleFlight(), [], asyncio.Event()
+
+        async def factory():
+            calls.append(1)
+            yield "a"
+            await gate.wait()
+            yield "b"
+
+        first = asyncio.create_task(_collect(flight.stream("k", factory)))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(_collect(flight.stream("k", factory)))
+        await asyncio.sleep(0.01)
+        gate.set()
+        return calls, await first, await second
+
+    calls, first, second = asyncio.run(main())
+    assert calls == [1]
+    assert first == second == ["a", "b"]
+
+
+def test_stream_error_is_raised_fresh_to_each_subscriber():
+    original = Upstream(503)
+
+    async def main():
+        flight, gate = SingleFlight(), asyncio.Event()
+
+        async def factory():
+            yield "a"
+            await gate.wait()
+            raise original
+
+        tasks = [asyncio.create_task(_collect(flight.stream("k", factory))) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        gate.set()
+        return await asyncio.gather(*tasks)
+
+    first, second = asyncio.run(main())
+    assert first is not second
+    for e in (first, second):
+        assert isinstance(e, SharedCallError)
+        assert e.__cause__ is original and e.status_code == 503
+        assert "cancelled" not in str(e)
+
+
+def test_cancellation_inside_upstream_is_reported_as_failure():
+    async def main():
+        flight = SingleFlight()
+
+        async def factory():
+            yield "a"
+            raise asyncio.CancelledError()
+
+        return await _collect(flight.stream("k", factory))
+
+    e = asyncio.run(main())
+    assert isinstance(e, SharedCallError)
+    assert "cancelled" not in str(e)
+    assert isinstance(e.__cause__, asyncio.CancelledError)
+
+
+def test_last_subscriber_leaving_cancels_upstream():
+    async def main():
+        flight, cancelled = SingleFlight(), asyncio.Event()
+
+        async def factory():
+            try:
+                yield "a"
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        stream = flight.stream("k", factory)
+        assert await stream.__anext__() == "a"
+        await stream.aclose()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        return flight.stats()["in_flight"]
+
+    assert asyncio.run(main()) == 0
+
+
+def test_disabled_runs_every_call():
+    flight, calls = SingleFlight(enabled=False), []
+    for _ in range(3):
+        flight.do("k", lambda: calls.append(1))
+    assert len(calls) == 3
+    with pytest.raises(ValueError):
+        flight.do(None, lambda: int("x"))
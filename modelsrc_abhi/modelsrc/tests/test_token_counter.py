@@ -0,0 +1,65 @@
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
+
+import token_counter
+from token_counter import count_message_tokens, count_tokens, log_prompt_size
+
+
+@pytest.fixture
+def heuristic(monkeypatch):
+    monkeypatch.setattr(token_counter, "_ENCODING", None)
+
+
+def test_character_estimate_without_tiktoken(heuristic):
+    assert count_tokens("") == 0
+    assert count_tokens("a") == 1
+    assert count_tokens("abcd") == 1
+    assert count_tokens("abcde") == 2
+
+
+def test_tiktoken_counts_when_installed():
+    if token_counter._ENCODING is None:
+        pytest.skip("tiktoken not installed")
+    assert count_tokens("hello world") == 2
+    # Special-token text is counted as plain text, not rejected
+    assert count_tokens("<|endoftext|>") > 1
+
+
+def test_message_tokens_add_framing_overhead(heuristic):
+    messages = [SystemMessage(content="abcd" * 10), HumanMessage(content="abcd")]
+
+    assert count_message_tokens(messages) == 10 + 4 + 1 + 4
+    assert count_message_tokens([]) == 0
+
+
+def test_log_prompt_size_splits_static_and_per_turn(heuristic, caplog):
+    prompt = ChatPromptTemplate.from_messages([("system", "abcd" * 10), ("human", "{query}")])
+
+    with caplog.at_level("INFO", logger="token_counter"):
+        total = log_prompt_size("Sunny", prompt.invoke({"query": "abcd" * 3}))
+
+    assert total == 14 + 7
+    assert "Sunny prompt: 21 tokens (14 static system, 7 per-turn)" in caplog.text
+
+
+def test_therapist_system_prefix_is_identical_across_turns():
+    therapist = pytest.importorskip("multimodel_therapist")
+    turns = [
+        {"context": "", "history": "", "parameters": "mood=calm", "query": "hi"},
+        {
+            "context": "Situation: can't sleep\nCounsellor: Try a routine.",
+            "history": "User: hi\nSunny: Hello!",
+            "parameters": therapist.format_parameters({"stress": 0.71234, "mood": "sad"}),
+            "query": "I still can't sleep",
+        },
+    ]
+
+    rendered = [therapist.prompt.invoke(turn).to_messages() for turn in turns]
+
+    first, second = ([m.type for m in messages] for messages in rendered)
+    assert first == second == ["system", "human"]
+    # Byte-identical system message: nothing per-turn may leak into the cached prefix
+    assert rendered[0][0].content.encode() == rendered[1][0].content.encode()
+    assert "{" not in rendered[0][0].content
+    assert "stress=0.71, mood=sad" in rendered[1][1].content
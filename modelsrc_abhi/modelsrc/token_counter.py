@@ -0,0 +1,41 @@
+"""Prompt token counting.
+
+Uses tiktoken's cl100k_base encoding when installed (within a few percent of the
+Llama 3 tokenizer on English chat text) and a 4-characters-per-token estimate
+otherwise, so counting never adds a hard dependency.
+"""
+
+import logging
+from typing import Iterable
+
+try:
+    import tiktoken
+
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # not installed, or the encoding file cannot be fetched
+    _ENCODING = None
+
+logger = logging.getLogger("token_counter")
+
+
+def count_tokens(text: str) -> int:
+    """Approximate number of LLM tokens in `text`."""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def count_message_tokens(messages: Iterable) -> int:
+    """Tokens across chat messages, plus a small per-message framing overhead."""
+    return sum(count_tokens(message.content) + 4 for message in messages)
+
+
+def log_prompt_size(persona: str, prompt_value) -> int:
+    """Log and return the size of a rendered prompt (PromptValue)."""
+    messages = prompt_value.to_messages()
+    total = count_message_tokens(messages)
+    system = count_message_tokens(m for m in messages if m.type == "system")
+    logger.info("%s prompt: %d tokens (%d static system, %d per-turn)", persona, total, system, total - system)
+    return total